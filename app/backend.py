@@ -1,31 +1,90 @@
 import aerich
 from sanic import Request, Sanic
+from sanic.response import JSONResponse
 from sanic_ext import Extend
 from sanic_jwt import initialize, inject_user
 from .routes import routes
+from functools import partial
+from tortoise import Tortoise, connections
 from tortoise.contrib.sanic import register_tortoise
 
-from app.db.Aerich import TORTOISE_ORM
+from app.db.Aerich import MIGRATIONS, TORTOISE_ORM
 from app.utils.config import load_config, setup, create_owner
 from app.utils.auth import Logout, authenticate, retrieve_user, Register
+from app.utils.decorators import is_read_only_route
 from app.utils.tools import process_match
+from app.utils.scheduler import EventStateScheduler
+from app.utils import settings
+from app.db.write_queue import WriteQueue
+from app.db.message_buffer import MessageBuffer
+from app.utils.avatars import AvatarProcessor
+from app.utils.chat import ChatHub
+from app.utils.cache import principal_cache
+from app.utils.pubsub import LocalPubSub, SocketPubSub, in_first_worker, in_worker_process, run_broker
+from app.db.shards import group_for_params, shard_router, sharding_enabled, use_shard
+from app.utils.identity_map import IdentityMap, current_identity_map
+from app.utils.serialization import JSON, MSGPACK, dumps, loads, packb
 
 setup()
-app = Sanic("SquadCircle")
+app = Sanic("SquadCircle", dumps=dumps, loads=loads)
 config = load_config()
 app.ctx.Config = config
-app.ctx.connected_users = {}
+app.ctx.chat = ChatHub()
 app.config.CORS_ORIGINS = f"http://{config['App']['URI']}"
 app.config.CORS_SUPPORTS_CREDENTIALS = True
+app.config.CORS_EXPOSE_HEADERS = ["X-Next-After", "X-Next-Before"]
 app.config.OAS = False
 
+@routes.middleware("request")
+async def select_shard(request: Request):
+    group_id = group_for_params(request.match_info) if sharding_enabled() else None
+    if group_id is not None:
+        request.ctx.shard_token = await use_shard(group_id)
+
+@routes.middleware("request")
+async def open_read_snapshot(request: Request):
+    connection = connections.get("default")
+    if is_read_only_route(request) and getattr(connection, "readers", 0):
+        request.ctx.read_snapshot = connection.read_snapshot(strict=request.app.debug)
+        request.ctx.read_snapshot_token = connections.set("default", request.ctx.read_snapshot)
+
 @routes.middleware("request")
 @inject_user()
 async def example(request: Request, user):
-    request.match_info = await process_match(request.match_info)
+    request.ctx.identity_map = IdentityMap(request.route.name, debug=request.app.config.get("IDENTITY_MAP_DEBUG", False))
+    current_identity_map.set(request.ctx.identity_map)
+    if user:
+        request.ctx.identity_map.add(user)
+    request.match_info = await process_match(request.match_info, lazy=getattr(request.route.handler, "__lazy_models__", False))
     request.match_info["my_user"] = user
     pass
 
+@routes.middleware("response")
+async def leave_shard(request: Request, response):
+    # Response middleware runs in reverse, this one last.
+    if getattr(request.ctx, "shard_token", None) is not None:
+        connections.reset(request.ctx.shard_token)
+
+@routes.middleware("response")
+async def report_identity_map(request: Request, response):
+    if hasattr(request.ctx, "identity_map"):
+        request.ctx.identity_map.report()
+
+@routes.middleware("response")
+async def release_read_snapshot(request: Request, response):
+    if hasattr(request.ctx, "read_snapshot"):
+        connections.reset(request.ctx.read_snapshot_token)
+        await request.ctx.read_snapshot.release()
+
+@routes.middleware("response")
+async def negotiate_encoding(request: Request, response):
+    # JSON by default, the same body as MessagePack for clients preferring it.
+    if isinstance(response, JSONResponse):
+        response.headers.add("vary", "Accept")
+        if request.accept.match(JSON, MSGPACK).mime == MSGPACK:
+            response.body = packb(response.raw_body)
+            response.content_type = MSGPACK
+
 app.blueprint(routes)
 
 Extend(app)
@@ -40,16 +99,60 @@ initialize(app, authenticate=authenticate, secret=config["Statik"]["secret"], co
 register_tortoise(app, config=TORTOISE_ORM, generate_schemas=False)
 
 
-@app.listener("before_server_start")
-async def before_server_start(app: Sanic, loop):
+async def upgrade_database():
     Command = aerich.Command(
-        tortoise_config=TORTOISE_ORM, app="models", location="./app/db/migrations"
+        tortoise_config=TORTOISE_ORM, app="models", location=MIGRATIONS
     )
     await Command.init()
     await Command.upgrade()
     await create_owner()
 
 
+# Only with workers > 1: migrate once before the workers start instead of in each of them,
+# and run the broker that carries chat messages and cache invalidations between them.
+@app.listener("main_process_start")
+async def prepare_database(app: Sanic, loop):
+    await upgrade_database()
+    await Tortoise.close_connections()
+
+
+@app.listener("main_process_ready")
+async def start_pubsub_broker(app: Sanic, loop):
+    app.manager.manage("PubSubBroker", run_broker, {})
+
+
+@app.listener("before_server_start")
+async def before_server_start(app: Sanic, loop):
+    if not in_worker_process():
+        await upgrade_database()
+    app.ctx.pubsub = SocketPubSub() if in_worker_process() else LocalPubSub()
+    await app.ctx.pubsub.start()
+    app.ctx.pubsub.subscribe("chat", lambda message: app.ctx.chat.broadcast(*message))
+    app.ctx.pubsub.subscribe("principal", principal_cache.forget)
+    principal_cache.publish = partial(app.ctx.pubsub.publish, "principal")
+    if sharding_enabled():
+        shard_router.start(connections.get("default"))
+    app.ctx.event_scheduler = EventStateScheduler()
+    app.ctx.event_scheduler.publish = partial(app.ctx.pubsub.publish, "event_scheduler")
+    if in_first_worker():
+        app.ctx.pubsub.subscribe("event_scheduler", app.ctx.event_scheduler.mark_dirty)
+        await app.ctx.event_scheduler.start()
+    app.ctx.write_queue = WriteQueue() if settings.WRITE_QUEUE_ENABLED else None
+    if app.ctx.write_queue:
+        await app.ctx.write_queue.start()
+    app.ctx.avatar_processor = AvatarProcessor()
+    app.ctx.avatar_processor.start()
+    app.ctx.message_buffer = MessageBuffer()
+    await app.ctx.message_buffer.start()
+
+
 @app.listener("before_server_stop")
 async def notify_server_stopping(app, loop):
-    pass
\ No newline at end of file
+    await app.ctx.event_scheduler.stop()
+    if app.ctx.write_queue:
+        await app.ctx.write_queue.stop()
+    # Before the shards close, the buffered chat messages may be headed for them.
+    await app.ctx.message_buffer.stop()
+    await shard_router.close()
+    await app.ctx.avatar_processor.stop()
+    await app.ctx.pubsub.stop()
\ No newline at end of file
@@ -0,0 +1,100 @@
+from typing import Sequence
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+class SqliteDialect:
+    """SQL fragments for the hand-written queries that differ between the backends.
+
+    Dates, times and datetimes come back as text in SQLite. The *_text() helpers
+    make the other backends return the same text, so the rows can be passed on as
+    they are."""
+
+    name = "sqlite"
+
+    def now(self, offset: str|None = None) -> str:
+        return f"DATETIME('now', '{offset}')" if offset else "DATETIME('now')"
+
+    def today(self) -> str:
+        return "DATE('now')"
+
+    def start_of_month(self, offset: str|None = None) -> str:
+        return f"DATE('now', 'start of month', '{offset}')" if offset else "DATE('now', 'start of month')"
+
+    def shift(self, expression: str, offset: str) -> str:
+        return f"DATETIME({expression}, '{offset}')"
+
+    def combine(self, date: str, time: str) -> str:
+        return f"DATETIME({date} || ' ' || {time})"
+
+    def datetime_text(self, expression: str) -> str:
+        return expression
+
+    def date_text(self, expression: str) -> str:
+        return expression
+
+    def time_text(self, expression: str) -> str:
+        return expression
+
+    def reset_sequence(self, table: str) -> str|None:
+        # SQLite's AUTOINCREMENT already continues after explicitly inserted ids.
+        return None
+
+    async def reserve_ids(self, connection: BaseDBAsyncClient, table: str, count: int) -> Sequence[int]:
+        """count ids of table no insert will use, for rows inserted with an explicit id later."""
+        async with connection._in_transaction() as transaction:
+            # sqlite_sequence only has a row for the table after its first insert.
+            await transaction.execute_query(
+                f"""INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', COALESCE(MAX("id"), 0) FROM "{table}" """
+                f"""WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')"""
+            )
+            _, rows = await transaction.execute_query(f"UPDATE sqlite_sequence SET seq = seq + {count} WHERE name = '{table}' RETURNING seq")
+        return range(rows[0][0] - count + 1, rows[0][0] + 1)
+
+
+class PostgresDialect(SqliteDialect):
+    # Sessions run in UTC, see TORTOISE_ORM.
+    name = "postgres"
+
+    def now(self, offset: str|None = None) -> str:
+        return f"(NOW() + INTERVAL '{offset}')" if offset else "NOW()"
+
+    def today(self) -> str:
+        return "CURRENT_DATE"
+
+    def start_of_month(self, offset: str|None = None) -> str:
+        start = "DATE_TRUNC('month', CURRENT_DATE)"
+        return f"({start} + INTERVAL '{offset}')::date" if offset else f"{start}::date"
+
+    def shift(self, expression: str, offset: str) -> str:
+        return f"({expression} + INTERVAL '{offset}')"
+
+    def combine(self, date: str, time: str) -> str:
+        return f"({date} + {time})"
+
+    def datetime_text(self, expression: str) -> str:
+        # The format Tortoise stores datetimes in on SQLite.
+        return f"""TO_CHAR({expression} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US"+00:00"')"""
+
+    def date_text(self, expression: str) -> str:
+        return f"TO_CHAR({expression}, 'YYYY-MM-DD')"
+
+    def time_text(self, expression: str) -> str:
+        return f"""TO_CHAR({expression}::time, 'HH24:MI:SS"+00:00"')"""
+
+    def reset_sequence(self, table: str) -> str|None:
+        return f"""SELECT SETVAL(PG_GET_SERIAL_SEQUENCE('"{table}"', 'id'), (SELECT MAX("id") FROM "{table}"))"""
+
+    async def reserve_ids(self, connection: BaseDBAsyncClient, table: str, count: int) -> Sequence[int]:
+        # Not necessarily consecutive while other sessions take ids as well.
+        _, rows = await connection.execute_query(f"""SELECT NEXTVAL(PG_GET_SERIAL_SEQUENCE('"{table}"', 'id')) FROM GENERATE_SERIES(1, {count})""")
+        return [row[0] for row in rows]
+
+
+DIALECTS = {
+    "sqlite": SqliteDialect(),
+    "postgres": PostgresDialect(),
+}
+
+
+def get_dialect(connection: BaseDBAsyncClient) -> SqliteDialect:
+    return DIALECTS[connection.capabilities.dialect]
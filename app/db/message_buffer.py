@@ -0,0 +1,166 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List
+from sanic.log import logger
+from tortoise import connections, timezone
+from tortoise.backends.base.client import BaseDBAsyncClient
+from app.db.dialect import get_dialect
+from app.db.models import Event, Message, UserAndGroup
+from app.utils import settings
+
+
+class MessageBuffer:
+    """Write-behind for chat messages.
+
+    add() returns the Message with its id and sent_at already set, so it can be
+    broadcast before it is written. Ids come from blocks of id_block reserved in the
+    database, which keeps them unique across workers. The buffered messages are
+    inserted in one batch per database every interval seconds, or as soon as
+    flush_size are waiting. stop() writes whatever is still buffered.
+
+    A message shows up in the history once it is flushed. A failed batch is retried
+    one message at a time, messages that fail again are put back into the buffer and
+    written with one of the next batches. After write_attempts they are logged with
+    their content and dropped, they have been broadcast already."""
+
+    def __init__(self, interval: float = settings.MESSAGE_FLUSH_INTERVAL, flush_size: int = settings.MESSAGE_FLUSH_SIZE, max_size: int = settings.MESSAGE_BUFFER_SIZE, id_block: int = settings.MESSAGE_ID_BLOCK, write_attempts: int = settings.MESSAGE_WRITE_ATTEMPTS, connection_name: str = "default"):
+        self.interval = interval
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self.id_block = id_block
+        self.write_attempts = write_attempts
+        self.connection_name = connection_name
+        self.size = 0
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.max_seen_size = 0
+        self._pending: Dict[BaseDBAsyncClient, List[Message]] = {}
+        self._ids: Dict[BaseDBAsyncClient, Deque[int]] = {}
+        # Failed writes so far of the messages that were put back, by message id.
+        self._attempts: Dict[int, int] = {}
+        self._id_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._waiting = asyncio.Event()
+        self._full = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task|None = None
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._stopping = True
+            self._waiting.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        # Until the messages put back have been written or dropped.
+        while self.size:
+            await self.flush()
+
+    async def add(self, event: Event, user_and_group: UserAndGroup, content: str) -> Message:
+        if self.size >= self.max_size:
+            # The database doesn't keep up, hold the sender back instead of buffering without bound.
+            await self.flush()
+        # The shard of the event's group when sharding is enabled.
+        client = connections.get(self.connection_name)
+        message = Message(
+            id=await self._next_id(client),
+            content=content,
+            sent_at=timezone.now(),
+            event_id=event.id,
+            group_id=event.group_id,
+            user_and_group=user_and_group,
+        )
+        self._pending.setdefault(client, []).append(message)
+        self.size += 1
+        self.max_seen_size = max(self.max_seen_size, self.size)
+        if self._task is None:
+            # Not started or already stopped, nothing would flush it later.
+            await self.flush()
+            return message
+        self._waiting.set()
+        if self.size >= self.flush_size:
+            self._full.set()
+        return message
+
+    async def flush(self):
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self.size = 0
+            self._waiting.clear()
+            self._full.clear()
+            for client, messages in pending.items():
+                await self._write(client, messages)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "max_size": self.max_seen_size,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "retried": self.retried,
+            "mean_batch_size": round(self.written / self.flushes, 2) if self.flushes else 0,
+        }
+
+    async def _run(self):
+        while not self._stopping:
+            await self._waiting.wait()
+            # Give the batch up to interval to fill.
+            if self.size < self.flush_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing chat messages failed")
+
+    async def _next_id(self, client: BaseDBAsyncClient) -> int:
+        ids = self._ids.get(client)
+        if not ids:
+            async with self._id_lock:
+                ids = self._ids.get(client)
+                if not ids:
+                    ids = self._ids[client] = deque(await get_dialect(client).reserve_ids(client, Message._meta.db_table, self.id_block))
+        return ids.popleft()
+
+    async def _write(self, client: BaseDBAsyncClient, messages: List[Message]):
+        self.flushes += 1
+        try:
+            await Message.bulk_create(messages, batch_size=self.flush_size, using_db=client)
+            self.written += len(messages)
+            for message in messages:
+                self._attempts.pop(message.id, None)
+        except Exception:
+            logger.exception("Writing %d chat messages failed, writing them one by one", len(messages))
+            for message in messages:
+                try:
+                    await Message.bulk_create([message], using_db=client)
+                    self.written += 1
+                    self._attempts.pop(message.id, None)
+                except Exception:
+                    self._failed(client, message)
+
+    def _failed(self, client: BaseDBAsyncClient, message: Message):
+        attempts = self._attempts.pop(message.id, 0) + 1
+        if attempts < self.write_attempts:
+            logger.warning("Writing chat message %s of event %s failed, trying again with the next batch", message.id, message.event_id, exc_info=True)
+            self._attempts[message.id] = attempts
+            self._pending.setdefault(client, []).append(message)
+            self.size += 1
+            self.retried += 1
+            self._waiting.set()
+            return
+        self.failed += 1
+        logger.error(
+            "Lost chat message %s of event %s, group %s, user_and_group %s, sent at %s: %r",
+            message.id, message.event_id, message.group_id, message.user_and_group_id, message.sent_at.isoformat(), message.content,
+            exc_info=True,
+        )
@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "user_and_groups" ADD "permissions" INT NOT NULL  DEFAULT 0;
+UPDATE "user_and_groups" SET "permissions" = (
+    SELECT COALESCE(SUM(1 << "user_group_permissions"."permission"), 0)
+    FROM "user_group_permissions"
+    WHERE "user_group_permissions"."user_and_group_id" = "user_and_groups"."id"
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "user_and_groups" DROP COLUMN "permissions";"""
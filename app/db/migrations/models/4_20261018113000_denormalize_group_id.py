@@ -0,0 +1,39 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "user_group_permissions" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "user_group_permissions" SET "group_id" = (SELECT "group_id" FROM "user_and_groups" WHERE "user_and_groups"."id" = "user_group_permissions"."user_and_group_id");
+CREATE INDEX "idx_user_group_group_id" ON "user_group_permissions" ("group_id");
+ALTER TABLE "event_options" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "event_options" SET "group_id" = (SELECT "group_id" FROM "events" WHERE "events"."id" = "event_options"."event_id");
+CREATE INDEX "idx_event_optio_group_id" ON "event_options" ("group_id");
+ALTER TABLE "user_event_option_responses" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "user_event_option_responses" SET "group_id" = (SELECT "group_id" FROM "user_and_groups" WHERE "user_and_groups"."id" = "user_event_option_responses"."user_and_group_id");
+CREATE INDEX "idx_user_event__group_id" ON "user_event_option_responses" ("group_id");
+ALTER TABLE "vote_options" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "vote_options" SET "group_id" = (SELECT "group_id" FROM "votes" WHERE "votes"."id" = "vote_options"."vote_id");
+CREATE INDEX "idx_vote_option_group_id" ON "vote_options" ("group_id");
+ALTER TABLE "user_vote_option_responses" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "user_vote_option_responses" SET "group_id" = (SELECT "group_id" FROM "user_and_groups" WHERE "user_and_groups"."id" = "user_vote_option_responses"."user_and_group_id");
+CREATE INDEX "idx_user_vote_o_group_id" ON "user_vote_option_responses" ("group_id");
+ALTER TABLE "messages" ADD "group_id" INT NOT NULL  DEFAULT 0;
+UPDATE "messages" SET "group_id" = (SELECT "group_id" FROM "events" WHERE "events"."id" = "messages"."event_id");
+CREATE INDEX "idx_messages_group_id" ON "messages" ("group_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_messages_group_id";
+ALTER TABLE "messages" DROP COLUMN "group_id";
+DROP INDEX IF EXISTS "idx_user_vote_o_group_id";
+ALTER TABLE "user_vote_option_responses" DROP COLUMN "group_id";
+DROP INDEX IF EXISTS "idx_vote_option_group_id";
+ALTER TABLE "vote_options" DROP COLUMN "group_id";
+DROP INDEX IF EXISTS "idx_user_event__group_id";
+ALTER TABLE "user_event_option_responses" DROP COLUMN "group_id";
+DROP INDEX IF EXISTS "idx_event_optio_group_id";
+ALTER TABLE "event_options" DROP COLUMN "group_id";
+DROP INDEX IF EXISTS "idx_user_group_group_id";
+ALTER TABLE "user_group_permissions" DROP COLUMN "group_id";"""
@@ -0,0 +1,64 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "event_options" ADD "accepted_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "event_options" ADD "denied_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "vote_options" ADD "response_count" INT NOT NULL  DEFAULT 0;
+UPDATE "event_options" SET
+    "accepted_count" = (SELECT COUNT(*) FROM "user_event_option_responses" WHERE "event_option_id" = "event_options"."id" AND "response" = 1),
+    "denied_count" = (SELECT COUNT(*) FROM "user_event_option_responses" WHERE "event_option_id" = "event_options"."id" AND "response" = 2);
+UPDATE "vote_options" SET
+    "response_count" = (SELECT COUNT(*) FROM "user_vote_option_responses" WHERE "vote_option_id" = "vote_options"."id");
+CREATE TRIGGER "trg_user_event_option_responses_insert" AFTER INSERT ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" + (NEW."response" = 1),
+        "denied_count" = "denied_count" + (NEW."response" = 2)
+    WHERE "id" = NEW."event_option_id";
+END;
+CREATE TRIGGER "trg_user_event_option_responses_delete" AFTER DELETE ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" - (OLD."response" = 1),
+        "denied_count" = "denied_count" - (OLD."response" = 2)
+    WHERE "id" = OLD."event_option_id";
+END;
+CREATE TRIGGER "trg_user_event_option_responses_update" AFTER UPDATE OF "response", "event_option_id" ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" - (OLD."response" = 1),
+        "denied_count" = "denied_count" - (OLD."response" = 2)
+    WHERE "id" = OLD."event_option_id";
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" + (NEW."response" = 1),
+        "denied_count" = "denied_count" + (NEW."response" = 2)
+    WHERE "id" = NEW."event_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_insert" AFTER INSERT ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" + 1 WHERE "id" = NEW."vote_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_delete" AFTER DELETE ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" - 1 WHERE "id" = OLD."vote_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_update" AFTER UPDATE OF "vote_option_id" ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" - 1 WHERE "id" = OLD."vote_option_id";
+    UPDATE "vote_options" SET "response_count" = "response_count" + 1 WHERE "id" = NEW."vote_option_id";
+END;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TRIGGER IF EXISTS "trg_user_vote_option_responses_update";
+DROP TRIGGER IF EXISTS "trg_user_vote_option_responses_delete";
+DROP TRIGGER IF EXISTS "trg_user_vote_option_responses_insert";
+DROP TRIGGER IF EXISTS "trg_user_event_option_responses_update";
+DROP TRIGGER IF EXISTS "trg_user_event_option_responses_delete";
+DROP TRIGGER IF EXISTS "trg_user_event_option_responses_insert";
+ALTER TABLE "vote_options" DROP COLUMN "response_count";
+ALTER TABLE "event_options" DROP COLUMN "denied_count";
+ALTER TABLE "event_options" DROP COLUMN "accepted_count";"""
@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX "idx_events_group_i_f85260" ON "events" ("group_id", "state");
+CREATE INDEX "idx_event_optio_event_i_2e874b" ON "event_options" ("event_id", "date");
+CREATE INDEX "idx_votes_group_i_fc7a71" ON "votes" ("group_id", "created");
+CREATE INDEX "idx_vote_option_vote_id_2efdc9" ON "vote_options" ("vote_id");
+CREATE INDEX "idx_user_vote_o_user_an_3e0514" ON "user_vote_option_responses" ("user_and_group_id");
+CREATE INDEX "idx_messages_event_i_d2a639" ON "messages" ("event_id", "sent_at");
+ANALYZE;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_messages_event_i_d2a639";
+DROP INDEX IF EXISTS "idx_user_vote_o_user_an_3e0514";
+DROP INDEX IF EXISTS "idx_vote_option_vote_id_2efdc9";
+DROP INDEX IF EXISTS "idx_votes_group_i_fc7a71";
+DROP INDEX IF EXISTS "idx_event_optio_event_i_2e874b";
+DROP INDEX IF EXISTS "idx_events_group_i_f85260";"""
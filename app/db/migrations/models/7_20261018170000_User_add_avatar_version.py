@@ -0,0 +1,29 @@
+import hashlib
+import os
+from tortoise import BaseDBAsyncClient
+
+# Copied from the code of this release, so later changes to it don't change the migration.
+USERS = "./resources/users"
+
+
+def content_version(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # Avatars uploaded so far only exist on disk, read the one of every user once here.
+    updates = []
+    _, rows = await db.execute_query('SELECT "id" FROM "users"')
+    for (user_id,) in rows:
+        avatar_path = f"{USERS}/{int(user_id)}/avatar.webp"
+        if os.path.isfile(avatar_path):
+            with open(avatar_path, "rb") as avatar:
+                updates.append(f"""UPDATE "users" SET "avatar_version" = '{content_version(avatar.read())}' WHERE "id" = {int(user_id)};""")
+    return """
+        ALTER TABLE "users" ADD "avatar_version" VARCHAR(16);
+""" + "\n".join(updates)
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "users" DROP COLUMN "avatar_version";"""
@@ -0,0 +1,13 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_messages_event_i_d2a639";
+CREATE INDEX "idx_messages_event_i_2d9f5b" ON "messages" ("event_id", "sent_at", "id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_messages_event_i_2d9f5b";
+CREATE INDEX "idx_messages_event_i_d2a639" ON "messages" ("event_id", "sent_at");"""
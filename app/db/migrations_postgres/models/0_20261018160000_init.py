@@ -0,0 +1,154 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "groups" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "name" VARCHAR(32) NOT NULL UNIQUE,
+    "description" TEXT,
+    "discord_webhook" VARCHAR(130)
+);
+CREATE TABLE IF NOT EXISTS "events" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "title" VARCHAR(100) NOT NULL,
+    "color" VARCHAR(6) NOT NULL,
+    "vote_end_date" TIMESTAMPTZ,
+    "created" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "description" TEXT,
+    "state" SMALLINT NOT NULL  DEFAULT 1,
+    "choosen_event_option_id" INT,
+    "group_id" INT NOT NULL REFERENCES "groups" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_events_group_i_f85260" ON "events" ("group_id", "state");
+COMMENT ON COLUMN "events"."state" IS 'VOTING: 0\nOPEN: 1\nACTIVE: 2\nCLOSED: 3\nARCHIVED: 4';
+CREATE TABLE IF NOT EXISTS "event_options" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "date" DATE NOT NULL,
+    "start_time" TIMETZ NOT NULL,
+    "end_time" TIMETZ,
+    "group_id" INT NOT NULL,
+    "accepted_count" INT NOT NULL  DEFAULT 0,
+    "denied_count" INT NOT NULL  DEFAULT 0,
+    "event_id" INT NOT NULL REFERENCES "events" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_event_optio_group_i_6c7203" ON "event_options" ("group_id");
+CREATE INDEX IF NOT EXISTS "idx_event_optio_event_i_2e874b" ON "event_options" ("event_id", "date");
+CREATE TABLE IF NOT EXISTS "invites" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "code" VARCHAR(16) NOT NULL UNIQUE,
+    "expiration_date" DATE NOT NULL,
+    "group_id" INT NOT NULL REFERENCES "groups" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "users" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "name" VARCHAR(32) NOT NULL UNIQUE,
+    "password" VARCHAR(100) NOT NULL,
+    "owner" BOOL NOT NULL  DEFAULT False
+);
+CREATE TABLE IF NOT EXISTS "user_and_groups" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "permissions" INT NOT NULL  DEFAULT 0,
+    "group_id" INT NOT NULL REFERENCES "groups" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_user_and_gr_user_id_709cc4" UNIQUE ("user_id", "group_id")
+);
+CREATE TABLE IF NOT EXISTS "messages" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "content" TEXT NOT NULL,
+    "sent_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "group_id" INT NOT NULL,
+    "event_id" INT NOT NULL REFERENCES "events" ("id") ON DELETE CASCADE,
+    "user_and_group_id" INT NOT NULL REFERENCES "user_and_groups" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_messages_group_i_28dabf" ON "messages" ("group_id");
+CREATE INDEX IF NOT EXISTS "idx_messages_event_i_d2a639" ON "messages" ("event_id", "sent_at");
+CREATE TABLE IF NOT EXISTS "user_event_option_responses" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "response" SMALLINT NOT NULL,
+    "reason" TEXT,
+    "group_id" INT NOT NULL,
+    "event_option_id" INT NOT NULL REFERENCES "event_options" ("id") ON DELETE CASCADE,
+    "user_and_group_id" INT NOT NULL REFERENCES "user_and_groups" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_user_event__event_o_e54e67" UNIQUE ("event_option_id", "user_and_group_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_user_event__group_i_1a800c" ON "user_event_option_responses" ("group_id");
+COMMENT ON COLUMN "user_event_option_responses"."response" IS 'ACCEPTED: 1\nDENIED: 2';
+CREATE TABLE IF NOT EXISTS "user_group_permissions" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "permission" SMALLINT NOT NULL,
+    "group_id" INT NOT NULL,
+    "user_and_group_id" INT NOT NULL REFERENCES "user_and_groups" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_user_group__user_an_e968f9" UNIQUE ("user_and_group_id", "permission")
+);
+CREATE INDEX IF NOT EXISTS "idx_user_group__group_i_2353c7" ON "user_group_permissions" ("group_id");
+COMMENT ON COLUMN "user_group_permissions"."permission" IS 'ADMIN: 1\nMANAGE_USERS: 2\nMANAGE_INVITES: 3\nMANAGE_EVENTS: 4\nMANAGE_VOTES: 5';
+CREATE TABLE IF NOT EXISTS "votes" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "title" VARCHAR(100) NOT NULL,
+    "created" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "multi_select" BOOL NOT NULL  DEFAULT True,
+    "group_id" INT NOT NULL REFERENCES "groups" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_votes_group_i_fc7a71" ON "votes" ("group_id", "created");
+CREATE TABLE IF NOT EXISTS "vote_options" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "title" VARCHAR(100) NOT NULL,
+    "group_id" INT NOT NULL,
+    "response_count" INT NOT NULL  DEFAULT 0,
+    "vote_id" INT NOT NULL REFERENCES "votes" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_vote_option_group_i_ff0232" ON "vote_options" ("group_id");
+CREATE INDEX IF NOT EXISTS "idx_vote_option_vote_id_2efdc9" ON "vote_options" ("vote_id");
+CREATE TABLE IF NOT EXISTS "user_vote_option_responses" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "group_id" INT NOT NULL,
+    "user_and_group_id" INT NOT NULL REFERENCES "user_and_groups" ("id") ON DELETE CASCADE,
+    "vote_option_id" INT NOT NULL REFERENCES "vote_options" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_user_vote_o_vote_op_8bfd8e" UNIQUE ("vote_option_id", "user_and_group_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_user_vote_o_group_i_cdd11d" ON "user_vote_option_responses" ("group_id");
+CREATE INDEX IF NOT EXISTS "idx_user_vote_o_user_an_3e0514" ON "user_vote_option_responses" ("user_and_group_id");
+CREATE TABLE IF NOT EXISTS "aerich" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "version" VARCHAR(255) NOT NULL,
+    "app" VARCHAR(100) NOT NULL,
+    "content" JSONB NOT NULL
+);
+CREATE OR REPLACE FUNCTION "user_event_option_responses_tally"() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "event_options" SET
+            "accepted_count" = "accepted_count" - (OLD."response" = 1)::INT,
+            "denied_count" = "denied_count" - (OLD."response" = 2)::INT
+        WHERE "id" = OLD."event_option_id";
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "event_options" SET
+            "accepted_count" = "accepted_count" + (NEW."response" = 1)::INT,
+            "denied_count" = "denied_count" + (NEW."response" = 2)::INT
+        WHERE "id" = NEW."event_option_id";
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "trg_user_event_option_responses" AFTER INSERT OR DELETE OR UPDATE OF "response", "event_option_id" ON "user_event_option_responses"
+FOR EACH ROW EXECUTE FUNCTION "user_event_option_responses_tally"();
+CREATE OR REPLACE FUNCTION "user_vote_option_responses_tally"() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "vote_options" SET "response_count" = "response_count" - 1 WHERE "id" = OLD."vote_option_id";
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "vote_options" SET "response_count" = "response_count" + 1 WHERE "id" = NEW."vote_option_id";
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "trg_user_vote_option_responses" AFTER INSERT OR DELETE OR UPDATE OF "vote_option_id" ON "user_vote_option_responses"
+FOR EACH ROW EXECUTE FUNCTION "user_vote_option_responses_tally"();"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        """
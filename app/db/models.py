@@ -1,22 +1,78 @@
 import hashlib
-from datetime import date
-import os
-from typing import Dict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Tuple
 from discord import Embed
 from tortoise import fields
 from tortoise import connections
+from tortoise.expressions import Q, RawSQL
 from tortoise.models import Model
+from tortoise.signals import pre_save
 from tortoise.transactions import atomic
+from app.db.dialect import get_dialect
+from app.utils.dataloader import get_loader
 from app.utils.dc_tools import send_with_webhook
+from app.utils.identity_map import current_identity_map
+from app.utils.serialization import RELATED, RELATED_MANY, SECONDS, TIME, VALUE, project, selection_of, serializer, wants
 from app.utils.tools import generate_random_hex
 from app.utils.types import EventStateEnum, EventOptionResponseEnum, UserGroupPermissionEnum
 
-class User(Model):
+class BaseModel(Model):
+    # Consults the identity map of the current request, if there is one.
+    __counter_fields__ = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def _init_from_db(cls, **kwargs):
+        instance = super()._init_from_db(**kwargs)
+        identity_map = current_identity_map.get()
+        if identity_map is not None:
+            identity_map.loaded(instance)
+        return instance
+
+    @classmethod
+    async def load(cls, pk):
+        # Batched with the other primary-key lookups of this tick, None if missing.
+        return await get_loader(cls).load(pk)
+
+    @classmethod
+    async def load_or_fail(cls, pk):
+        return await get_loader(cls).get(pk)
+
+    async def save(self, *args, update_fields=None, **kwargs) -> None:
+        # Counter columns are maintained by database triggers, a full save must not overwrite them.
+        if update_fields is None and self._saved_in_db and self.__counter_fields__:
+            update_fields = [field for field in self._meta.fields_db_projection if field not in self.__counter_fields__ and field != self._meta.pk_attr]
+        await super().save(*args, update_fields=update_fields, **kwargs)
+
+    @classmethod
+    async def get_or_none_cached(cls, **filters):
+        identity_map = current_identity_map.get()
+        if identity_map is None:
+            return await cls.get_or_none(**filters)
+        return await identity_map.get_or_none(cls, **filters)
+
+    async def fetch_related(self, *args, using_db=None) -> None:
+        identity_map = current_identity_map.get()
+        if identity_map is None or using_db is not None:
+            return await super().fetch_related(*args, using_db=using_db)
+        args = await identity_map.fetch_related(self, args)
+        if args:
+            await super().fetch_related(*args)
+            for field in args:
+                if field in self._meta.fk_fields:
+                    identity_map.add(getattr(self, field))
+
+
+class User(BaseModel):
     __parse_name__ = "user"
     id = fields.IntField(pk=True, autoincrement=True)
     name = fields.CharField(max_length=32, null=False, unique=True)
     password = fields.CharField(max_length=100, null=False)
     owner = fields.BooleanField(default=False, null=False)
+    # content_version() of the stored avatar, set by upload_avatar and cleared by delete_avatar.
+    avatar_version = fields.CharField(max_length=16, null=True)
 
     groups: fields.ReverseRelation["Group"]
     user_and_groups: fields.ReverseRelation["UserAndGroup"]
@@ -24,8 +80,7 @@ class User(Model):
     class Meta:
         table = "users"
 
-    def to_dict(self) -> Dict[str, any]:
-        return {"id":self.id, "name":self.name, "owner":self.owner, "has_avatar":os.path.exists(f"./resources/users/{self.id}/avatar.webp")}
+    to_dict = serializer(id=VALUE, name=VALUE, owner=VALUE, has_avatar=lambda user: user.avatar_version is not None, avatar_version=VALUE)
     
     def verify_password(self, input_password:str) -> bool:
         salt, stored_password = self.password.split("$")
@@ -39,7 +94,7 @@ class User(Model):
         return f"{salt}${hashed_password}"
 
 
-class Group(Model):
+class Group(BaseModel):
     __parse_name__ = "group"
     id = fields.IntField(pk=True, autoincrement=True)
     name = fields.CharField(max_length=32, null=False, unique=True)
@@ -61,10 +116,9 @@ class Group(Model):
     class Meta:
         table = "groups"
 
-    def to_dict(self) -> Dict[str, any]:
-        return {"id":self.id, "name":self.name, "description":self.description, "discord_webhook":(self.discord_webhook != None)}
+    to_dict = serializer(id=VALUE, name=VALUE, description=VALUE, discord_webhook=lambda group: group.discord_webhook != None)
     
-    async def get_group_id(self) -> int:
+    def get_group_id(self) -> int:
         return self.id
     
     @staticmethod
@@ -72,7 +126,7 @@ class Group(Model):
         group = await Group.get_or_none(name=name)
         return (group != None and group.id != group_id)
 
-class UserAndGroup(Model):
+class UserAndGroup(BaseModel):
     __parse_name__ = "user_and_group"
     id = fields.IntField(pk=True, autoincrement=True)
     user_id: int
@@ -89,6 +143,8 @@ class UserAndGroup(Model):
         related_name="user_and_groups",
         null=False,
     )
+    # Bitmask of UserGroupPermissionEnum.bit, kept in sync with user_group_permissions.
+    permissions = fields.IntField(default=0, null=False)
     user_event_option_responses: fields.ReverseRelation["UserEventOptionResponse"]
     user_vote_option_responses: fields.ReverseRelation["UserEventOptionResponse"]
     user_group_permissions: fields.ReverseRelation["UserGroupPermission"]
@@ -98,13 +154,35 @@ class UserAndGroup(Model):
         table = "user_and_groups"
         unique_together = [("user_id", "group_id")]
 
-    def to_dict(self) -> Dict[str, any]:
-        return {"id":self.id, "user_id":self.user_id, "group_id":self.group_id}
+    to_dict = serializer(id=VALUE, user_id=VALUE, group_id=VALUE)
     
-    async def get_group_id(self) -> int:
+    def get_group_id(self) -> int:
         return self.group_id
 
-class UserGroupPermission(Model):
+    def has_permission(self, *permissions: UserGroupPermissionEnum) -> bool:
+        return any(self.permissions & permission.bit for permission in permissions)
+
+    async def granted_permissions(self) -> List[UserGroupPermissionEnum]:
+        # In the order they were granted, like the user_group_permissions rows always came back.
+        # The mask doesn't keep that order, it only tells whether there is one to keep.
+        permissions = UserGroupPermissionEnum.from_mask(self.permissions)
+        if len(permissions) < 2:
+            return permissions
+        return await UserGroupPermission.filter(user_and_group_id=self.id).order_by("id").values_list("permission", flat=True)
+
+    async def add_permission(self, permission: UserGroupPermissionEnum) -> "UserGroupPermission":
+        user_group_permission = await UserGroupPermission.create(user_and_group_id=self.id, group_id=self.group_id, permission=permission)
+        # Set in the database rather than on the loaded value, so concurrent grants don't overwrite each other.
+        await UserAndGroup.filter(id=self.id).update(permissions=RawSQL(f"permissions | {permission.bit}"))
+        await self.refresh_from_db(fields=["permissions"])
+        return user_group_permission
+
+    async def remove_permission(self, permission: UserGroupPermissionEnum):
+        await UserGroupPermission.filter(user_and_group_id=self.id, permission=permission).delete()
+        await UserAndGroup.filter(id=self.id).update(permissions=RawSQL(f"permissions & {~permission.bit}"))
+        await self.refresh_from_db(fields=["permissions"])
+
+class UserGroupPermission(BaseModel):
     __parse_name__ = "user_group_permission"
     id = fields.IntField(pk=True, autoincrement=True)
     permission = fields.IntEnumField(enum_type=UserGroupPermissionEnum, null=False)
@@ -116,18 +194,22 @@ class UserGroupPermission(Model):
         on_delete=fields.CASCADE,
     )
 
+    group_id = fields.IntField(null=False, index=True)
+
     class Meta:
         unique_together = [("user_and_group_id", "permission")]
         table = "user_group_permissions"
 
-    def to_dict(self) -> Dict[str, any]:
-        return {"id":self.id, "permission":self.permission, "user_and_group_id":self.user_and_group_id}
+    to_dict = serializer(id=VALUE, permission=VALUE, user_and_group_id=VALUE)
     
-    async def get_group_id(self) -> int:
-        user_and_group = await UserAndGroup.get(id=self.user_and_group_id)
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        user_and_group = await UserAndGroup.load_or_fail(self.user_and_group_id)
         return user_and_group.group_id
 
-class Event(Model):
+class Event(BaseModel):
     __parse_name__ = "event"
     id = fields.IntField(pk=True, autoincrement=True)
     title = fields.CharField(max_length=100, null=False)
@@ -151,21 +233,20 @@ class Event(Model):
 
     class Meta:
         table = "events"
-
-    def to_dict(self) -> Dict[str, any]:
-        event_options_dict = [event_option.to_dict() for event_option in getattr(self, 'event_options', [])] if self.event_options._fetched else None
-        return {
-            "id": self.id,
-            "title": self.title,
-            "color": self.color,
-            "vote_end_date": self.vote_end_date.strftime("%Y-%m-%d %H:%M:%S") if self.vote_end_date else None,
-            "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),
-            "description": self.description,
-            "state": self.state,
-            "group_id": self.group_id,
-            "choosen_event_option_id": self.choosen_event_option_id,
-            "event_options": event_options_dict
-        }
+        indexes = [("group_id", "state")]
+
+    to_dict = serializer(
+        id=VALUE,
+        title=VALUE,
+        color=VALUE,
+        vote_end_date=SECONDS,
+        created=SECONDS,
+        description=VALUE,
+        state=VALUE,
+        group_id=VALUE,
+        choosen_event_option_id=VALUE,
+        event_options=RELATED_MANY,
+    )
     
     async def send_embed(self, url:str):
         if not isinstance(self.group, Group):
@@ -177,12 +258,51 @@ class Event(Model):
             embed.timestamp = self.created
             await send_with_webhook(url=self.group.discord_webhook, embed=embed)
 
-    async def get_group_id(self) -> int:
+    def get_group_id(self) -> int:
         return self.group_id
 
+    def next_state_change(self) -> datetime|None:
+        # Mirrors the conditions in update_state(), returns a naive UTC datetime.
+        # Requires event_options to be fetched.
+        if self.state == EventStateEnum.VOTING:
+            if self.vote_end_date:
+                return self.vote_end_date.astimezone(timezone.utc).replace(tzinfo=None) if self.vote_end_date.tzinfo else self.vote_end_date
+            dates = [event_option.date for event_option in self.event_options]
+            if dates:
+                return datetime.combine(min(dates), time()) - timedelta(hours=1)
+            return None
+        if self.state in (EventStateEnum.OPEN, EventStateEnum.ACTIVE) and self.choosen_event_option_id:
+            event_option = next((event_option for event_option in self.event_options if event_option.id == self.choosen_event_option_id), None)
+            if not event_option:
+                return None
+            start = datetime.combine(event_option.date, event_option.start_time.replace(tzinfo=None))
+            if event_option.end_time:
+                end = datetime.combine(event_option.date, event_option.end_time.replace(tzinfo=None))
+            else:
+                end = datetime.combine(event_option.date + timedelta(days=1), time())
+            if self.state == EventStateEnum.OPEN:
+                return start
+            return end
+        return None
+
+    def is_voting_over(self) -> bool:
+        # Already true between the deadline and the scheduler moving the event out of VOTING.
+        # Requires event_options to be fetched when there is no vote_end_date.
+        if self.state != EventStateEnum.VOTING:
+            return True
+        deadline = self.next_state_change()
+        return deadline is not None and deadline <= datetime.utcnow()
+
     @staticmethod
-    async def update_state():
+    async def update_state(event_ids: List[int]|None = None):
         conn = connections.get("default")
+        dialect = get_dialect(conn)
+        if event_ids is not None:
+            if not event_ids:
+                return
+            event_filter = f"AND events.id IN ({', '.join(str(int(event_id)) for event_id in event_ids)})"
+        else:
+            event_filter = ""
         
         await conn.execute_query(f"""
             UPDATE events
@@ -192,30 +312,20 @@ class Event(Model):
                         WHEN choosen_event_option_id IS NULL THEN (
                             SELECT COALESCE(
                                 (
-                                    SELECT event_option_id
-                                    FROM (
-                                        SELECT event_option_id, COUNT(*) AS response_count
-                                        FROM user_event_option_responses
-                                        INNER JOIN event_options ON user_event_option_responses.event_option_id = event_options.id
-                                        WHERE response = {EventOptionResponseEnum.ACCEPTED}
-                                        AND event_options.event_id = events.id
-                                        GROUP BY event_option_id
-                                        ORDER BY response_count DESC, event_option_id ASC
-                                        LIMIT 1
-                                    )
+                                    SELECT id
+                                    FROM event_options
+                                    WHERE event_options.event_id = events.id
+                                    AND accepted_count > 0
+                                    ORDER BY accepted_count DESC, id ASC
+                                    LIMIT 1
                                 ),
                                 (
-                                    SELECT event_option_id
-                                    FROM (
-                                        SELECT event_option_id, COUNT(*) AS response_count
-                                        FROM user_event_option_responses
-                                        INNER JOIN event_options ON user_event_option_responses.event_option_id = event_options.id
-                                        WHERE response = {EventOptionResponseEnum.DENIED}
-                                        AND event_options.event_id = events.id
-                                        GROUP BY event_option_id
-                                        ORDER BY response_count ASC, event_option_id ASC
-                                        LIMIT 1
-                                    )
+                                    SELECT id
+                                    FROM event_options
+                                    WHERE event_options.event_id = events.id
+                                    AND denied_count > 0
+                                    ORDER BY denied_count ASC, id ASC
+                                    LIMIT 1
                                 ),
                                 (
                                     SELECT id as event_option_id
@@ -230,16 +340,17 @@ class Event(Model):
                 )
             WHERE state = {EventStateEnum.VOTING}
             AND (
-                (events.vote_end_date IS NOT NULL AND events.vote_end_date <= DATETIME('now'))
+                (events.vote_end_date IS NOT NULL AND events.vote_end_date <= {dialect.now()})
                 OR
                 (
                     events.vote_end_date IS NULL AND (
-                        SELECT DATETIME(MIN(event_options.date), '-1 hour')
+                        SELECT {dialect.shift("MIN(event_options.date)", "-1 hour")}
                         FROM event_options
                         WHERE event_options.event_id = events.id
-                    )  <= DATETIME('now')
+                    )  <= {dialect.now()}
                 )
-            );
+            )
+            {event_filter};
         """)
 
         await conn.execute_query(f"""
@@ -248,15 +359,15 @@ class Event(Model):
                 CASE
                     -- If choosen_event_option_id is set and the end time of the chosen event option is not over
                     WHEN events.choosen_event_option_id IS NOT NULL AND (
-                        (eo.end_time IS NOT NULL AND DATETIME(eo.date || ' ' || eo.end_time) > DATETIME('now')) OR
-                        (eo.end_time IS NULL AND DATE(eo.date) = DATE('now'))
+                        (eo.end_time IS NOT NULL AND {dialect.combine("eo.date", "eo.end_time")} > {dialect.now()}) OR
+                        (eo.end_time IS NULL AND DATE(eo.date) = {dialect.today()})
                     )
-                    AND DATETIME(eo.date || ' ' || eo.start_time) < DATETIME('now')
+                    AND {dialect.combine("eo.date", "eo.start_time")} < {dialect.now()}
                     THEN {EventStateEnum.ACTIVE} -- Set state to ACTIVE
                     -- If choosen_event_option is set but the event is over
                     WHEN events.choosen_event_option_id IS NOT NULL AND (
-                        (eo.end_time IS NOT NULL AND DATETIME(eo.date || ' ' || eo.end_time) < DATETIME('now')) OR
-                        (eo.end_time IS NULL AND DATE(eo.date) < DATE('now'))
+                        (eo.end_time IS NOT NULL AND {dialect.combine("eo.date", "eo.end_time")} < {dialect.now()}) OR
+                        (eo.end_time IS NULL AND DATE(eo.date) < {dialect.today()})
                     )
                     THEN {EventStateEnum.CLOSED} -- Set state to CLOSED
                     ELSE events.state -- Keep the state unchanged
@@ -267,13 +378,104 @@ class Event(Model):
                 FROM events
                 LEFT JOIN event_options ON events.choosen_event_option_id = event_options.id
                 WHERE events.state IN ({EventStateEnum.OPEN}, {EventStateEnum.ACTIVE})
+                {event_filter}
             ) AS eo
             WHERE events.id = eo.event_id;
         """)
 
-
-
-class EventOption(Model):
+    @staticmethod
+    async def get_tree_for_group(group_id: int, states: List[EventStateEnum]|None = None, date_from: date|None = None, date_to: date|None = None, after_id: int|None = None, limit: int|None = None, selection: Dict[str, any]|None = None) -> List[Dict[str, any]]:
+        # Same shape as to_dict() with event_options and their responses prefetched, built from two flat queries.
+        # date_from/date_to keep the events with at least one option on a date in that range.
+        # A parse_fields() selection leaves out the option query or its response joins if they aren't asked for.
+        conn = connections.get("default")
+        dialect = get_dialect(conn)
+        event_filter = f"WHERE events.group_id = {int(group_id)}"
+        if states:
+            event_filter += f" AND events.state IN ({', '.join(str(int(state)) for state in states)})"
+        if date_from or date_to:
+            date_filter = ""
+            if date_from:
+                date_filter += f" AND event_options.date >= '{date_from.isoformat()}'"
+            if date_to:
+                date_filter += f" AND event_options.date <= '{date_to.isoformat()}'"
+            event_filter += f" AND EXISTS (SELECT 1 FROM event_options WHERE event_options.event_id = events.id{date_filter})"
+        if after_id is not None:
+            event_filter += f" AND events.id > {int(after_id)}"
+
+        _, event_rows = await conn.execute_query(f"""
+            SELECT id, title, color, {dialect.datetime_text("vote_end_date")}, {dialect.datetime_text("created")}, description, state, group_id, choosen_event_option_id
+            FROM events
+            {event_filter}
+            ORDER BY events.id
+            {f"LIMIT {int(limit)}" if limit is not None else ""}
+        """)
+        if not event_rows:
+            return []
+        with_options = wants(selection, "event_options")
+        with_responses = with_options and wants(selection_of(selection, "event_options"), "user_event_option_responses")
+
+        events = {}
+        for id, title, color, vote_end_date, created, description, state, event_group_id, choosen_event_option_id in event_rows:
+            events[id] = {
+                "id": id,
+                "title": title,
+                "color": color,
+                "vote_end_date": vote_end_date[:19] if vote_end_date else None,
+                "created": created[:19],
+                "description": description,
+                "state": state,
+                "group_id": event_group_id,
+                "choosen_event_option_id": choosen_event_option_id,
+                "event_options": []
+            }
+        if not with_options:
+            return project(list(events.values()), selection)
+
+        if with_responses:
+            response_columns = "responses.id, responses.response, responses.reason, responses.user_and_group_id, user_and_groups.user_id, user_and_groups.group_id"
+            response_joins = """
+            LEFT JOIN user_event_option_responses AS responses ON responses.event_option_id = event_options.id
+            LEFT JOIN user_and_groups ON user_and_groups.id = responses.user_and_group_id"""
+        else:
+            response_columns, response_joins = "NULL, NULL, NULL, NULL, NULL, NULL", ""
+        _, option_rows = await conn.execute_query(f"""
+            SELECT event_options.id, {dialect.date_text("event_options.date")}, {dialect.time_text("event_options.start_time")}, {dialect.time_text("event_options.end_time")}, event_options.event_id,
+                {response_columns}
+            FROM event_options{response_joins}
+            WHERE event_options.event_id IN ({', '.join(str(id) for id in events)})
+            ORDER BY event_options.event_id, event_options.id{", responses.id" if with_responses else ""}
+        """)
+        event_option = None
+        user_and_groups = {}
+        for option_id, option_date, start_time, end_time, event_id, response_id, response, reason, user_and_group_id, user_id, user_group_id in option_rows:
+            if event_option is None or event_option["id"] != option_id:
+                event_option = {
+                    "id": option_id,
+                    "date": option_date,
+                    "start_time": start_time[:8],
+                    "end_time": end_time[:8] if end_time else None,
+                    "event_id": event_id,
+                    "user_event_option_responses": []
+                }
+                events[event_id]["event_options"].append(event_option)
+            if response_id is not None:
+                user_and_group = user_and_groups.get(user_and_group_id)
+                if user_and_group is None:
+                    user_and_group = user_and_groups[user_and_group_id] = {"id": user_and_group_id, "user_id": user_id, "group_id": user_group_id}
+                event_option["user_event_option_responses"].append({
+                    "id": response_id,
+                    "response": response,
+                    "reason": reason,
+                    "event_option_id": option_id,
+                    "user_and_group_id": user_and_group_id,
+                    "user_and_group": user_and_group
+                })
+        return project(list(events.values()), selection)
+
+
+
+class EventOption(BaseModel):
     __parse_name__ = "event_option"
     id = fields.IntField(pk=True, autoincrement=True)
     date = fields.DateField(null=False)
@@ -290,25 +492,33 @@ class EventOption(Model):
 
     user_event_option_responses: fields.ReverseRelation["UserEventOptionResponse"]
 
+    group_id = fields.IntField(null=False, index=True)
+    # Kept up to date by triggers on user_event_option_responses.
+    accepted_count = fields.IntField(default=0, null=False)
+    denied_count = fields.IntField(default=0, null=False)
+    __counter_fields__ = ("accepted_count", "denied_count")
+
     class Meta:
         table = "event_options"
-
-    def to_dict(self) -> Dict[str, any]:
-        user_event_option_responses_dict = [user_event_option_responses.to_dict() for user_event_option_responses in getattr(self, 'user_event_option_responses', [])] if self.user_event_option_responses._fetched else None
-        return {
-            "id": self.id,
-            "date": self.date.isoformat(),
-            "start_time": self.start_time.strftime("%H:%M:%S"),
-            "end_time": self.end_time.strftime("%H:%M:%S") if self.end_time else None,
-            "event_id": self.event_id,
-            "user_event_option_responses": user_event_option_responses_dict
-        }
+        indexes = [("event_id", "date")]
+
+    to_dict = serializer(
+        id=VALUE,
+        date=VALUE,
+        start_time=TIME,
+        end_time=TIME,
+        event_id=VALUE,
+        user_event_option_responses=RELATED_MANY,
+    )
     
-    async def get_group_id(self) -> int:
-        event = await Event.get(id=self.event_id)
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        event = await Event.load_or_fail(self.event_id)
         return event.group_id
 
-class UserEventOptionResponse(Model):
+class UserEventOptionResponse(BaseModel):
     __parse_name__ = "user_event_option_response"
     id = fields.IntField(pk=True, autoincrement=True)
     response = fields.IntEnumField(enum_type=EventOptionResponseEnum, null=False)
@@ -329,23 +539,23 @@ class UserEventOptionResponse(Model):
         on_delete=fields.CASCADE,
     )
 
+    group_id = fields.IntField(null=False, index=True)
+
     class Meta:
         unique_together = [("event_option_id", "user_and_group_id")]
         table = "user_event_option_responses"
 
-    def to_dict(self) -> Dict[str, any]:
-        user_and_group_dict = None
-        if self.user_and_group:
-            user_and_group_dict = self.user_and_group.to_dict()
-
-        return {"id":self.id, "response":self.response, "reason":self.reason, "event_option_id": self.event_option_id, "user_and_group_id":self.user_and_group_id, "user_and_group":user_and_group_dict}
+    to_dict = serializer(id=VALUE, response=VALUE, reason=VALUE, event_option_id=VALUE, user_and_group_id=VALUE, user_and_group=RELATED)
     
-    async def get_group_id(self) -> int:
-        user_and_group = await UserAndGroup.get(id=self.user_and_group_id)
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        user_and_group = await UserAndGroup.load_or_fail(self.user_and_group_id)
         return user_and_group.group_id
 
 
-class Vote(Model):
+class Vote(BaseModel):
     __parse_name__ = "vote"
     id = fields.IntField(pk=True, autoincrement=True)
     title = fields.CharField(max_length=100, null=False)
@@ -363,17 +573,9 @@ class Vote(Model):
 
     class Meta:
         table = "votes"
+        indexes = [("group_id", "created")]
 
-    def to_dict(self) -> Dict[str, any]:
-        vote_options_dict = [vote_option.to_dict() for vote_option in getattr(self, 'vote_options', [])] if self.vote_options._fetched else None
-        return {
-            "id":self.id, 
-            "title":self.title, 
-            "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),
-            "multi_select":self.multi_select, 
-            "group_id": self.group_id,
-            "vote_options": vote_options_dict
-            }
+    to_dict = serializer(id=VALUE, title=VALUE, created=SECONDS, multi_select=VALUE, group_id=VALUE, vote_options=RELATED_MANY)
     
     async def send_embed(self, url:str):
         if not isinstance(self.group, Group):
@@ -386,11 +588,11 @@ class Vote(Model):
             await send_with_webhook(url=self.group.discord_webhook, embed=embed)
 
 
-    async def get_group_id(self) -> int:
+    def get_group_id(self) -> int:
         return self.group_id
 
 
-class VoteOption(Model):
+class VoteOption(BaseModel):
     __parse_name__ = "vote_option"
     id = fields.IntField(pk=True, autoincrement=True)
     title = fields.CharField(max_length=100, null=False)
@@ -405,23 +607,25 @@ class VoteOption(Model):
 
     user_vote_option_responses: fields.ReverseRelation["UserVoteOptionResponse"]
 
+    group_id = fields.IntField(null=False, index=True)
+    # Kept up to date by triggers on user_vote_option_responses.
+    response_count = fields.IntField(default=0, null=False)
+    __counter_fields__ = ("response_count",)
+
     class Meta:
         table = "vote_options"
+        indexes = [("vote_id",)]
 
-    def to_dict(self) -> Dict[str, any]:
-        user_vote_option_responses_dict = [user_vote_option_responses.to_dict() for user_vote_option_responses in getattr(self, 'user_vote_option_responses', [])] if self.user_vote_option_responses._fetched else None
-        return {
-            "id": self.id,
-            "title":self.title,
-            "vote_id": self.vote_id,
-            "user_vote_option_responses": user_vote_option_responses_dict
-        }
+    to_dict = serializer(id=VALUE, title=VALUE, vote_id=VALUE, user_vote_option_responses=RELATED_MANY)
     
-    async def get_group_id(self) -> int:
-        vote = await Vote.get(id=self.vote_id)
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        vote = await Vote.load_or_fail(self.vote_id)
         return vote.group_id
 
-class UserVoteOptionResponse(Model):
+class UserVoteOptionResponse(BaseModel):
     __parse_name__ = "user_vote_option_response"
     id = fields.IntField(pk=True, autoincrement=True)
 
@@ -440,22 +644,39 @@ class UserVoteOptionResponse(Model):
         on_delete=fields.CASCADE,
     )
 
+    group_id = fields.IntField(null=False, index=True)
+
     class Meta:
         unique_together = [("vote_option_id", "user_and_group_id")]
         table = "user_vote_option_responses"
+        indexes = [("user_and_group_id",)]
 
-    def to_dict(self) -> Dict[str, any]:
-        user_and_group_dict = None
-        if self.user_and_group:
-            user_and_group_dict = self.user_and_group.to_dict()
-        return {"id":self.id, "vote_option_id": self.vote_option_id, "user_and_group_id":self.user_and_group_id, "user_and_group":user_and_group_dict}
+    to_dict = serializer(id=VALUE, vote_option_id=VALUE, user_and_group_id=VALUE, user_and_group=RELATED)
     
-    async def get_group_id(self) -> int:
-        user_and_group = await UserAndGroup.get(id=self.user_and_group_id)
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        user_and_group = await UserAndGroup.load_or_fail(self.user_and_group_id)
         return user_and_group.group_id
 
+    @staticmethod
+    async def delete_single_select(vote_id: int, user_and_group_id: int):
+        # Removes the member's previous answer when the vote only allows one.
+        conn = connections.get("default")
+        await conn.execute_query(f"""
+            DELETE FROM user_vote_option_responses
+            WHERE user_and_group_id = {int(user_and_group_id)} AND vote_option_id IN (
+                SELECT vo.id
+                FROM vote_options AS vo
+                INNER JOIN votes AS v ON v.id = {int(vote_id)}
+                WHERE vo.vote_id = {int(vote_id)}
+                AND NOT v.multi_select
+            );
+        """)
 
-class Invite(Model):
+
+class Invite(BaseModel):
     __parse_name__ = "invite"
     id = fields.IntField(pk=True, autoincrement=True)
     code = fields.CharField(max_length=16, null=False, unique=True)
@@ -472,10 +693,9 @@ class Invite(Model):
     class Meta:
         table = "invites"
 
-    def to_dict(self) -> Dict[str, any]:
-        return {"id":self.id, "code":self.code, "expiration_date":self.expiration_date.isoformat(), "group_id":self.group_id}
+    to_dict = serializer(id=VALUE, code=VALUE, expiration_date=VALUE, group_id=VALUE)
     
-    async def get_group_id(self) -> int:
+    def get_group_id(self) -> int:
         return self.group_id
     
     def is_expired(self) -> bool:
@@ -491,8 +711,8 @@ class Invite(Model):
         await conn.execute_query("DELETE FROM invites WHERE expiration_date < CURRENT_DATE;")
 
 
-class Message(Model):
-    __parse_name__ = "invite"
+class Message(BaseModel):
+    __parse_name__ = "message"
     id = fields.BigIntField(pk=True, autoincrement=True)
     content = fields.TextField(max_length=200, null=False)
     sent_at = fields.DatetimeField(auto_now_add=True)
@@ -514,18 +734,55 @@ class Message(Model):
         null=False,
     )
 
+    group_id = fields.IntField(null=False, index=True)
+
     class Meta:
         table = "messages"
-
-    def to_dict(self) -> Dict[str, any]:
-        event_dict = None
-        if isinstance(self.event,Event):
-            event_dict = self.event.to_dict()
-        user_and_group_dict = None
-        if isinstance(self.user_and_group,UserAndGroup):
-            user_and_group_dict = self.user_and_group.to_dict()
-        return {"id":self.id, "content":self.content, "sent_at":self.sent_at.isoformat(), "event_id":self.event_id, "event":event_dict, "user_and_group":user_and_group_dict}
+        indexes = [("event_id", "sent_at", "id")]
+
+    to_dict = serializer(id=VALUE, content=VALUE, sent_at=VALUE, event_id=VALUE, event=RELATED, user_and_group=RELATED)
+
+    @classmethod
+    def page_query(cls, event_id: int, limit: int, before: Tuple[datetime, int]|None = None, after: Tuple[datetime, int]|None = None):
+        # Seeks on the (event_id, sent_at, id) index, id breaks ties between messages sent in the same
+        # instant so none are skipped or repeated. One row past the page tells whether there are more.
+        query = cls.filter(event_id=event_id)
+        if after:
+            sent_at, id = after
+            query = query.filter(Q(sent_at__gt=sent_at) | Q(id__gt=id), sent_at__gte=sent_at).order_by("sent_at", "id")
+        else:
+            if before:
+                sent_at, id = before
+                query = query.filter(Q(sent_at__lt=sent_at) | Q(id__lt=id), sent_at__lte=sent_at)
+            query = query.order_by("-sent_at", "-id")
+        return query.limit(limit + 1)
+
+    @classmethod
+    async def page(cls, event_id: int, limit: int, before: Tuple[datetime, int]|None = None, after: Tuple[datetime, int]|None = None) -> Tuple[List["Message"], bool]:
+        # Up to limit messages of the event newest first, the ones just before or just after a
+        # (sent_at, id) position, and whether there are more past the end of the page.
+        messages = await cls.page_query(event_id, limit, before, after).prefetch_related("user_and_group")
+        more = len(messages) > limit
+        messages = messages[:limit]
+        return (messages[::-1] if after else messages), more
     
-    async def get_group_id(self) -> int:
-        user_and_group = await UserAndGroup.get(id=self.user_and_group_id)
-        return user_and_group.group_id
\ No newline at end of file
+    def get_group_id(self) -> int:
+        return self.group_id
+
+    async def resolve_group_id(self) -> int:
+        event = await Event.load_or_fail(self.event_id)
+        return event.group_id
+
+
+@pre_save(UserGroupPermission, EventOption, UserEventOptionResponse, VoteOption, UserVoteOptionResponse, Message)
+async def set_group_id(sender, instance, using_db, update_fields):
+    # group_id is denormalized from the parent row. Callers pass it on create,
+    # this only covers the ones that don't.
+    if instance.group_id is None:
+        instance.group_id = await instance.resolve_group_id()
+
+
+MODELS_BY_PARSE_NAME: Dict[str, type[Model]] = {
+    model.__parse_name__: model
+    for model in (User, Group, UserAndGroup, UserGroupPermission, Event, EventOption, UserEventOptionResponse, Vote, VoteOption, UserVoteOptionResponse, Invite, Message)
+}
@@ -0,0 +1,332 @@
+import asyncio
+import contextvars
+import os
+import sqlite3
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, TypeVar
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.signals import post_delete, pre_delete
+from app.db.models import Group, User, UserAndGroup
+from app.db.sqlite import SqliteClient
+from app.utils import settings
+
+T = TypeVar("T")
+
+# Ids in a shard start at group_id << SHARD_ID_BITS, so the shard of a row can be read off its id.
+SHARD_ID_BITS = 32
+
+# Path parameters naming a row that lives in a shard.
+SHARDED_PARAMS = ("event_id", "event_option_id", "user_event_option_response_id", "vote_id", "vote_option_id", "user_vote_option_response_id", "message_id")
+
+# The group-scoped tables of app/db/migrations without the foreign keys to the central
+# tables, which can't point into another database. Applied in order, PRAGMA user_version
+# counts the ones a shard already has. {first_id} is the id before the first row of the group.
+SHARD_MIGRATIONS = [
+    """
+CREATE TABLE "events" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "title" VARCHAR(100) NOT NULL,
+    "color" VARCHAR(6) NOT NULL,
+    "vote_end_date" TIMESTAMP,
+    "created" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "description" TEXT,
+    "state" SMALLINT NOT NULL DEFAULT 1,
+    "choosen_event_option_id" INT,
+    "group_id" INT NOT NULL
+);
+CREATE INDEX "idx_events_group_i_f85260" ON "events" ("group_id", "state");
+CREATE TABLE "event_options" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL,
+    "start_time" TIME NOT NULL,
+    "end_time" TIME,
+    "event_id" INT NOT NULL REFERENCES "events" ("id") ON DELETE CASCADE,
+    "group_id" INT NOT NULL DEFAULT 0,
+    "accepted_count" INT NOT NULL DEFAULT 0,
+    "denied_count" INT NOT NULL DEFAULT 0
+);
+CREATE INDEX "idx_event_optio_event_i_2e874b" ON "event_options" ("event_id", "date");
+CREATE TABLE "user_event_option_responses" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "response" SMALLINT NOT NULL,
+    "event_option_id" INT NOT NULL REFERENCES "event_options" ("id") ON DELETE CASCADE,
+    "user_and_group_id" INT NOT NULL,
+    "reason" TEXT,
+    "group_id" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_user_event__event_o_e54e67" UNIQUE ("event_option_id", "user_and_group_id")
+);
+CREATE INDEX "idx_user_event__user_an" ON "user_event_option_responses" ("user_and_group_id");
+CREATE TABLE "votes" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "title" VARCHAR(100) NOT NULL,
+    "created" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "multi_select" INT NOT NULL DEFAULT 1,
+    "group_id" INT NOT NULL
+);
+CREATE INDEX "idx_votes_group_i_fc7a71" ON "votes" ("group_id", "created");
+CREATE TABLE "vote_options" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "title" VARCHAR(100) NOT NULL,
+    "vote_id" INT NOT NULL REFERENCES "votes" ("id") ON DELETE CASCADE,
+    "group_id" INT NOT NULL DEFAULT 0,
+    "response_count" INT NOT NULL DEFAULT 0
+);
+CREATE INDEX "idx_vote_option_vote_id_2efdc9" ON "vote_options" ("vote_id");
+CREATE TABLE "user_vote_option_responses" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "user_and_group_id" INT NOT NULL,
+    "vote_option_id" INT NOT NULL REFERENCES "vote_options" ("id") ON DELETE CASCADE,
+    "group_id" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_user_vote_o_vote_op_8bfd8e" UNIQUE ("vote_option_id", "user_and_group_id")
+);
+CREATE INDEX "idx_user_vote_o_user_an_3e0514" ON "user_vote_option_responses" ("user_and_group_id");
+CREATE TABLE "messages" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "content" TEXT NOT NULL,
+    "sent_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "event_id" INT NOT NULL REFERENCES "events" ("id") ON DELETE CASCADE,
+    "user_and_group_id" INT NOT NULL,
+    "group_id" INT NOT NULL DEFAULT 0
+);
+CREATE INDEX "idx_messages_event_i_d2a639" ON "messages" ("event_id", "sent_at");
+CREATE INDEX "idx_messages_user_an" ON "messages" ("user_and_group_id");
+CREATE TRIGGER "trg_user_event_option_responses_insert" AFTER INSERT ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" + (NEW."response" = 1),
+        "denied_count" = "denied_count" + (NEW."response" = 2)
+    WHERE "id" = NEW."event_option_id";
+END;
+CREATE TRIGGER "trg_user_event_option_responses_delete" AFTER DELETE ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" - (OLD."response" = 1),
+        "denied_count" = "denied_count" - (OLD."response" = 2)
+    WHERE "id" = OLD."event_option_id";
+END;
+CREATE TRIGGER "trg_user_event_option_responses_update" AFTER UPDATE OF "response", "event_option_id" ON "user_event_option_responses"
+BEGIN
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" - (OLD."response" = 1),
+        "denied_count" = "denied_count" - (OLD."response" = 2)
+    WHERE "id" = OLD."event_option_id";
+    UPDATE "event_options" SET
+        "accepted_count" = "accepted_count" + (NEW."response" = 1),
+        "denied_count" = "denied_count" + (NEW."response" = 2)
+    WHERE "id" = NEW."event_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_insert" AFTER INSERT ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" + 1 WHERE "id" = NEW."vote_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_delete" AFTER DELETE ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" - 1 WHERE "id" = OLD."vote_option_id";
+END;
+CREATE TRIGGER "trg_user_vote_option_responses_update" AFTER UPDATE OF "vote_option_id" ON "user_vote_option_responses"
+BEGIN
+    UPDATE "vote_options" SET "response_count" = "response_count" - 1 WHERE "id" = OLD."vote_option_id";
+    UPDATE "vote_options" SET "response_count" = "response_count" + 1 WHERE "id" = NEW."vote_option_id";
+END;
+INSERT INTO "sqlite_sequence" ("name", "seq") VALUES
+    ('events', {first_id}), ('event_options', {first_id}), ('user_event_option_responses', {first_id}),
+    ('votes', {first_id}), ('vote_options', {first_id}), ('user_vote_option_responses', {first_id}), ('messages', {first_id});
+""",
+    """
+DROP INDEX "idx_messages_event_i_d2a639";
+CREATE INDEX "idx_messages_event_i_2d9f5b" ON "messages" ("event_id", "sent_at", "id");
+""",
+]
+
+# Rows in a shard that point at a membership, ON DELETE CASCADE can't reach them.
+MEMBER_TABLES = ("user_event_option_responses", "user_vote_option_responses", "messages")
+
+
+def statements(script: str) -> List[str]:
+    # sqlite3.complete_statement() doesn't end a CREATE TRIGGER at the ";" inside its body.
+    result = []
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            result.append(statement.strip())
+            statement = ""
+    return result
+
+
+def sharding_enabled() -> bool:
+    return settings.SHARDING_ENABLED
+
+
+def group_of(row_id: int) -> int:
+    return row_id >> SHARD_ID_BITS
+
+
+def group_for_params(params: Dict[str, Any]) -> int|None:
+    if isinstance(params.get("group_id"), int):
+        return params["group_id"]
+    for key in SHARDED_PARAMS:
+        if isinstance(params.get(key), int):
+            return group_of(params[key])
+    return None
+
+
+def root_client(connection: BaseDBAsyncClient) -> BaseDBAsyncClient:
+    # Transactions and read snapshots keep the client they were opened on as _parent.
+    while getattr(connection, "_parent", None) is not None:
+        connection = connection._parent
+    return connection
+
+
+class ShardRouter:
+    """Opens the SQLite database of a group on first use and keeps it open.
+
+    Every shard attaches the central database, so the users, groups, memberships and
+    invites the group-scoped tables join against resolve there and the queries work
+    unchanged. A write only locks the shard it goes to and, if it touches a central
+    table, the central database."""
+
+    def __init__(self, directory: str = settings.SHARDS, readers: int = settings.SHARD_READERS):
+        self.directory = directory
+        self.readers = readers
+        self.central: SqliteClient|None = None
+        self._clients: Dict[int, SqliteClient] = {}
+        self._lock = asyncio.Lock()
+
+    def start(self, central: SqliteClient):
+        self.central = central
+        os.makedirs(self.directory, exist_ok=True)
+
+    async def close(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.close()
+
+    def path(self, group_id: int) -> str:
+        return f"{self.directory}/{int(group_id)}.db"
+
+    def exists(self, group_id: int) -> bool:
+        return group_id in self._clients or os.path.isfile(self.path(group_id))
+
+    def group_ids(self) -> List[int]:
+        return sorted(int(name[:-3]) for name in os.listdir(self.directory) if name.endswith(".db") and name[:-3].isdigit())
+
+    async def get(self, group_id: int) -> SqliteClient|None:
+        """The client of the group's shard, None if the group doesn't exist."""
+        client = self._clients.get(group_id)
+        if client is None:
+            async with self._lock:
+                client = self._clients.get(group_id)
+                if client is None:
+                    if not os.path.isfile(self.path(group_id)):
+                        _, rows = await self.central.execute_query("SELECT 1 FROM groups WHERE id = ?", [group_id])
+                        if not rows:
+                            return None
+                    client = await self._open(group_id)
+                    self._clients[group_id] = client
+        return client
+
+    async def _open(self, group_id: int) -> SqliteClient:
+        # Migrate before the readers connect. A reader whose schema predates a table resolves
+        # the name to the central database and never notices the table appeared.
+        migrator = SqliteClient(self.path(group_id), connection_name="default", **settings.SQLITE_PRAGMAS)
+        await migrator.create_connection(with_db=True)
+        try:
+            # Another worker may be opening the same shard, so read user_version holding the write lock.
+            # Statement by statement, executescript() would commit the transaction first.
+            await migrator.execute_query("BEGIN IMMEDIATE")
+            (row,) = await migrator.execute_query_dict("PRAGMA user_version")
+            for version in range(row["user_version"], len(SHARD_MIGRATIONS)):
+                for statement in statements(SHARD_MIGRATIONS[version].format(first_id=group_id << SHARD_ID_BITS)):
+                    await migrator.execute_query(statement)
+                await migrator.execute_query(f"PRAGMA user_version = {version + 1}")
+            await migrator.execute_query("COMMIT")
+        finally:
+            await migrator.close()
+        client = SqliteClient(self.path(group_id), readers=self.readers, attach=self.central.filename, connection_name="default", **settings.SQLITE_PRAGMAS)
+        await client.create_connection(with_db=True)
+        return client
+
+    async def drop(self, group_id: int):
+        async with self._lock:
+            client = self._clients.pop(group_id, None)
+        if client is not None:
+            # Wait for the transaction that deleted the group, it may still roll back.
+            async with client._lock:
+                pass
+            _, rows = await client.execute_query("SELECT 1 FROM groups WHERE id = ?", [group_id])
+            if rows:
+                self._clients[group_id] = client
+                return
+            await client.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.isfile(self.path(group_id) + suffix):
+                os.remove(self.path(group_id) + suffix)
+
+
+shard_router = ShardRouter()
+
+
+async def use_shard(group_id: int) -> contextvars.Token|None:
+    """Makes the group's shard the default connection of the current context."""
+    client = await shard_router.get(group_id)
+    if client is None:
+        return None
+    return connections.set("default", client)
+
+
+async def in_shard(group_id: int, func: Callable[[], Awaitable[T]]) -> T:
+    token = await use_shard(group_id)
+    try:
+        return await func()
+    finally:
+        if token is not None:
+            connections.reset(token)
+
+
+async def in_shards(group_ids: Iterable[int], func: Callable[[int], Awaitable[T]]) -> List[T]:
+    """Runs func(group_id) in every group's shard concurrently."""
+    return list(await asyncio.gather(*(in_shard(group_id, partial(func, group_id)) for group_id in group_ids)))
+
+
+async def in_shards_of(row_ids: List[int]|None, func: Callable[[List[int]|None], Awaitable[T]]) -> List[T]:
+    """Runs func with the ids that live in each shard, or with None in every shard if row_ids is None.
+    Without sharding func(row_ids) runs once on the default connection."""
+    if not sharding_enabled():
+        return [await func(row_ids)]
+    if row_ids is None:
+        return await in_shards(shard_router.group_ids(), lambda group_id: func(None))
+    by_group: Dict[int, List[int]] = {}
+    for row_id in row_ids:
+        by_group.setdefault(group_of(row_id), []).append(row_id)
+    return await in_shards(by_group, lambda group_id: func(by_group[group_id]))
+
+
+async def purge_member(user_and_group: UserAndGroup, using_db: BaseDBAsyncClient|None):
+    client = await shard_router.get(user_and_group.group_id) if shard_router.exists(user_and_group.group_id) else None
+    if client is None:
+        return
+    # Inside a transaction on the same shard the rows have to go in that transaction.
+    connection = using_db if using_db is not None and root_client(using_db) is client else client
+    for table in MEMBER_TABLES:
+        await connection.execute_query(f"DELETE FROM {table} WHERE user_and_group_id = ?", [user_and_group.id])
+
+
+@pre_delete(UserAndGroup)
+async def purge_deleted_member(sender, instance: UserAndGroup, using_db):
+    if sharding_enabled():
+        await purge_member(instance, using_db)
+
+
+@pre_delete(User)
+async def purge_deleted_user(sender, instance: User, using_db):
+    if sharding_enabled():
+        for user_and_group in await UserAndGroup.filter(user_id=instance.id).using_db(using_db):
+            await purge_member(user_and_group, using_db)
+
+
+@post_delete(Group)
+async def drop_deleted_group(sender, instance: Group, using_db):
+    if sharding_enabled():
+        asyncio.ensure_future(shard_router.drop(instance.id))
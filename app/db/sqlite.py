@@ -0,0 +1,179 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional, Sequence, Tuple
+import aiosqlite
+from tortoise.backends.sqlite import client as sqlite_client
+from tortoise.backends.sqlite.client import translate_exceptions
+from app.utils.exeptions import ReadOnlyRouteError
+
+# Pragmas that only matter for (or are refused by) the connection that writes.
+WRITER_ONLY_PRAGMAS = ("journal_mode", "journal_size_limit", "synchronous")
+
+
+def is_read_query(query: str) -> bool:
+    return query.lstrip()[:7].upper().startswith(("SELECT", "EXPLAIN"))
+
+
+class SqliteClient(sqlite_client.SqliteClient):
+    """Tortoise's SQLite client with a pool of read-only connections next to the writer.
+
+    Statements outside a transaction that only read go to a reader, so they no longer
+    queue behind the lock an @atomic() block holds on the writer connection. With WAL
+    every reader sees the last committed state. Everything else, including all
+    statements inside a transaction, still runs on the single writer connection.
+
+    attach names a second database file that every connection attaches as "central".
+    Tables missing from this database resolve to the ones there."""
+
+    def __init__(self, file_path: str, readers: int = 0, attach: str|None = None, **kwargs: Any) -> None:
+        super().__init__(file_path, **kwargs)
+        # An in-memory database isn't shared between connections.
+        self.readers = int(readers) if file_path != ":memory:" else 0
+        self.attach = attach
+        self._reader_pool: Optional[asyncio.Queue] = None
+        self._reader_connections: List[aiosqlite.Connection] = []
+
+    async def create_connection(self, with_db: bool) -> None:
+        connected = self._connection is not None
+        await super().create_connection(with_db)
+        if self.attach and not connected:
+            await self._connection.execute("ATTACH DATABASE ? AS central", (self.attach,))
+        if self.readers and self._reader_pool is None:
+            self._reader_pool = asyncio.Queue()
+            for _ in range(self.readers):
+                connection = await aiosqlite.connect(f"file:{self.filename}?mode=ro", uri=True, isolation_level=None)
+                connection._conn.row_factory = sqlite3.Row
+                for pragma, val in self.pragmas.items():
+                    if pragma not in WRITER_ONLY_PRAGMAS:
+                        await connection.execute(f"PRAGMA {pragma}={val}")
+                await connection.execute("PRAGMA query_only=ON")
+                if self.attach:
+                    await connection.execute("ATTACH DATABASE ? AS central", (f"file:{self.attach}?mode=ro",))
+                self._reader_connections.append(connection)
+                self._reader_pool.put_nowait(connection)
+
+    async def close(self) -> None:
+        for connection in self._reader_connections:
+            await connection.close()
+        self._reader_connections = []
+        self._reader_pool = None
+        await super().close()
+
+    async def take_reader(self) -> aiosqlite.Connection:
+        if not self._connection:
+            await self.create_connection(with_db=True)
+        return await self._reader_pool.get()
+
+    def return_reader(self, connection: aiosqlite.Connection):
+        self._reader_pool.put_nowait(connection)
+
+    @asynccontextmanager
+    async def acquire_reader(self):
+        connection = await self.take_reader()
+        try:
+            yield connection
+        finally:
+            self.return_reader(connection)
+
+    def read_snapshot(self, strict: bool = False) -> "ReadSnapshot":
+        return ReadSnapshot(self, strict)
+
+    @translate_exceptions
+    async def execute_query(self, query: str, values: Optional[list] = None) -> Tuple[int, Sequence[dict]]:
+        if not self.readers or not is_read_query(query):
+            return await super().execute_query(query, values)
+        query = query.replace("\x00", "'||CHAR(0)||'")
+        async with self.acquire_reader() as connection:
+            self.log.debug("%s: %s", query, values)
+            rows = await connection.execute_fetchall(query, values)
+            return len(rows), rows
+
+    @translate_exceptions
+    async def execute_query_dict(self, query: str, values: Optional[list] = None) -> List[dict]:
+        if not self.readers or not is_read_query(query):
+            return await super().execute_query_dict(query, values)
+        query = query.replace("\x00", "'||CHAR(0)||'")
+        async with self.acquire_reader() as connection:
+            self.log.debug("%s: %s", query, values)
+            return list(map(dict, await connection.execute_fetchall(query, values)))
+
+
+class ReadSnapshot(SqliteClient):
+    """Runs the queries of one read-only request on a single reader connection inside
+    BEGIN, so they all see the same snapshot. The reader is taken on the first query
+    and handed back by release().
+
+    Writes are refused with ReadOnlyRouteError when strict, otherwise they are passed
+    on to the writer connection."""
+
+    def __init__(self, parent: SqliteClient, strict: bool) -> None:
+        self.connection_name = parent.connection_name
+        self.fetch_inserted = parent.fetch_inserted
+        self.log = parent.log
+        self.filename = parent.filename
+        self.pragmas = parent.pragmas
+        self.readers = 0
+        self.strict = strict
+        self._parent = parent
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+        self._released = False
+
+    @asynccontextmanager
+    async def acquire_connection(self):
+        async with self._lock:
+            if self._connection is None:
+                self._connection = await self._parent.take_reader()
+                await self._connection.execute("BEGIN")
+            yield self._connection
+
+    async def release(self) -> None:
+        async with self._lock:
+            self._released = True
+            if self._connection is not None:
+                connection, self._connection = self._connection, None
+                try:
+                    await connection.rollback()
+                finally:
+                    self._parent.return_reader(connection)
+
+    def _writer(self, query: str) -> SqliteClient:
+        if self.strict:
+            raise ReadOnlyRouteError(f"A read-only route attempted to write: {query.strip()[:200]}")
+        return self._parent
+
+    async def execute_query(self, query: str, values: Optional[list] = None) -> Tuple[int, Sequence[dict]]:
+        if self._released:
+            return await self._parent.execute_query(query, values)
+        if not is_read_query(query):
+            return await self._writer(query).execute_query(query, values)
+        return await super().execute_query(query, values)
+
+    async def execute_query_dict(self, query: str, values: Optional[list] = None) -> List[dict]:
+        if self._released:
+            return await self._parent.execute_query_dict(query, values)
+        if not is_read_query(query):
+            return await self._writer(query).execute_query_dict(query, values)
+        return await super().execute_query_dict(query, values)
+
+    async def execute_insert(self, query: str, values: list) -> int:
+        return await self._writer(query).execute_insert(query, values)
+
+    async def execute_many(self, query: str, values: List[list]) -> None:
+        return await self._writer(query).execute_many(query, values)
+
+    async def execute_script(self, query: str) -> None:
+        return await self._writer(query).execute_script(query)
+
+    def _in_transaction(self):
+        return self._writer("BEGIN")._in_transaction()
+
+    async def create_connection(self, with_db: bool) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self.release()
+
+
+client_class = SqliteClient
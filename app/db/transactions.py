@@ -0,0 +1,48 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, List
+from tortoise.transactions import in_transaction
+
+# Callbacks waiting for the transaction of the current request to commit, None outside of one.
+_after_commit: contextvars.ContextVar[List[Callable[[], None]]|None] = contextvars.ContextVar("after_commit", default=None)
+
+
+def after_commit(callback: Callable[[], None]):
+    """Calls callback once the surrounding transaction has committed, right away outside of one.
+    It is dropped if the transaction is rolled back."""
+    callbacks = _after_commit.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+@contextmanager
+def deferred_after_commit():
+    # Collects the after_commit() callbacks of the block and calls them if it exits without an error.
+    # Nested blocks leave them to the outermost one, which is the one that commits.
+    if _after_commit.get() is not None:
+        yield
+        return
+    callbacks = []
+    token = _after_commit.set(callbacks)
+    try:
+        yield
+    finally:
+        _after_commit.reset(token)
+    for callback in callbacks:
+        callback()
+
+
+def atomic(connection_name: str|None = None):
+    """tortoise.transactions.atomic() that calls the after_commit() callbacks of the handler
+    once its transaction has committed."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with deferred_after_commit():
+                async with in_transaction(connection_name):
+                    return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from sanic.log import logger
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+from app.db.transactions import deferred_after_commit
+from app.utils import settings
+
+# Set in the tasks the writer runs, a write submitted from there runs inline instead of deadlocking.
+in_writer = contextvars.ContextVar("in_writer", default=False)
+
+Job = Tuple[Callable[[], Awaitable[Any]], contextvars.Context, asyncio.Future, BaseDBAsyncClient]
+
+
+class WriteQueue:
+    """Runs mutations one after another on a single writer task.
+
+    Callers submit a closure and wait for its result. The writer takes the closures
+    queued so far, up to max_batch_size, and runs them in one transaction with a
+    savepoint each, so a failing closure only rolls back its own changes and the batch
+    pays for one commit. Futures are resolved once the batch is committed. If the
+    batch as a whole fails, the closures that hadn't failed are run again one per
+    transaction, so they must not have side effects outside the database.
+
+    Closures run in a copy of the caller's context, with the batch transaction as
+    the default connection. A batch is split by the connection the callers had, so
+    with sharding every group's writes commit in that group's database."""
+
+    def __init__(self, max_size: int = settings.WRITE_QUEUE_SIZE, max_batch_size: int = settings.WRITE_QUEUE_MAX_BATCH_SIZE, connection_name: str = "default"):
+        self.max_batch_size = max_batch_size
+        self.connection_name = connection_name
+        self.batches = 0
+        self.jobs = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.max_seen_batch_size = 0
+        self.max_seen_depth = 0
+        self._queue: asyncio.Queue = asyncio.Queue(max_size)
+        self._task: asyncio.Task|None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let everything already submitted commit first.
+        if self._task:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if in_writer.get():
+            return await func()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((func, contextvars.copy_context(), future, connections.get(self.connection_name)))
+        self.max_seen_depth = max(self.max_seen_depth, self._queue.qsize())
+        # Shielded, a caller that goes away doesn't take its write out of the batch.
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_seen_depth,
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "failed": self.failed,
+            "fallbacks": self.fallbacks,
+            "mean_batch_size": round(self.jobs / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_seen_batch_size,
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            by_connection: Dict[BaseDBAsyncClient, List[Job]] = {}
+            for job in batch:
+                by_connection.setdefault(job[3], []).append(job)
+            try:
+                for client, jobs in by_connection.items():
+                    await self._flush(client, jobs)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, client: BaseDBAsyncClient, batch: List[Job]):
+        try:
+            await self._commit(client, batch)
+        except Exception:
+            logger.exception("Write batch failed, running its jobs one by one")
+            self.fallbacks += 1
+            for job in batch:
+                if job[2].done():
+                    continue
+                try:
+                    await self._commit(client, [job])
+                except Exception as e:
+                    self.failed += 1
+                    if not job[2].done():
+                        job[2].set_exception(e)
+
+    async def _commit(self, client: BaseDBAsyncClient, batch: List[Job]):
+        results = []
+        async with client._in_transaction() as connection:
+            for index, (func, context, future, _) in enumerate(batch):
+                await connection.execute_query(f"SAVEPOINT write_{index}")
+                try:
+                    result = await self._execute(connection, func, context)
+                except Exception as e:
+                    if connection._finalized:
+                        raise
+                    await connection.execute_query(f"ROLLBACK TO write_{index}")
+                    await connection.execute_query(f"RELEASE write_{index}")
+                    results.append((future, None, e))
+                else:
+                    await connection.execute_query(f"RELEASE write_{index}")
+                    results.append((future, result, None))
+
+        self.batches += 1
+        self.jobs += len(batch)
+        self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                self.failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _execute(self, connection, func: Callable[[], Awaitable[Any]], context: contextvars.Context) -> Any:
+        context.run(connections.set, self.connection_name, connection)
+        context.run(in_writer.set, True)
+        # The task copies the context it is created in, so the closure sees the caller's context.
+        return await context.run(lambda: asyncio.ensure_future(func()))
+
+
+async def queued_write(app, func: Callable[[], Awaitable[Any]]) -> Any:
+    """Runs func on the app's write queue, or in its own transaction when the queue is disabled.
+    The after_commit() callbacks of func are called once its batch has committed."""
+    write_queue: Optional[WriteQueue] = getattr(app.ctx, "write_queue", None)
+    with deferred_after_commit():
+        if write_queue is None or in_writer.get():
+            async with in_transaction():
+                return await func()
+        return await write_queue.submit(func)
@@ -5,6 +5,7 @@ from .groups import groups
 from .invites import invites
 from .me import me
 from .messages import messages
+from .stats import stats
 from .user_and_group import user_and_group
 from .user_event_option_response import user_event_option_response
 from .user_vote_option_response import user_vote_option_response
@@ -12,4 +13,4 @@ from .users import users
 from .vote_options import vote_options
 from .votes import votes
 
-routes = Blueprint.group(event_options, events, groups, invites, me, messages, user_and_group, user_event_option_response, user_vote_option_response, users, vote_options, votes, url_prefix="/api")
\ No newline at end of file
+routes = Blueprint.group(event_options, events, groups, invites, me, messages, stats, user_and_group, user_event_option_response, user_vote_option_response, users, vote_options, votes, url_prefix="/api")
\ No newline at end of file
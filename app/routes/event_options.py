@@ -2,10 +2,10 @@ from sanic import Blueprint
 from sanic_jwt import protected
 from sanic.request import Request
 from sanic.response import json
-from tortoise.transactions import atomic
 from app.db.models import EventOption, User, UserAndGroup, UserEventOptionResponse, Event
+from app.db.transactions import atomic
 from app.utils.tools import filter_dict_by_keys
-from app.utils.decorators import check_for_permission
+from app.utils.decorators import check_for_permission, serialized_write
 from app.utils.types import UserGroupPermissionEnum, EventStateEnum
 
 event_options = Blueprint("event_options", url_prefix="/event_options")
@@ -32,6 +32,7 @@ async def update_event_option(request: Request, my_user: User, event_option: Eve
 
         await event_option.update_from_dict(filter_dict_by_keys(request.json,["date", "start_time", "end_time"]))
         await event_option.save()
+        request.app.ctx.event_scheduler.reschedule(event_option.event_id)
         return json(event_option.to_dict())
     else:
         return json({"error": f"Event Option not found"}, status=404)
@@ -47,6 +48,7 @@ async def delete_event_option(request: Request, my_user: User, event_option: Eve
         if event_option.event.state == EventStateEnum.ARCHIVED:
             return json({"error": f"The Event is Archived."}, status=403)
         await event_option.delete()
+        request.app.ctx.event_scheduler.reschedule(event_option.event_id)
         return json({"message": f"Event Option deleted successfully"})
     else:
         return json({"error": f"Event Option not found"}, status=404)
@@ -68,18 +70,19 @@ async def get_user_event_option_responses(request: Request, my_user: User, event
 @event_options.route("/<event_option_id:int>/user_event_option_response", methods=["POST"], name="create_user_event_option_response")
 @protected()
 @check_for_permission()
-@atomic()
+@serialized_write()
 async def create_user_event_option_response(request: Request, my_user: User, event_option: EventOption|None):
     data = request.json
-    await Event.update_state()
     if not event_option:
         return json({"error": f"EventOption not found"}, status=404)
     
     await event_option.fetch_related("event")
-    if event_option.event.state != EventStateEnum.VOTING:
+    if not event_option.event.vote_end_date:
+        await event_option.event.fetch_related("event_options")
+    if event_option.event.is_voting_over():
         return json({"error": f"The Voting period is over."}, status=403)
     
-    user_and_group = await UserAndGroup.get_or_none(user_id=my_user.id, group_id=event_option.event.group_id)
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id=my_user.id, group_id=event_option.group_id)
     if not user_and_group:
         return json({"error": f"User is not in Group"}, status=404)
 
@@ -88,10 +91,12 @@ async def create_user_event_option_response(request: Request, my_user: User, eve
     if user_event_option_response:
         await user_event_option_response.update_from_dict(data)
         await user_event_option_response.save()
+        user_event_option_response.user_and_group = user_and_group
     else:
         user_event_option_response = await UserEventOptionResponse.create(
             event_option=event_option,
-            user_and_group=user_and_group, **data
+            user_and_group=user_and_group,
+            group_id=user_and_group.group_id, **data
         )
     return json(user_event_option_response.to_dict(), status=201)
 
@@ -99,6 +104,7 @@ async def create_user_event_option_response(request: Request, my_user: User, eve
 @event_options.route("/<event_option_id:int>/set_for_event", methods=["PUT"], name="set_event_option_for_event")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_EVENTS])
+@atomic()
 async def set_event_option_for_event(request: Request, my_user: User, event_option: EventOption|None):
     if event_option:
         await event_option.fetch_related("event")
@@ -106,6 +112,7 @@ async def set_event_option_for_event(request: Request, my_user: User, event_opti
             return json({"error": f"The Event is Archived."}, status=403)
         event_option.event.choosen_event_option_id = event_option.id
         await event_option.event.save()
+        request.app.ctx.event_scheduler.reschedule(event_option.event_id)
         return json({"message": f"Set EventOption for Event"})
     else:
         return json({"error": f"Event Option not found"}, status=404)
@@ -1,19 +1,28 @@
 from datetime import datetime
+from typing import Tuple
 from sanic import Blueprint, Websocket
-from sanic.exceptions import WebsocketClosed
 from sanic_jwt import protected
 from sanic.request import Request
 from sanic.response import json
-from tortoise.transactions import atomic
 from app.db.models import Event, EventOption, Message, User, UserAndGroup
+from app.db.transactions import atomic
 from app.utils.decorators import check_for_permission
+from app.utils.serialization import MSGPACK_SUBPROTOCOL, decode_cursor, decode_frame, encode_cursor
 from app.utils.tools import filter_dict_by_keys
 from app.utils.types import EventStateEnum, UserGroupPermissionEnum
-import json as json_fromat
-import re
+
+MESSAGES_PAGE_SIZE = 30
+MAX_MESSAGES_PAGE_SIZE = 100
 
 events = Blueprint("events", url_prefix="/events")
 
+
+def message_position(cursor: str) -> Tuple[datetime, int]:
+    # The (sent_at, id) of the message a history cursor points at.
+    sent_at, id = decode_cursor(cursor)
+    return datetime.fromisoformat(sent_at), int(id)
+
+
 # @events.route("/", methods=["GET"], name="get_events")
 # @protected()
 # @check_for_permission()
@@ -27,12 +36,22 @@ events = Blueprint("events", url_prefix="/events")
 @check_for_permission()
 async def get_event(request: Request, my_user: User, event: Event|None):
     if event:
-        await Event.update_state()
         return json(event.to_dict())
     else:
         return json({"error": "Event not found"}, status=404)
 
 
+@events.route("/<event_id:int>/results", methods=["GET"], name="get_event_results")
+@protected()
+@check_for_permission()
+async def get_event_results(request: Request, my_user: User, event: Event|None):
+    if event:
+        event_options = await EventOption.filter(event_id=event.id).order_by("id").values("id", "accepted_count", "denied_count")
+        return json({"event_id": event.id, "choosen_event_option_id": event.choosen_event_option_id, "event_options": event_options})
+    else:
+        return json({"error": "Event not found"}, status=404)
+
+
 @events.route("/<event_id:int>", methods=["PUT"], name="update_event")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_EVENTS])
@@ -43,6 +62,7 @@ async def update_event(request: Request, my_user: User, event: Event|None):
             return json({"error": f"The Event is Archived."}, status=403)
         await event.update_from_dict(filter_dict_by_keys(request.json, ["title", "color", "description", "state", "vote_end_date"]))
         await event.save()
+        request.app.ctx.event_scheduler.reschedule(event.id)
         return json(event.to_dict())
     else:
         return json({"error": "Event not found"}, status=404)
@@ -55,6 +75,7 @@ async def update_event(request: Request, my_user: User, event: Event|None):
 async def delete_event(request: Request, my_user: User, event: Event|None):
     if event:
         await event.delete()
+        request.app.ctx.event_scheduler.reschedule(event.id)
         return json({"message": "Event deleted successfully"})
     else:
         return json({"error": "Event not found"}, status=404)
@@ -79,7 +100,8 @@ async def create_event_event_options(request: Request, my_user: User, event: Eve
         if event.state == EventStateEnum.ARCHIVED:
             return json({"error": f"The Event is Archived."}, status=403)
         data = filter_dict_by_keys(request.json,["date", "start_time", "end_time"])
-        event_option = await EventOption.create(event_id=event.id, **data)
+        event_option = await EventOption.create(event_id=event.id, group_id=event.group_id, **data)
+        request.app.ctx.event_scheduler.reschedule(event.id)
         return json(event_option.to_dict())
     else:
         return json({"error": "Event not found"}, status=404)
@@ -88,53 +110,49 @@ async def create_event_event_options(request: Request, my_user: User, event: Eve
 @protected()
 @check_for_permission()
 async def get_event_messages(request: Request, my_user: User, event: Event|None):
-    if event:
-        #timestamp = request.args.get('timestamp')
-        resuls = re.search(r'timestamp=([\w\-\+:.]+)', request.query_string)
-        if resuls:
-            timestamp = resuls.group(1)
-        else:
-            timestamp = None
-        limit = request.args.get('limit', 30)
-
-        try:
-            timestamp = datetime.fromisoformat(timestamp) if timestamp else datetime.utcnow()
-            limit = int(limit)
-        except ValueError:
-            return json({"error": "Invalid timestamp or limit"}, status=400)
-        
-        messages = await Message.filter(event_id=event.id, sent_at__lt=timestamp).order_by('-sent_at').prefetch_related("user_and_group").limit(limit)
-        #messages = messages[::-1]
-        return json([message.to_dict() for message in messages])
-    else:
+    if not event:
         return json({"error": "Event not found"}, status=404)
+    # Newest first. ?before=<cursor> pages back to older messages, ?after=<cursor> forward to newer ones.
+    # The cursors for the pages next to this one are sent in X-Next-Before and X-Next-After,
+    # X-Next-Before is left out once the oldest message is on the page.
+    try:
+        limit = min(int(request.args.get("limit", MESSAGES_PAGE_SIZE)), MAX_MESSAGES_PAGE_SIZE)
+        before = message_position(request.args.get("before")) if request.args.get("before") else None
+        after = message_position(request.args.get("after")) if request.args.get("after") else None
+    except (ValueError, TypeError):
+        return json({"error": "Invalid before, after or limit"}, status=400)
+    if limit < 1 or (before and after):
+        return json({"error": "Invalid before, after or limit"}, status=400)
+
+    messages, more = await Message.page(event.id, limit, before, after)
+    headers = {}
+    if messages and (more or after):
+        headers["X-Next-Before"] = encode_cursor(messages[-1].sent_at, messages[-1].id)
+    elif after:
+        headers["X-Next-Before"] = request.args.get("after")
+    if messages:
+        headers["X-Next-After"] = encode_cursor(messages[0].sent_at, messages[0].id)
+    elif before or after:
+        headers["X-Next-After"] = request.args.get("before") or request.args.get("after")
+    return json([message.to_dict() for message in messages], headers=headers)
     
-@events.websocket('/chat/<event_id:int>', name="chat_message_recv_send")
+@events.websocket('/chat/<event_id:int>', name="chat_message_recv_send", subprotocols=[MSGPACK_SUBPROTOCOL])
 @protected()
 @check_for_permission()
 async def chat_message_recv_send(request: Request, ws: Websocket, my_user: User, event: Event|None):
     if not event:
         return json({"error": "Event not found"}, status=404)
-    user_and_group = await UserAndGroup.get_or_none(user_id= my_user.id, group_id=event.group_id)
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id= my_user.id, group_id=event.group_id)
     if not user_and_group:
         return json({"error": f"User is not in the Group"}, status=400)
-    if event.id not in request.app.ctx.connected_users:
-        request.app.ctx.connected_users[event.id] = []
-    request.app.ctx.connected_users[event.id].append(ws)
+    connection = request.app.ctx.chat.join(event.id, ws)
     try:
         while True:
             data = await ws.recv()
-            message_data = json_fromat.loads(data)
-            message = await Message.create(content=message_data['content'], event_id=event.id, user_and_group_id=user_and_group.id)
-            await message.fetch_related("user_and_group")
-            data_send = json_fromat.dumps(message.to_dict())
-            await ws.send(data_send)
-            for user in request.app.ctx.connected_users[event.id]:
-                if user != ws:
-                    try:
-                        await user.send(data_send)
-                    except WebsocketClosed as e:
-                        request.app.ctx.connected_users[event.id].remove(user)
-    except Exception as e:
-        request.app.ctx.connected_users[event.id].remove(ws)
-        raise e
\ No newline at end of file
+            message_data = decode_frame(data)
+            # Written in the background, user_and_group is the connection's own.
+            message = await request.app.ctx.message_buffer.add(event, user_and_group, message_data['content'])
+            # Reaches the connections of this event in every worker, this one included.
+            request.app.ctx.pubsub.publish("chat", (event.id, message.to_dict()))
+    finally:
+        request.app.ctx.chat.leave(event.id, connection)
\ No newline at end of file
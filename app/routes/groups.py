@@ -1,14 +1,18 @@
 from datetime import date
+from functools import partial
 from sanic import Blueprint
 from sanic_jwt import protected
 from sanic.request import Request
 from sanic.response import json
-from tortoise.transactions import atomic
-from app.db.models import Event, EventOption, Group, Invite, User, UserAndGroup, UserEventOptionResponse, UserGroupPermission, UserVoteOptionResponse, Vote, VoteOption
-from app.utils.decorators import check_for_permission, is_owner
+from app.db.models import Event, Group, Invite, User, UserAndGroup, UserGroupPermission, Vote
+from app.db.transactions import after_commit, atomic
+from app.utils.cache import principal_cache
+from app.utils.decorators import check_for_permission, is_owner, read_write
+from app.utils.serialization import parse_fields, prefetch_paths, serialize
 from app.utils.tools import filter_dict_by_keys
-from tortoise.query_utils import Prefetch
-from app.utils.types import UserGroupPermissionEnum
+from app.utils.types import EventStateEnum, UserGroupPermissionEnum
+
+MAX_EVENTS_PAGE_SIZE = 500
 
 groups = Blueprint("groups", url_prefix="/groups")
 
@@ -17,7 +21,7 @@ groups = Blueprint("groups", url_prefix="/groups")
 @is_owner
 async def get_groups(request: Request, my_user: User):
     groups = await Group.all()
-    return json([group.to_dict() for group in groups])
+    return json(serialize(groups, parse_fields(request.args.get("fields"))))
 
 
 @groups.route("/", methods=["POST"], name="create_group")
@@ -64,6 +68,7 @@ async def update_group(request: Request, my_user: User, group: Group|None):
 async def delete_group(request: Request, my_user: User, group: Group|None):
     if group:
         await group.delete()
+        after_commit(principal_cache.clear)
         return json({"message": f"Group deleted successfully"})
     else:
         return json({"error": f"Group not found"}, status=404)
@@ -72,6 +77,7 @@ async def delete_group(request: Request, my_user: User, group: Group|None):
 @groups.route("/<group_id:int>/invites", methods=["GET"], name="get_group_invites")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_INVITES])
+@read_write
 async def get_group_invites(request: Request, my_user: User, group: Group|None):
     if not group:
         return json({"error": "Group not found"}, status=404)
@@ -98,15 +104,23 @@ async def create_group_invite(request: Request, my_user: User, group: Group|None
 async def get_all_events_for_group(request: Request, my_user: User, group: Group|None):
     if not group:
         return json({"error": "Group not found"}, status=404)
-    events = await Event.filter(group_id=group.id).prefetch_related(
-        Prefetch("event_options", queryset=EventOption.all().prefetch_related(
-            Prefetch("user_event_option_responses", queryset=UserEventOptionResponse.all().prefetch_related(
-                "user_and_group"
-            ))
-        ))
-    )
-    await Event.update_state()
-    return json([event.to_dict() for event in events])
+    # Optional filters: ?state=0&state=1, ?from=2024-01-01&to=2024-12-31 (option dates),
+    # ?limit=50&after=<last event id> to page, the next cursor is sent in X-Next-After.
+    # ?fields=id,title,event_options.date returns only those keys.
+    try:
+        states = [EventStateEnum(int(state)) for state in request.args.getlist("state", [])]
+        date_from = date.fromisoformat(request.args.get("from")) if request.args.get("from") else None
+        date_to = date.fromisoformat(request.args.get("to")) if request.args.get("to") else None
+        after_id = int(request.args.get("after")) if request.args.get("after") else None
+        limit = min(int(request.args.get("limit")), MAX_EVENTS_PAGE_SIZE) if request.args.get("limit") else None
+    except ValueError:
+        return json({"error": "Invalid state, from, to, after or limit"}, status=400)
+    if limit is not None and limit < 1:
+        return json({"error": "Invalid state, from, to, after or limit"}, status=400)
+
+    events = await Event.get_tree_for_group(group.id, states, date_from, date_to, after_id, limit, parse_fields(request.args.get("fields")))
+    headers = {"X-Next-After": str(events[-1]["id"])} if limit is not None and len(events) == limit else None
+    return json(events, headers=headers)
 
 
 @groups.route("/<group_id:int>/events", methods=["POST"], name="create_event_for_group")
@@ -118,6 +132,7 @@ async def create_event_for_group(request: Request, my_user: User, group: Group|N
         return json({"error": "Group not found"}, status=404)
     data = filter_dict_by_keys(request.json, ["title", "color", "description", "state", "vote_end_date"], True)
     event = await Event.create(group_id=group.id, **data)
+    request.app.ctx.event_scheduler.reschedule(event.id)
     await event.send_embed(url=request.app.ctx.Config["App"]["URI"])
     return json(event.to_dict())
 
@@ -129,14 +144,11 @@ async def get_all_votes_for_group(request: Request, my_user: User, group: Group|
     if not group:
         return json({"error": "Group not found"}, status=404)
 
+    selection = parse_fields(request.args.get("fields"))
     votes = await Vote.filter(group_id=group.id).prefetch_related(
-        Prefetch("vote_options", queryset=VoteOption.all().prefetch_related(
-            Prefetch("user_vote_option_responses", queryset=UserVoteOptionResponse.all().prefetch_related(
-                "user_and_group"
-            ))
-        ))
+        *prefetch_paths(selection, {"vote_options": {"user_vote_option_responses": {"user_and_group": {}}}})
     )
-    return json([vote.to_dict() for vote in votes])
+    return json(serialize(votes, selection))
 
 
 @groups.route("/<group_id:int>/votes", methods=["POST"], name="create_vote_for_group")
@@ -155,7 +167,6 @@ async def create_vote_for_group(request: Request, my_user: User, group: Group|No
 @groups.route("/<group_id:int>/users", methods=["Get"], name="get_group_users")
 @protected()
 @check_for_permission()
-@atomic()
 async def get_group_users(request: Request, my_user: User, group: Group|None):
     
     if not group:
@@ -163,7 +174,7 @@ async def get_group_users(request: Request, my_user: User, group: Group|None):
 
     await group.fetch_related("users")
 
-    return json([user.to_dict() for user in group.users])
+    return json(serialize(list(group.users), parse_fields(request.args.get("fields"))))
 
 
 @groups.route("/<group_id:int>/users/<user_id:int>", methods=["POST"], name="add_user_to_group")
@@ -178,11 +189,12 @@ async def add_user_to_group(request: Request, my_user: User, group: Group|None,
     if not group:
         return json({"error": f"Group not found"}, status=404)
 
-    user_group = await UserAndGroup.get_or_none(group=group, user=user)
+    user_group = await UserAndGroup.get_or_none_cached(group_id=group.id, user_id=user.id)
     if user_group:
         return json({"error": f"User is already in the Group"}, status=400)
 
     user_group = await UserAndGroup.create(user=user, group=group)
+    after_commit(partial(principal_cache.invalidate, user.id))
 
     return json(user_group.to_dict(), status=201)
 
@@ -198,25 +210,18 @@ async def remove_user_from_group(request: Request, my_user: User, group: Group|N
     if not group:
         return json({"error": f"Group not found"}, status=404)
 
-    user_and_group = await UserAndGroup.get_or_none(group=group, user=user).prefetch_related("user_group_permissions")
+    user_and_group = await UserAndGroup.get_or_none_cached(group_id=group.id, user_id=user.id)
 
     if user_and_group:
         if my_user.owner or my_user.id == user.id:
             await user_and_group.delete()
+            after_commit(partial(principal_cache.invalidate, user.id))
             return json({"message": f"User was from Group successfully removed"})
-        my_user_and_group = await UserAndGroup.get_or_none(group=group, user=my_user).prefetch_related("user_group_permissions")
-        if my_user_and_group:
-            for permission in user_and_group.user_group_permissions:
-                if permission.permission in [UserGroupPermissionEnum.ADMIN]: 
-                    return json({"error": f"You are not allowed to access this enpoint."}, status=403)
-            for permission in user_and_group.user_group_permissions:
-                if permission.permission in [UserGroupPermissionEnum.MANAGE_USERS]:
-                    for my_permission in my_user_and_group.user_group_permissions:
-                        if my_permission.permission in [UserGroupPermissionEnum.ADMIN]:
-                            await user_and_group.delete()
-                            return json({"message": f"User was from Group successfully removed"})
-            else:
+        my_membership = await principal_cache.get_membership(my_user.id, group.id)
+        if my_membership and not user_and_group.has_permission(UserGroupPermissionEnum.ADMIN):
+            if not user_and_group.has_permission(UserGroupPermissionEnum.MANAGE_USERS) or my_membership.has_permission(UserGroupPermissionEnum.ADMIN):
                 await user_and_group.delete()
+                after_commit(partial(principal_cache.invalidate, user.id))
                 return json({"message": f"User was from Group successfully removed"})
         return json({"error": f"You are not allowed to access this enpoint."}, status=403)
     else:
@@ -240,33 +245,17 @@ async def add_group_user_permission(request: Request, my_user: User, group: Grou
     data = filter_dict_by_keys(request.json, ["permission"], True)
     data_permission = UserGroupPermissionEnum(data.get("permission"))
 
-    user_and_group = await UserAndGroup.get_or_none(group=group, user=user).prefetch_related("user_group_permissions")
+    user_and_group = await UserAndGroup.get_or_none_cached(group_id=group.id, user_id=user.id)
 
     if user_and_group:
-
-        user_group_permission = await UserGroupPermission.get_or_none(user_and_group_id=user_and_group.id, permission=data_permission)
-        if user_group_permission:
+        if user_and_group.has_permission(data_permission):
             return json({"error": f"User has permission allready"}, status=400)
 
-        my_user_and_group = await UserAndGroup.get_or_none(group=group, user=my_user).prefetch_related("user_group_permissions")
-
-
-        if my_user.owner:
-            user_group_permission = await UserGroupPermission.create(user_and_group_id=user_and_group.id, permission=data_permission)
+        my_membership = await principal_cache.get_membership(my_user.id, group.id)
+        if my_user.owner or (my_membership and my_membership.can_manage_permission(data_permission)):
+            user_group_permission = await user_and_group.add_permission(data_permission)
+            after_commit(partial(principal_cache.invalidate, user.id))
             return json(user_group_permission.to_dict())
-        if my_user_and_group:
-            if data_permission == UserGroupPermissionEnum.ADMIN:
-                pass
-            if data_permission == UserGroupPermissionEnum.MANAGE_USERS:
-                for permission in my_user_and_group.user_group_permissions:
-                    if permission.permission in [UserGroupPermissionEnum.ADMIN]: 
-                        user_group_permission = await UserGroupPermission.create(user_and_group_id=user_and_group.id, permission=data_permission)
-                        return json(user_group_permission.to_dict())
-            else:
-                for permission in my_user_and_group.user_group_permissions:
-                    if permission.permission in [UserGroupPermissionEnum.ADMIN, UserGroupPermissionEnum.MANAGE_USERS]: 
-                        user_group_permission = await UserGroupPermission.create(user_and_group_id=user_and_group.id, permission=data_permission)
-                        return json(user_group_permission.to_dict())
         return json({"error": f"You are not allowed to access this enpoint."}, status=403)
     else:
         return json({"error": f"User is not in the Group"}, status=400)
@@ -289,33 +278,17 @@ async def remove_group_user_permission(request: Request, my_user: User, group: G
     data = filter_dict_by_keys(request.json, ["permission"], True)
     data_permission = UserGroupPermissionEnum(data.get("permission"))
 
-    user_and_group = await UserAndGroup.get_or_none(group=group, user=user).prefetch_related("user_group_permissions")
+    user_and_group = await UserAndGroup.get_or_none_cached(group_id=group.id, user_id=user.id)
 
     if user_and_group:
-
-        user_group_permission = await UserGroupPermission.get_or_none(user_and_group_id=user_and_group.id, permission=data_permission)
-        if not user_group_permission:
+        if not user_and_group.has_permission(data_permission):
             return json({"error": f"User doesnt have permission allready"}, status=400)
 
-        my_user_and_group = await UserAndGroup.get_or_none(group=group, user=my_user).prefetch_related("user_group_permissions")
-
-
-        if my_user.owner:
-            await user_group_permission.delete()
+        my_membership = await principal_cache.get_membership(my_user.id, group.id)
+        if my_user.owner or (my_membership and my_membership.can_manage_permission(data_permission)):
+            await user_and_group.remove_permission(data_permission)
+            after_commit(partial(principal_cache.invalidate, user.id))
             return json({"message": f"UserGroupPermission deleted successfully"})
-        if my_user_and_group:
-            if data_permission == UserGroupPermissionEnum.ADMIN:
-                pass
-            if data_permission == UserGroupPermissionEnum.MANAGE_USERS:
-                for permission in my_user_and_group.user_group_permissions:
-                    if permission.permission in [UserGroupPermissionEnum.ADMIN]: 
-                        await user_group_permission.delete()
-                        return json({"message": f"UserGroupPermission deleted successfully"})
-            else:
-                for permission in my_user_and_group.user_group_permissions:
-                    if permission.permission in [UserGroupPermissionEnum.ADMIN, UserGroupPermissionEnum.MANAGE_USERS]: 
-                        await user_group_permission.delete()
-                        return json({"message": f"UserGroupPermission deleted successfully"})
         return json({"error": f"You are not allowed to access this enpoint."}, status=403)
     else:
         return json({"error": f"User is not in the Group"}, status=400)
@@ -332,8 +305,8 @@ async def get_user_groups_permissions(request: Request, my_user: User, group: Gr
         return json({"error": f"Group not found"}, status=404)
     
 
-    user_and_group = await UserAndGroup.get_or_none(user_id= user.id, group_id=group.id).prefetch_related("user_group_permissions")
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id= user.id, group_id=group.id)
     if user_and_group:
-        return json([user_group_permission.permission for user_group_permission in user_and_group.user_group_permissions])
+        return json(await user_and_group.granted_permissions())
     else:
-        return json({"error": f"User is not in the Group"}, status=400)
\ No newline at end of file
+        return json({"error": f"User is not in the Group"}, status=400)
@@ -5,7 +5,7 @@ from sanic.response import json
 from sanic_jwt import protected
 from tortoise.transactions import atomic
 from app.db.models import Invite, User
-from app.utils.decorators import check_for_permission
+from app.utils.decorators import check_for_permission, read_write
 from app.utils.types import UserGroupPermissionEnum
 from app.utils.tools import filter_dict_by_keys
 
@@ -14,6 +14,7 @@ invites = Blueprint("invites", url_prefix="/invites")
 @invites.route("/", methods=["GET"], name="get_invites")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_INVITES])
+@read_write
 async def get_invites(request: Request, my_user: User):
     await Invite.delete_expired()
     invites = await Invite.filter(expiration_date__gte=date.today())
@@ -23,6 +24,7 @@ async def get_invites(request: Request, my_user: User):
 @invites.route("/<invite_id:int>", methods=["GET"], name="get_invite")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_INVITES])
+@read_write
 async def get_invite(request: Request, my_user: User, invite: Invite|None):
     if invite and not invite.is_expired():
         return json(invite.to_dict())
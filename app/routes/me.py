@@ -1,15 +1,18 @@
-import imghdr
-from io import BytesIO
-import os
-from sanic import Blueprint, file
+from functools import partial
+from typing import List, Tuple
+from sanic import Blueprint
 from sanic_jwt import protected
 from sanic.request import Request
 from sanic.response import json
-from tortoise.transactions import atomic
 from tortoise import connections
+from app.db.dialect import DIALECTS, SqliteDialect, get_dialect
 from app.db.models import Event, EventOption, Group, User, UserAndGroup, UserEventOptionResponse
+from app.db.shards import in_shards, shard_router, sharding_enabled
+from app.db.transactions import after_commit, atomic
+from app.utils import settings
+from app.utils.avatars import AvatarBusy, AvatarError, avatar_response, remove_avatar
+from app.utils.cache import principal_cache
 from app.utils.tools import filter_dict_by_keys
-from PIL import Image
 
 from app.utils.types import EventStateEnum
 
@@ -36,6 +39,7 @@ async def update_me(request: Request, my_user: User):
 
     await my_user.update_from_dict(data)
     await my_user.save()
+    after_commit(partial(principal_cache.invalidate, my_user.id))
     return json(my_user.to_dict())
     
 
@@ -55,10 +59,11 @@ async def remove_me_from_group(request: Request, my_user: User, group: Group|Non
     if not group:
         return json({"error": f"Group not found"}, status=404)
 
-    user_and_group = await UserAndGroup.get_or_none(group=group, user=my_user)
+    user_and_group = await UserAndGroup.get_or_none_cached(group_id=group.id, user_id=my_user.id)
 
     if user_and_group:
         await user_and_group.delete()
+        after_commit(partial(principal_cache.invalidate, my_user.id))
         return json({"message": f"User was from Group successfully removed."})
     else:
         return json({"error": f"User is not in the Group"}, status=400)
@@ -80,14 +85,13 @@ async def get_me_groups_permissions(request: Request, my_user: User, group: Grou
 @me.route("/avatar", methods=["GET"], name="get_avatar")
 @protected()
 async def get_avatar(request: Request, my_user: User):
-    avatar_path = f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}/avatar.webp"
-    if os.path.isfile(avatar_path):
-        try:
-            return await file(avatar_path)
-        except FileNotFoundError:
-            return json({"error": "Avatar not found"}, status=404)
-    else:
-        return json({"error": "Avatar file not found"}, status=404)
+    return await avatar_response(request, my_user)
+
+
+async def set_avatar_version(user: User, version: str|None):
+    user.avatar_version = version
+    await user.save(update_fields=["avatar_version"])
+    after_commit(partial(principal_cache.invalidate, user.id))
 
 
 @me.route("/avatar", methods=["POST"], name="upload_avatar")
@@ -97,20 +101,16 @@ async def upload_avatar(request: Request, my_user: User):
         uploaded_files = request.files
         if "avatar" in uploaded_files:
             avatar_file = uploaded_files["avatar"][0]
-            
-            # Check if the uploaded file is an image
-            image_type = imghdr.what(None, avatar_file.body)
-            if image_type:
-                os.makedirs(f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}", exist_ok=True)
-                avatar_path = f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}/avatar.webp"
-
-                # Convert the image to WebP format with alpha channel
-                with Image.open(BytesIO(avatar_file.body)) as img:
-                    img.save(avatar_path, 'WEBP', quality=95, lossless=True, alpha=True)
-                    
-                return json({"message": "Avatar uploaded and converted to WebP successfully"})
-            else:
-                return json({"error": "Uploaded file is not an image"}, status=400)
+            if len(avatar_file.body) > settings.AVATAR_MAX_UPLOAD_SIZE:
+                return json({"error": f"Avatar is larger than {settings.AVATAR_MAX_UPLOAD_SIZE // (1024 * 1024)} MB"}, status=413)
+            try:
+                version = await request.app.ctx.avatar_processor.process(avatar_file.body, f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}")
+            except AvatarError as e:
+                return json({"error": str(e)}, status=400)
+            except AvatarBusy:
+                return json({"error": "Too many avatar uploads, try again later"}, status=503)
+            await set_avatar_version(my_user, version)
+            return json({"message": "Avatar uploaded and converted to WebP successfully"})
         else:
             return json({"error": "Avatar file not found in the request"}, status=400)
     else:
@@ -120,114 +120,135 @@ async def upload_avatar(request: Request, my_user: User):
 @protected()
 async def delete_avatar(request: Request, my_user: User):
     if my_user:
-        avatar_path = f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}/avatar.webp"
-        if os.path.isfile(avatar_path):
-            try:
-                os.remove(avatar_path)
-                return json({"message": "Avatar deleted successfully"})
-            except Exception as e:
-                return json({"error": f"Failed to delete avatar: {str(e)}"}, status=500)
+        try:
+            removed = remove_avatar(f"{request.app.ctx.Config['Resources']['users']}/{my_user.id}")
+        except Exception as e:
+            return json({"error": f"Failed to delete avatar: {str(e)}"}, status=500)
+        if my_user.avatar_version is not None:
+            await set_avatar_version(my_user, None)
+        if removed:
+            return json({"message": "Avatar deleted successfully"})
         else:
             return json({"error": "Avatar file not found"}, status=404)
     else:
         return json({"error": f"User not found"}, status=404)
 
 
-
-@me.route("/events", methods=["GET"], name="get_me_events")
-@protected()
-async def get_me_events(request: Request, my_user: User):
-    await Event.update_state()
-
-    conn = connections.get("default")
-    query_incomplete = f"""
-        SELECT e.id, e.title, e.color, e.vote_end_date, e.description, e.state, e.choosen_event_option_id, e.group_id
+def incomplete_events_query(user_id: int, group_id: int|None = None, dialect: SqliteDialect = DIALECTS["sqlite"]) -> str:
+    group_filter = f"e.group_id = {int(group_id)} AND" if group_id is not None else ""
+    response_group_filter = f"AND ug.group_id = {int(group_id)}" if group_id is not None else ""
+    return f"""
+        SELECT e.id, e.title, e.color, {dialect.datetime_text("e.vote_end_date")} AS vote_end_date, e.description, e.state, e.choosen_event_option_id, e.group_id
         FROM events e
         JOIN user_and_groups uag ON uag.group_id = e.group_id
         WHERE
-            uag.user_id = {my_user.id} AND
+            uag.user_id = {int(user_id)} AND
+            {group_filter}
             e.state = {EventStateEnum.VOTING} AND
             (SELECT COUNT(eo.id) from event_options eo WHERE eo.event_id = e.id) 
                 >
             (SELECT COUNT(ug.id) from event_options eo
                 LEFT JOIN user_event_option_responses ueor ON ueor.event_option_id = eo.id
-                LEFT JOIN user_and_groups ug ON ug.id = ueor.user_and_group_id AND ug.user_id = {my_user.id}
-                WHERE eo.event_id = e.id)
+                LEFT JOIN user_and_groups ug ON ug.id = ueor.user_and_group_id AND ug.user_id = {int(user_id)}
+                WHERE eo.event_id = e.id {response_group_filter})
     """
-    incomplete_events = await conn.execute_query_dict(query_incomplete)
     
-    query_other = f"""
+
+def other_events_query(user_id: int, group_id: int|None = None, dialect: SqliteDialect = DIALECTS["sqlite"]) -> str:
+    group_filter = f"AND e.group_id = {int(group_id)}" if group_id is not None else ""
+    return f"""
         SELECT e.id AS event_id,
             e.title,
             e.color,
-            e.vote_end_date,
+            {dialect.datetime_text("e.vote_end_date")} AS vote_end_date,
             e.description,
             e.state,
             e.group_id,
             e.choosen_event_option_id,
-            eo.date AS event_option_date
+            {dialect.date_text("eo.date")} AS event_option_date
         FROM events e
         JOIN event_options eo ON e.choosen_event_option_id = eo.id
         JOIN user_and_groups ug ON e.group_id = ug.group_id
         WHERE e.choosen_event_option_id IS NOT NULL
-        AND (DATE(eo.date) >= DATE('now', 'start of month')
-            AND DATE(eo.date) <= DATE('now', 'start of month', '+1 month'))
-        AND ug.user_id = {my_user.id}
+        AND (DATE(eo.date) >= {dialect.start_of_month()}
+            AND DATE(eo.date) <= {dialect.start_of_month("+1 month")})
+        AND ug.user_id = {int(user_id)} {group_filter}
         ORDER BY eo.date;
     """
-    other_events = await conn.execute_query_dict(query_other)
+
+
+def incomplete_votes_query(user_id: int, group_id: int|None = None, dialect: SqliteDialect = DIALECTS["sqlite"]) -> str:
+    group_filter = f"AND v.group_id = {int(group_id)}" if group_id is not None else ""
+    response_group_filter = f"AND ug.group_id = {int(group_id)}" if group_id is not None else ""
+    return f"""
+        SELECT v.id, v.title, CAST(v.multi_select AS INTEGER) AS multi_select, v.group_id
+        FROM votes v
+        JOIN user_and_groups uag ON uag.group_id = v.group_id
+        WHERE
+            v.created >= {dialect.now("-7 days")} AND
+            uag.user_id = {int(user_id)}
+            {group_filter}
+            AND NOT EXISTS (
+                SELECT 1
+                FROM vote_options vo
+                JOIN user_vote_option_responses uvor ON uvor.vote_option_id = vo.id
+                JOIN user_and_groups ug ON ug.id = uvor.user_and_group_id
+                WHERE vo.vote_id = v.id
+                {response_group_filter}
+                AND ug.user_id = {int(user_id)}
+            );
+    """
+
+
+def other_votes_query(user_id: int, group_id: int|None = None, dialect: SqliteDialect = DIALECTS["sqlite"]) -> str:
+    group_filter = f"AND ug.group_id = {int(group_id)}" if group_id is not None else ""
+    return f"""
+        SELECT v.id, v.title, CAST(v.multi_select AS INTEGER) AS multi_select, v.group_id
+        FROM votes v
+        JOIN user_and_groups ug ON v.group_id = ug.group_id
+        JOIN vote_options vo ON vo.vote_id = v.id
+        LEFT JOIN user_vote_option_responses uvor ON vo.id = uvor.vote_option_id AND ug.id = uvor.user_and_group_id
+        WHERE ug.user_id = {int(user_id)} {group_filter} AND uvor.id IS NOT NULL
+    """
+
+
+async def run_me_queries(user_id: int, group_id: int|None, incomplete_query, other_query) -> Tuple[List[dict], List[dict]]:
+    conn = connections.get("default")
+    dialect = get_dialect(conn)
+    incomplete = await conn.execute_query_dict(incomplete_query(user_id, group_id, dialect=dialect))
+    other = await conn.execute_query_dict(other_query(user_id, group_id, dialect=dialect))
+    return incomplete, other
+
+
+async def run_me_queries_in_shards(user_id: int, incomplete_query, other_query) -> Tuple[List[dict], List[dict]]:
+    # Every group has its own database, query the user's groups concurrently and concatenate.
+    group_ids = [group_id for group_id in await UserAndGroup.filter(user_id=user_id).values_list("group_id", flat=True) if shard_router.exists(group_id)]
+    results = await in_shards(group_ids, lambda group_id: run_me_queries(user_id, group_id, incomplete_query, other_query))
+    return [row for incomplete, _ in results for row in incomplete], [row for _, other in results for row in other]
+
+
+@me.route("/events", methods=["GET"], name="get_me_events")
+@protected()
+async def get_me_events(request: Request, my_user: User):
+    if sharding_enabled():
+        incomplete_events, other_events = await run_me_queries_in_shards(my_user.id, incomplete_events_query, other_events_query)
+        other_events.sort(key=lambda event: event["event_option_date"])
+    else:
+        incomplete_events, other_events = await run_me_queries(my_user.id, None, incomplete_events_query, other_events_query)
     return json({"incomplete_events":incomplete_events, "other_events":other_events})
 
 
 @me.route("/group/<group_id:int>/events", methods=["GET"], name="get_me_group_events")
 @protected()
-@atomic()
 async def get_me_group_events(request: Request, my_user: User, group: Group|None):
     
     if not group:
         return json({"error": f"Group not found"}, status=404)
-
-    await Event.update_state()
     
     conn = connections.get("default")
-
-    query_incomplete = f"""
-    SELECT e.id, e.title, e.color, e.vote_end_date, e.description, e.state, e.choosen_event_option_id, e.group_id
-        FROM events e
-        JOIN user_and_groups uag ON uag.group_id = e.group_id
-        WHERE
-            uag.user_id = {my_user.id} AND
-            e.group_id = {group.id} AND
-            e.state = {EventStateEnum.VOTING} AND
-            (SELECT COUNT(eo.id) from event_options eo WHERE eo.event_id = e.id) 
-                >
-            (SELECT COUNT(ug.id) from event_options eo
-                LEFT JOIN user_event_option_responses ueor ON ueor.event_option_id = eo.id
-                LEFT JOIN user_and_groups ug ON ug.id = ueor.user_and_group_id AND ug.user_id = {my_user.id}
-                WHERE eo.event_id = e.id AND ug.group_id = {group.id})
-    """
-    incomplete_events = await conn.execute_query_dict(query_incomplete)
-    
-    query_other = f"""
-    SELECT e.id AS event_id,
-            e.title,
-            e.color,
-            e.vote_end_date,
-            e.description,
-            e.state,
-            e.group_id,
-            e.choosen_event_option_id,
-            eo.date AS event_option_date
-        FROM events e
-        JOIN event_options eo ON e.choosen_event_option_id = eo.id
-        JOIN user_and_groups ug ON e.group_id = ug.group_id
-        WHERE e.choosen_event_option_id IS NOT NULL
-        AND (DATE(eo.date) >= DATE('now', 'start of month')
-            AND DATE(eo.date) <= DATE('now', 'start of month', '+1 month'))
-        AND ug.user_id = {my_user.id} AND e.group_id = {group.id}
-        ORDER BY eo.date;
-    """
-    other_events = await conn.execute_query_dict(query_other)
+    dialect = get_dialect(conn)
+    incomplete_events = await conn.execute_query_dict(incomplete_events_query(my_user.id, group.id, dialect=dialect))
+    other_events = await conn.execute_query_dict(other_events_query(my_user.id, group.id, dialect=dialect))
     
     return json({"incomplete_events":incomplete_events, "other_events":other_events})
 
@@ -235,77 +256,24 @@ async def get_me_group_events(request: Request, my_user: User, group: Group|None
 @me.route("/votes", methods=["GET"], name="get_me_votes")
 @protected()
 async def get_me_votes(request: Request, my_user: User):
-    conn = connections.get("default")
-    query_incomplete = f"""
-        SELECT v.id, v.title, v.multi_select, v.group_id
-        FROM votes v
-        JOIN user_and_groups uag ON uag.group_id = v.group_id
-        WHERE
-            v.created >= datetime('now', '-7 days') AND
-            uag.user_id = {my_user.id}
-            AND NOT EXISTS (
-                SELECT 1
-                FROM vote_options vo
-                JOIN user_vote_option_responses uvor ON uvor.vote_option_id = vo.id
-                JOIN user_and_groups ug ON ug.id = uvor.user_and_group_id
-                WHERE vo.vote_id = v.id
-                AND ug.user_id = {my_user.id}
-            );
-    """
-    incomplete_votes = await conn.execute_query_dict(query_incomplete)
-    
-    query_other = f"""
-        SELECT v.id, v.title, v.multi_select, v.group_id
-        FROM votes v
-        JOIN groups g ON v.group_id = g.id
-        JOIN user_and_groups ug ON g.id = ug.group_id
-        JOIN vote_options vo ON vo.vote_id = v.id
-        LEFT JOIN user_vote_option_responses uvor ON vo.id = uvor.vote_option_id AND ug.id = uvor.user_and_group_id
-        WHERE ug.user_id = {my_user.id} AND uvor.id IS NOT NULL
-    """
-    other_votes = await conn.execute_query_dict(query_other)
+    if sharding_enabled():
+        incomplete_votes, other_votes = await run_me_queries_in_shards(my_user.id, incomplete_votes_query, other_votes_query)
+    else:
+        incomplete_votes, other_votes = await run_me_queries(my_user.id, None, incomplete_votes_query, other_votes_query)
     return json({"incomplete_votes":incomplete_votes, "other_votes":other_votes})
 
 
 @me.route("/group/<group_id:int>/votes", methods=["GET"], name="get_me_group_votes")
 @protected()
-@atomic()
 async def get_me_group_votes(request: Request, my_user: User, group: Group|None):
     
     if not group:
         return json({"error": f"Group not found"}, status=404)
 
     conn = connections.get("default")
-
-    query_incomplete = f"""
-    SELECT v.id, v.title, v.multi_select, v.group_id
-    FROM votes v
-    JOIN user_and_groups uag ON uag.group_id = v.group_id
-    WHERE
-        v.created >= datetime('now', '-7 days') AND
-        uag.user_id = {my_user.id}
-        AND v.group_id = {group.id}
-        AND NOT EXISTS (
-            SELECT 1
-            FROM vote_options vo
-            JOIN user_vote_option_responses uvor ON uvor.vote_option_id = vo.id
-            JOIN user_and_groups ug ON ug.id = uvor.user_and_group_id
-            WHERE vo.vote_id = v.id
-            AND ug.group_id = {group.id}
-            AND ug.user_id = {my_user.id}
-        );
-    """
-    incomplete_votes = await conn.execute_query_dict(query_incomplete)
-    
-    query_other = f"""
-    SELECT v.id, v.title, v.multi_select, v.group_id
-    FROM votes v
-    JOIN user_and_groups ug ON v.group_id = ug.group_id
-    JOIN vote_options vo ON vo.vote_id = v.id
-    LEFT JOIN user_vote_option_responses uvor ON vo.id = uvor.vote_option_id AND ug.id = uvor.user_and_group_id
-    WHERE ug.user_id = {my_user.id} AND ug.group_id = {group.id} AND uvor.id IS NOT NULL
-    """
-    other_votes = await conn.execute_query_dict(query_other)
+    dialect = get_dialect(conn)
+    incomplete_votes = await conn.execute_query_dict(incomplete_votes_query(my_user.id, group.id, dialect=dialect))
+    other_votes = await conn.execute_query_dict(other_votes_query(my_user.id, group.id, dialect=dialect))
     
     return json({"incomplete_votes":incomplete_votes, "other_votes":other_votes})
 
@@ -318,8 +286,8 @@ async def get_me_group_permissions(request: Request, my_user: User, group: Group
         return json({"error": f"Group not found"}, status=404)
     
 
-    user_and_group = await UserAndGroup.get_or_none(user_id= my_user.id, group_id=group.id).prefetch_related("user_group_permissions")
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id= my_user.id, group_id=group.id)
     if user_and_group:
-        return json([user_group_permission.permission for user_group_permission in user_and_group.user_group_permissions])
+        return json(await user_and_group.granted_permissions())
     else:
         return json({"error": f"User is not in the Group"}, status=400)
@@ -0,0 +1,23 @@
+from sanic import Blueprint
+from sanic_jwt import protected
+from sanic.request import Request
+from sanic.response import json
+from app.db.models import User
+from app.utils.cache import principal_cache
+from app.utils.dataloader import loader_stats
+from app.utils.decorators import is_owner
+
+stats = Blueprint("stats", url_prefix="/stats")
+
+
+@stats.route("/", methods=["GET"], name="get_stats")
+@protected()
+@is_owner
+async def get_stats(request: Request, my_user: User):
+    write_queue = getattr(request.app.ctx, "write_queue", None)
+    return json({
+        "principal_cache": principal_cache.stats(),
+        "dataloader": loader_stats(),
+        "write_queue": write_queue.stats() if write_queue else None,
+        "message_buffer": request.app.ctx.message_buffer.stats(),
+    })
@@ -28,7 +28,9 @@ async def update_user_event_option_response(request: Request, my_user: User, use
     if user_event_option_response:
         await user_event_option_response.fetch_related("user_and_group")
         if user_event_option_response.user_and_group.user_id == my_user.id:
-            event_option = await EventOption.get(id=user_event_option_response.event_option_id).prefetch_related("event")
+            await user_event_option_response.fetch_related("event_option")
+            event_option = user_event_option_response.event_option
+            await event_option.fetch_related("event")
             if event_option.event.state != EventStateEnum.VOTING:
                 return json({"error": f"The Voting period is over."}, status=403)
             await user_event_option_response.update_from_dict(filter_dict_by_keys(request.json,["response", "reason"]))
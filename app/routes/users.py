@@ -1,11 +1,14 @@
-import os
-from sanic import Blueprint, file
+from functools import partial
+from sanic import Blueprint
 from sanic_jwt import protected
 from sanic.request import Request
-from sanic.response import json 
-from tortoise.transactions import atomic
+from sanic.response import json, redirect
 from app.db.models import User
+from app.db.transactions import after_commit, atomic
+from app.utils.avatars import avatar_response
+from app.utils.cache import principal_cache
 from app.utils.decorators import is_owner
+from app.utils.serialization import parse_fields, serialize
 
 users = Blueprint("users", url_prefix="/users")
 
@@ -15,7 +18,7 @@ users = Blueprint("users", url_prefix="/users")
 @is_owner
 async def get_users(request: Request, my_user: User):
     users = await User.all()
-    return json([user.to_dict() for user in users])
+    return json(serialize(users, parse_fields(request.args.get("fields"))))
 
 
 @users.route("/<user_id:int>", methods=["GET"], name="get_user")
@@ -35,6 +38,7 @@ async def delete_user(request: Request, my_user: User, user: User|None):
     if user:
         if not user.owner:
             await user.delete()
+            after_commit(partial(principal_cache.invalidate, user.id))
             return json({"message": f"User deleted successfully"})
         return json({"error": f"User cant be deleted"}, status=400)
     else:
@@ -45,16 +49,21 @@ async def delete_user(request: Request, my_user: User, user: User|None):
 @protected()
 async def get_avatar(request: Request, my_user: User, user: User|None):
     if user:
-        avatar_path = f"{request.app.ctx.Config['Resources']['users']}/{user.id}/avatar.webp"
-        if os.path.isfile(avatar_path):
-            try:
-                return await file(avatar_path)
-            except FileNotFoundError:
-                return json({"error": "Avatar not found"}, status=404)
-        else:
-            return json({"error": "Avatar file not found"}, status=404)
+        return await avatar_response(request, user)
     else:
         return json({"error": f"User not found"}, status=404)
+
+
+@users.route("/<user_id:int>/avatar/<version:str>", methods=["GET"], name="get_versioned_avatar")
+@protected()
+async def get_versioned_avatar(request: Request, my_user: User, user: User|None, version: str):
+    # The URL for the avatar_version in to_dict(), cached by the client for good.
+    if not user:
+        return json({"error": f"User not found"}, status=404)
+    if user.avatar_version is not None and version != user.avatar_version:
+        # Relative to the current URL, only the version changes.
+        return redirect(user.avatar_version + (f"?{request.query_string}" if request.query_string else ""))
+    return await avatar_response(request, user, immutable=True)
     
 
 @users.route("/<user_id:int>/groups", methods=["GET"], name="get_user_groups")
@@ -66,4 +75,4 @@ async def get_user_groups(request: Request, my_user: User, user: User|None):
     
     await user.fetch_related("groups")
     
-    return json([group.to_dict() for group in user.groups])
\ No newline at end of file
+    return json(serialize(list(user.groups), parse_fields(request.args.get("fields"))))
\ No newline at end of file
@@ -3,10 +3,9 @@ from sanic_jwt import protected
 from sanic.request import Request
 from sanic.response import json
 from tortoise.transactions import atomic
-from tortoise import connections
 from app.db.models import VoteOption, User, UserAndGroup, UserVoteOptionResponse
 from app.utils.tools import filter_dict_by_keys
-from app.utils.decorators import check_for_permission
+from app.utils.decorators import check_for_permission, serialized_write
 from app.utils.types import UserGroupPermissionEnum
 
 vote_options = Blueprint("vote_options", url_prefix="/vote_options")
@@ -69,24 +68,11 @@ async def create_user_vote_option_response(request: Request, my_user: User, vote
     if not vote_option:
         return json({"error": f"VoteOption not found"}, status=404)
     
-    await vote_option.fetch_related("vote")
-    user_and_group = await UserAndGroup.get_or_none(user_id=my_user.id, group_id=vote_option.vote.group_id)
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id=my_user.id, group_id=vote_option.group_id)
     if not user_and_group:
         return json({"error": f"User is not in Group"}, status=404)
 
-    conn = connections.get("default")
-    delete_incomplete = f"""
-    DELETE FROM user_vote_option_responses AS uvor
-    WHERE uvor.user_and_group_id = {user_and_group.id} AND uvor.vote_option_id IN (
-        SELECT vo.id
-        FROM vote_options AS vo
-        INNER JOIN votes AS v ON v.id = {vote_option.vote_id}
-        WHERE vo.vote_id == {vote_option.vote_id}
-        AND v.multi_select = 0
-    );
-    """
-
-    await conn.execute_query(delete_incomplete)
+    await UserVoteOptionResponse.delete_single_select(vote_option.vote_id, user_and_group.id)
 
     user_vote_option_response = await UserVoteOptionResponse.get_or_none(vote_option_id=vote_option.id, user_and_group_id=user_and_group.id)
     if user_vote_option_response:
@@ -94,7 +80,8 @@ async def create_user_vote_option_response(request: Request, my_user: User, vote
     else:
         user_vote_option_response = await UserVoteOptionResponse.create(
             vote_option=vote_option,
-            user_and_group=user_and_group
+            user_and_group=user_and_group,
+            group_id=user_and_group.group_id
         )
     return json(user_vote_option_response.to_dict(), status=201)
 
@@ -108,8 +95,7 @@ async def delete_user_vote_option_response(request: Request, my_user: User, vote
     if not vote_option:
         return json({"error": f"VoteOption not found"}, status=404)
     
-    await vote_option.fetch_related("vote")
-    user_and_group = await UserAndGroup.get_or_none(user_id=my_user.id, group_id=vote_option.vote.group_id)
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id=my_user.id, group_id=vote_option.group_id)
     if not user_and_group:
         return json({"error": f"User is not in Group"}, status=404)
 
@@ -124,14 +110,13 @@ async def delete_user_vote_option_response(request: Request, my_user: User, vote
 @vote_options.route("/<vote_option_id:int>/user_vote_option_response/toggel", methods=["POST"], name="create_user_vote_option_response_toggel")
 @protected()
 @check_for_permission()
-@atomic()
+@serialized_write()
 async def create_user_vote_option_response_toggel(request: Request, my_user: User, vote_option: VoteOption|None):
 
     if not vote_option:
         return json({"error": f"VoteOption not found"}, status=404)
     
-    await vote_option.fetch_related("vote")
-    user_and_group = await UserAndGroup.get_or_none(user_id=my_user.id, group_id=vote_option.vote.group_id)
+    user_and_group = await UserAndGroup.get_or_none_cached(user_id=my_user.id, group_id=vote_option.group_id)
     if not user_and_group:
         return json({"error": f"User is not in Group"}, status=404)
 
@@ -140,20 +125,10 @@ async def create_user_vote_option_response_toggel(request: Request, my_user: Use
         await user_vote_option_response.delete()
         return json({"message": f"UserVoteOptionResponse deleted successfully"}, status=201)
     else:
-        conn = connections.get("default")
-        delete_incomplete = f"""
-        DELETE FROM user_vote_option_responses AS uvor
-        WHERE uvor.user_and_group_id = {user_and_group.id} AND uvor.vote_option_id IN (
-            SELECT vo.id
-            FROM vote_options AS vo
-            INNER JOIN votes AS v ON v.id = {vote_option.vote_id}
-            WHERE vo.vote_id == {vote_option.vote_id}
-            AND v.multi_select = 0
-        );
-        """
-        await conn.execute_query(delete_incomplete)
+        await UserVoteOptionResponse.delete_single_select(vote_option.vote_id, user_and_group.id)
         user_vote_option_response = await UserVoteOptionResponse.create(
             vote_option=vote_option,
-            user_and_group=user_and_group
+            user_and_group=user_and_group,
+            group_id=user_and_group.group_id
         )
         return json(user_vote_option_response.to_dict(), status=201)
\ No newline at end of file
@@ -28,6 +28,17 @@ async def get_vote(request: Request, my_user: User, vote: Vote|None):
         return json({"error": "Vote not found"}, status=404)
 
 
+@votes.route("/<vote_id:int>/results", methods=["GET"], name="get_vote_results")
+@protected()
+@check_for_permission()
+async def get_vote_results(request: Request, my_user: User, vote: Vote|None):
+    if vote:
+        vote_options = await VoteOption.filter(vote_id=vote.id).order_by("id").values("id", "title", "response_count")
+        return json({"vote_id": vote.id, "vote_options": vote_options})
+    else:
+        return json({"error": "Vote not found"}, status=404)
+
+
 @votes.route("/<vote_id:int>", methods=["PUT"], name="update_vote")
 @protected()
 @check_for_permission([UserGroupPermissionEnum.MANAGE_VOTES])
@@ -70,7 +81,7 @@ async def get_vote_vote_options(request: Request, my_user: User, vote: Vote|None
 async def create_vote_vote_options(request: Request, my_user: User, vote: Vote|None):
     if vote:
         data = filter_dict_by_keys(request.json,["title"])
-        vote_option = await VoteOption.create(vote_id=vote.id, **data)
+        vote_option = await VoteOption.create(vote_id=vote.id, group_id=vote.group_id, **data)
         return json(vote_option.to_dict())
     else:
         return json({"error": "Vote not found"}, status=404)
\ No newline at end of file
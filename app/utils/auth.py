@@ -1,6 +1,7 @@
 from sanic import Request
 from sanic_jwt import exceptions
 from app.db.models import Invite, User, UserAndGroup
+from app.utils.cache import principal_cache
 from sanic.response import json
 from sanic_jwt import BaseEndpoint
 
@@ -58,8 +59,7 @@ class Logout(BaseEndpoint):
 
 async def retrieve_user(request, payload, *args, **kwargs):
     if payload:
-        user = await User.get_or_none(id=payload.get('id', None))
-        return user
+        return await principal_cache.get_user(payload.get('id', None))
     else:
         return None
 
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Sequence, Tuple
+from PIL import Image, ImageOps
+from sanic.request import Request
+from sanic.response import HTTPResponse, json, raw
+from app.utils import settings
+
+
+class AvatarError(Exception):
+    """The upload can't be used as an avatar, the message is meant for the client."""
+
+
+class AvatarBusy(Exception):
+    pass
+
+
+def content_version(data: bytes) -> str:
+    # Short content hash, changes whenever the bytes do.
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def avatar_path(directory: str, size: int|None = None) -> str:
+    # Without a size, the full resolution avatar.webp stored before there were thumbnails.
+    return f"{directory}/avatar_{size}.webp" if size else f"{directory}/avatar.webp"
+
+
+def pick_size(requested: int|None, sizes: Sequence[int] = settings.AVATAR_SIZES) -> int:
+    # The smallest thumbnail at least as large as requested, the largest one by default.
+    for size in sorted(sizes):
+        if requested is not None and size >= requested:
+            return size
+    return max(sizes)
+
+
+def find_avatar(directory: str, requested: int|None = None) -> str|None:
+    for path in (avatar_path(directory, pick_size(requested)), avatar_path(directory)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_avatar(directory: str, requested: int|None = None) -> bytes|None:
+    path = find_avatar(directory, requested)
+    if path is None:
+        return None
+    with open(path, "rb") as avatar:
+        return avatar.read()
+
+
+def remove_avatar(directory: str) -> bool:
+    removed = False
+    for path in [avatar_path(directory, size) for size in settings.AVATAR_SIZES] + [avatar_path(directory)]:
+        if os.path.isfile(path):
+            os.remove(path)
+            removed = True
+    return removed
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers see the old file or the new one, never a partly written one.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            output.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def process_avatar(data: bytes, directory: str, sizes: Sequence[int], max_dimension: int, quality: int) -> str:
+    """Decodes an upload, writes a lossy WebP thumbnail for every size into directory
+    and returns the content_version() of the result. Runs in a worker process."""
+    thumbnails: Dict[int, bytes] = {}
+    try:
+        with Image.open(BytesIO(data)) as image:
+            if max(image.size) > max_dimension:
+                raise AvatarError(f"Image is larger than {max_dimension}x{max_dimension} pixels")
+            # Lets JPEG decode at a fraction of its resolution.
+            image.draft("RGB", (max(sizes), max(sizes)))
+            image = ImageOps.exif_transpose(image).convert("RGBA")
+            for size in sorted(sizes, reverse=True):
+                image.thumbnail((size, size), Image.LANCZOS)
+                thumbnail = BytesIO()
+                image.save(thumbnail, "WEBP", quality=quality)
+                thumbnails[size] = thumbnail.getvalue()
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        raise AvatarError("Uploaded file is not an image") from e
+
+    os.makedirs(directory, exist_ok=True)
+    for size, thumbnail in thumbnails.items():
+        _write_atomic(avatar_path(directory, size), thumbnail)
+    if os.path.isfile(avatar_path(directory)):
+        os.remove(avatar_path(directory))
+    return content_version(b"".join(thumbnails[size] for size in sorted(thumbnails)))
+
+
+class AvatarProcessor:
+    """Runs process_avatar() in a pool of worker processes, so decoding and encoding
+    images never blocks the event loop. At most max_pending uploads are processed or
+    waiting for a worker, process() raises AvatarBusy beyond that."""
+
+    def __init__(self, workers: int = settings.AVATAR_WORKERS, max_pending: int = settings.AVATAR_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool: ProcessPoolExecutor|None = None
+
+    def start(self):
+        self._pool = ProcessPoolExecutor(self.workers)
+
+    async def stop(self):
+        if self._pool:
+            await asyncio.get_running_loop().run_in_executor(None, self._pool.shutdown)
+            self._pool = None
+
+    async def process(self, data: bytes, directory: str) -> str:
+        if self.pending >= self.max_pending:
+            raise AvatarBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, process_avatar, data, directory, settings.AVATAR_SIZES, settings.AVATAR_MAX_DIMENSION, settings.AVATAR_QUALITY
+            )
+        finally:
+            self.pending -= 1
+
+
+class AvatarCache:
+    """The bytes of the most recently served avatar files, up to max_bytes in total.
+
+    Entries are keyed by the avatar version, so a new upload is never answered from
+    the cache with the old image, the entries of replaced avatars just age out. Misses
+    are read in the default executor, the event loop doesn't wait for the disk."""
+
+    def __init__(self, max_bytes: int = settings.AVATAR_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, int], bytes]" = OrderedDict()
+
+    async def get(self, directory: str, version: str, size: int) -> bytes|None:
+        key = (directory, version, size)
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+        self.misses += 1
+        body = await asyncio.get_running_loop().run_in_executor(None, read_avatar, directory, size)
+        if body is None:
+            return None
+        if key in self._entries:
+            # Read by a concurrent miss as well.
+            return body
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+        return body
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+avatar_cache = AvatarCache()
+
+# Versioned URLs never change their content, the others are revalidated with the ETag.
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+
+async def avatar_response(request: Request, user, immutable: bool = False) -> HTTPResponse:
+    """The avatar of the user in the ?size= asked for, 304 if the client's copy is current."""
+    try:
+        size = pick_size(int(request.args.get("size")) if request.args.get("size") else None)
+    except ValueError:
+        return json({"error": "Invalid size"}, status=400)
+    if user.avatar_version is None:
+        return json({"error": "Avatar file not found"}, status=404)
+
+    etag = f'"{user.avatar_version}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE if immutable else REVALIDATE}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))):
+        return HTTPResponse(status=304, headers=headers)
+
+    body = await avatar_cache.get(f"{request.app.ctx.Config['Resources']['users']}/{user.id}", user.avatar_version, size)
+    if body is None:
+        return json({"error": "Avatar file not found"}, status=404)
+    return raw(body, content_type="image/webp", headers=headers)
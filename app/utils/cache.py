@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from app.db.models import User, UserAndGroup
+from app.utils import settings
+from app.utils.dataloader import copy_instance
+from app.utils.types import UserGroupPermissionEnum
+
+
+class Membership:
+    __slots__ = ("user_and_group_id", "permissions")
+
+    def __init__(self, user_and_group_id: int, permissions: int):
+        self.user_and_group_id = user_and_group_id
+        self.permissions = permissions
+
+    def has_permission(self, *permissions: UserGroupPermissionEnum) -> bool:
+        return any(self.permissions & permission.bit for permission in permissions)
+
+    def can_manage_permission(self, permission: UserGroupPermissionEnum) -> bool:
+        if permission == UserGroupPermissionEnum.MANAGE_USERS:
+            return self.has_permission(UserGroupPermissionEnum.ADMIN)
+        return self.has_permission(UserGroupPermissionEnum.ADMIN, UserGroupPermissionEnum.MANAGE_USERS)
+
+
+class Principal:
+    __slots__ = ("user", "memberships", "expires_at")
+
+    def __init__(self, user: User, memberships: Dict[int, Membership], expires_at: float):
+        self.user = user
+        self.memberships = memberships
+        self.expires_at = expires_at
+
+
+class PrincipalCache:
+    """User row, group memberships and permissions per user id (the JWT subject).
+
+    Entries expire after `ttl` seconds and the least recently used ones are evicted
+    beyond `maxsize`. Endpoints that change a user, a membership or a permission
+    have to call invalidate() for the affected user."""
+
+    def __init__(self, maxsize: int = settings.PRINCIPAL_CACHE_SIZE, ttl: float = settings.PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, Principal]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._generation = 0
+        # Replaced to reach the caches of the other workers, which then forget() as well.
+        self.publish: Callable[[int|None], None] = self.forget
+
+    async def get(self, user_id: int) -> Optional[Principal]:
+        principal = self._entries.get(user_id)
+        if principal and principal.expires_at > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return principal
+        self.misses += 1
+        # Concurrent misses for the same user share one load.
+        future = self._loading.get(user_id)
+        if future is None:
+            # Shared between requests, so don't let it inherit this request's connection.
+            future = self._loading[user_id] = contextvars.Context().run(asyncio.ensure_future, self._load(user_id))
+            future.add_done_callback(lambda _: self._loading.get(user_id) is future and self._loading.pop(user_id))
+        return await asyncio.shield(future)
+
+    async def _load(self, user_id: int) -> Optional[Principal]:
+        generation = self._generation
+        user = await User.load(user_id)
+        if user is None:
+            self._entries.pop(user_id, None)
+            return None
+        user_and_groups = await UserAndGroup.filter(user_id=user_id)
+        memberships = {
+            user_and_group.group_id: Membership(user_and_group.id, user_and_group.permissions)
+            for user_and_group in user_and_groups
+        }
+        principal = Principal(user, memberships, time.monotonic() + self.ttl)
+        # Don't store what was read before an invalidation happened.
+        if generation == self._generation:
+            self._entries[user_id] = principal
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return principal
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        # A copy for the handler, which may change it or fetch its relations.
+        principal = await self.get(user_id)
+        return copy_instance(principal.user) if principal else None
+
+    async def get_membership(self, user_id: int, group_id: int) -> Optional[Membership]:
+        principal = await self.get(user_id)
+        return principal.memberships.get(group_id) if principal else None
+
+    def invalidate(self, user_id: int):
+        self.publish(user_id)
+
+    def clear(self):
+        self.publish(None)
+
+    def forget(self, user_id: int|None):
+        # Only in this process, None forgets everyone.
+        self._generation += 1
+        if user_id is None:
+            self._entries.clear()
+            self._loading.clear()
+        else:
+            self._entries.pop(user_id, None)
+            self._loading.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Dict, Set
+from sanic.log import logger
+from app.utils import settings
+from app.utils.serialization import encode_frame
+
+# "Try again later", the client reconnects and reloads the history it missed.
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class ChatConnection:
+    """A chat websocket with a writer task of its own.
+
+    send() only puts the frame into a queue of at most max_queue frames, so a slow
+    client never holds up the others or the connection that sent the message. When
+    the queue is full the client is disconnected, or with policy "drop" its oldest
+    queued frame is discarded."""
+
+    def __init__(self, ws, max_queue: int = settings.CHAT_QUEUE_SIZE, policy: str = settings.CHAT_SLOW_CLIENT_POLICY):
+        self.ws = ws
+        self.subprotocol = ws.subprotocol
+        self.policy = policy
+        self.closed = False
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._task = asyncio.ensure_future(self._write())
+
+    def send(self, frame: bytes|str):
+        if self.closed:
+            return
+        if self._queue.full():
+            if self.policy != "drop":
+                logger.warning("Disconnecting a chat client that is %d frames behind", self._queue.qsize())
+                self.close(SLOW_CLIENT_CLOSE_CODE, "Too slow")
+                return
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(frame)
+
+    async def _write(self):
+        try:
+            while True:
+                frame = await self._queue.get()
+                await self.ws.send(frame)
+        except Exception:
+            # The socket is gone, the handler's recv() fails as well and leaves the room.
+            self.closed = True
+
+    def close(self, code: int = 1000, reason: str = ""):
+        if not self.closed:
+            self.closed = True
+            self._task.cancel()
+            asyncio.ensure_future(self.ws.close(code, reason))
+
+    def stop(self):
+        self.closed = True
+        self._task.cancel()
+
+
+class ChatHub:
+    """The chat connections of this worker by event id."""
+
+    def __init__(self, max_queue: int = settings.CHAT_QUEUE_SIZE, policy: str = settings.CHAT_SLOW_CLIENT_POLICY):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.rooms: Dict[int, Set[ChatConnection]] = {}
+
+    def join(self, event_id: int, ws) -> ChatConnection:
+        connection = ChatConnection(ws, self.max_queue, self.policy)
+        self.rooms.setdefault(event_id, set()).add(connection)
+        return connection
+
+    def leave(self, event_id: int, connection: ChatConnection):
+        connection.stop()
+        room = self.rooms.get(event_id)
+        if room is not None:
+            room.discard(connection)
+            if not room:
+                del self.rooms[event_id]
+
+    def broadcast(self, event_id: int, body: Any):
+        # Encoded once per subprotocol in use: JSON text or binary MessagePack.
+        frames: Dict[str|None, bytes|str] = {}
+        # A copy, a full queue can close a connection while this runs.
+        for connection in tuple(self.rooms.get(event_id, ())):
+            frame = frames.get(connection.subprotocol)
+            if frame is None:
+                frame = frames[connection.subprotocol] = encode_frame(body, connection.subprotocol)
+            connection.send(frame)
@@ -1,9 +1,12 @@
 import json
 import os
+from tortoise import connections
+from app.db.dialect import get_dialect
 from app.db.models import User
 from dotenv import load_dotenv
 from app.utils import settings
 from app.utils.tools import generate_random_hex
+from app.utils.pubsub import in_worker_process
 
 
 def load_config():
@@ -16,6 +19,10 @@ async def create_owner():
     owner = await User.exists(id=1)
     if not owner:
         await User.create(id=1, name="admin", password=User.hash_password("changeme"), owner=True)
+        conn = connections.get("default")
+        reset_sequence = get_dialect(conn).reset_sequence("users")
+        if reset_sequence:
+            await conn.execute_query(reset_sequence)
         
 def setup():
     if os.path.exists(".env"):
@@ -49,6 +56,9 @@ def setup():
     if not os.path.exists(f"{settings.TEMP}"):
         os.makedirs(f"{settings.TEMP}")
 
+    # The main process already wrote it, workers writing at the same time could truncate it under each other.
+    if in_worker_process():
+        return config
     json.dump(
         config,
         open(f"{settings.RESOURCES}/AppConfig.json", "w"),
@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+from typing import Any, Dict, List, Optional, Tuple
+from tortoise.exceptions import DoesNotExist
+from tortoise.models import Model
+from app.utils import settings
+
+
+class PrimaryKeyLoader:
+    """Collects the primary-key lookups of one model issued within the same
+    event-loop tick, across all requests, and runs them as one `WHERE id IN (...)`.
+
+    Lookups are grouped per connection, so a lookup made inside a transaction
+    never shares a query with one made outside of it, and one made on the read
+    snapshot of a GET request only with the other lookups of that request. Every
+    caller gets an instance of its own, changing it doesn't affect the others."""
+
+    def __init__(self, model_class: type, max_batch_size: int = settings.DATALOADER_MAX_BATCH_SIZE):
+        self.model_class = model_class
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.keys = 0
+        self.max_seen_batch_size = 0
+        self._pending: Dict[Any, Dict[Any, asyncio.Future]] = {}
+
+    async def load(self, pk: Any) -> Optional[Model]:
+        # Shielded, a cancelled caller must not cancel the lookup for the others waiting on it.
+        instance = await asyncio.shield(self._enqueue(pk))
+        return copy_instance(instance) if instance is not None else None
+
+    def _enqueue(self, pk: Any) -> asyncio.Future:
+        connection = self.model_class._meta.db
+        pending = self._pending.get(connection)
+        if pending is None:
+            pending = self._pending[connection] = {}
+            # Dispatch in an empty context, the query itself is bound to the connection.
+            asyncio.get_running_loop().call_soon(self._dispatch, connection, context=contextvars.Context())
+        future = pending.get(pk)
+        if future is None:
+            future = pending[pk] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def load_many(self, pks: List[Any]) -> List[Optional[Model]]:
+        return list(await asyncio.gather(*(self.load(pk) for pk in pks)))
+
+    async def get(self, pk: Any) -> Model:
+        instance = await self.load(pk)
+        if instance is None:
+            raise DoesNotExist(f"{self.model_class.__name__} has no object with pk {pk}")
+        return instance
+
+    def _dispatch(self, connection):
+        pending = self._pending.pop(connection)
+        items = list(pending.items())
+        for start in range(0, len(items), self.max_batch_size):
+            asyncio.ensure_future(self._run(connection, items[start:start + self.max_batch_size]))
+
+    async def _run(self, connection, items: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.keys += len(items)
+        self.max_seen_batch_size = max(self.max_seen_batch_size, len(items))
+        try:
+            instances = await self.model_class.filter(pk__in=[pk for pk, _ in items]).using_db(connection)
+        except Exception as exception:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exception)
+            return
+        by_pk = {instance.pk: instance for instance in instances}
+        for pk, future in items:
+            if not future.done():
+                future.set_result(by_pk.get(pk))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "keys": self.keys,
+            "mean_batch_size": round(self.keys / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_seen_batch_size,
+        }
+
+
+def copy_instance(instance: Model) -> Model:
+    # A separate instance with the same column values, relations have to be fetched again.
+    copy = instance.__class__.__new__(instance.__class__)
+    copy._partial = instance._partial
+    copy._saved_in_db = instance._saved_in_db
+    copy._custom_generated_pk = instance._custom_generated_pk
+    for field in instance._meta.fields_db_projection:
+        setattr(copy, field, getattr(instance, field))
+    return copy
+
+
+_loaders: Dict[type, PrimaryKeyLoader] = {}
+
+
+def get_loader(model_class: type) -> PrimaryKeyLoader:
+    loader = _loaders.get(model_class)
+    if loader is None:
+        loader = _loaders[model_class] = PrimaryKeyLoader(model_class)
+    return loader
+
+
+def loader_stats() -> Dict[str, Dict[str, float]]:
+    return {model_class.__name__: loader.stats() for model_class, loader in _loaders.items()}
@@ -3,13 +3,51 @@ from typing import List
 from sanic import json
 from sanic.request import Request
 
-from app.db.models import User, UserAndGroup
+from app.db.models import Group, User
+from app.db.write_queue import queued_write
+from app.utils.cache import principal_cache
+from app.utils.tools import LazyModel, resolve_lazy_models
 from app.utils.types import UserGroupPermissionEnum
 
+# Path models of routes with these decorators are only fetched once the check passed.
+def lazy_models(wrapper):
+    wrapper.__lazy_models__ = True
+    return wrapper
+
+# Routes run in a read snapshot unless they write; by default GET routes are read-only.
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+def read_only(func):
+    func.__read_only__ = True
+    return func
+
+def read_write(func):
+    func.__read_only__ = False
+    return func
+
+def is_read_only_route(request: Request) -> bool:
+    if request.route.extra.websocket:
+        return False
+    read_only = getattr(request.route.handler, "__read_only__", None)
+    if read_only is None:
+        return request.method in READ_ONLY_METHODS
+    return read_only
+
+# Like @atomic(), but runs the handler on the write queue when it is enabled.
+def serialized_write():
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request: Request, *args, **kwargs):
+            return await queued_write(request.app, lambda: func(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
 def is_owner(func):
+    @lazy_models
     @wraps(func)
     async def wrapper(request: Request, my_user: User, *args, **kwargs):
         if my_user.owner:
+            await resolve_lazy_models(kwargs)
             return await func(request, my_user, *args, **kwargs)
         return json({"error": f"You are not allowed to access this enpoint."}, status=403)
 
@@ -17,28 +55,35 @@ def is_owner(func):
 
 def check_for_permission(permissions: List[UserGroupPermissionEnum] = None):
     def decorator(func):
+        @lazy_models
+        @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
             my_user = kwargs.get("my_user", None)
 
             if my_user.owner:
+                await resolve_lazy_models(kwargs)
                 return await func(request, *args, **kwargs)
         
             # first_arg = args[0] if args else None
             # first_kwarg = next(iter(kwargs.values()), None) if kwargs else None
-            # group_id = await first_arg.get_group_id() if first_arg else await first_kwarg.get_group_id() if first_kwarg else None
+            # group_id = first_arg.get_group_id() if first_arg else first_kwarg.get_group_id() if first_kwarg else None
             first_kwarg = next(iter(kwargs.values()), None) if kwargs else None
-            group_id = await first_kwarg.get_group_id() if first_kwarg else None
+            if isinstance(first_kwarg, LazyModel) and first_kwarg.model_class is Group:
+                group_id = first_kwarg.id
+            else:
+                await resolve_lazy_models(kwargs)
+                first_kwarg = next(iter(kwargs.values()), None) if kwargs else None
+                group_id = first_kwarg.get_group_id() if first_kwarg else None
 
-            user_and_group = await UserAndGroup.get_or_none(user_id=my_user.id, group_id=group_id).prefetch_related("user_group_permissions")
-            if user_and_group:
+            membership = await principal_cache.get_membership(my_user.id, group_id)
+            if membership:
                 if permissions is None:
+                    await resolve_lazy_models(kwargs)
                     return await func(request, *args, **kwargs)
                 
-                permissions_list = permissions.copy() if permissions else []
-                permissions_list.append(UserGroupPermissionEnum.ADMIN)
-                for my_permission in user_and_group.user_group_permissions:
-                    if my_permission.permission in permissions_list:
-                        return await func(request, *args, **kwargs)
+                if membership.has_permission(UserGroupPermissionEnum.ADMIN, *permissions):
+                    await resolve_lazy_models(kwargs)
+                    return await func(request, *args, **kwargs)
             return json({"error": f"You are not allowed to access this endpoint."}, status=403)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -4,4 +4,10 @@ class MissingBodyArgument(SanicException):
     status_code = 400
 
     def __init__(self, message="Required argument(s) missing in the request body.", **kwargs):
-        super().__init__(message, **kwargs)
\ No newline at end of file
+        super().__init__(message, **kwargs)
+
+class ReadOnlyRouteError(SanicException):
+    status_code = 500
+
+    def __init__(self, message="A read-only route attempted to write to the database.", **kwargs):
+        super().__init__(message, **kwargs)
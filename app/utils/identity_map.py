@@ -0,0 +1,73 @@
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from sanic.log import logger
+from tortoise.models import Model
+
+
+class IdentityMap:
+    """Rows already loaded during one request, keyed by model class and primary key.
+
+    In debug mode every row hydrated from the database is counted, and rows that
+    were loaded more than once are logged per route when the request finishes."""
+
+    def __init__(self, route: str = "", debug: bool = False):
+        self.route = route
+        self.debug = debug
+        self._rows: Dict[type, Dict[Any, Optional[Model]]] = {}
+        self._loads: Counter = Counter()
+
+    def get(self, model_class: type, pk: Any) -> Tuple[bool, Optional[Model]]:
+        rows = self._rows.get(model_class)
+        if rows is not None and pk in rows:
+            return True, rows[pk]
+        return False, None
+
+    def add(self, instance: Optional[Model], model_class: type|None = None, pk: Any = None):
+        if instance is not None:
+            model_class, pk = instance.__class__, instance.pk
+        elif model_class is None:
+            return
+        self._rows.setdefault(model_class, {}).setdefault(pk, instance)
+
+    async def fetch(self, model_class: type, pk: Any) -> Optional[Model]:
+        found, instance = self.get(model_class, pk)
+        if not found:
+            instance = await model_class.load(pk)
+            self.add(instance, model_class, pk)
+        return instance
+
+    async def get_or_none(self, model_class: type, **filters) -> Optional[Model]:
+        for instance in self._rows.get(model_class, {}).values():
+            if instance is not None and all(getattr(instance, key) == value for key, value in filters.items()):
+                return instance
+        instance = await model_class.get_or_none(**filters)
+        self.add(instance)
+        return instance
+
+    async def fetch_related(self, instance: Model, fields: Tuple[str, ...]) -> List[str]:
+        # Fills plain foreign keys from the map, returns the fields it couldn't handle.
+        remaining = []
+        for field in fields:
+            if field not in instance._meta.fk_fields:
+                remaining.append(field)
+                continue
+            fk_field = instance._meta.fields_map[field]
+            found, related = self.get(fk_field.related_model, getattr(instance, fk_field.source_field))
+            if found:
+                setattr(instance, field, related)
+            else:
+                remaining.append(field)
+        return remaining
+
+    def loaded(self, instance: Model):
+        if self.debug:
+            self._loads[(instance.__class__.__name__, instance.pk)] += 1
+
+    def report(self):
+        duplicates = {f"{name}#{pk}": count for (name, pk), count in self._loads.items() if count > 1}
+        if duplicates:
+            logger.warning("Duplicate fetches in %s: %s", self.route, duplicates)
+
+
+current_identity_map: ContextVar[Optional[IdentityMap]] = ContextVar("current_identity_map", default=None)
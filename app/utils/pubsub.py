@@ -0,0 +1,172 @@
+import asyncio
+import os
+import signal
+import struct
+from typing import Any, Callable, Dict, List, Set
+from sanic.log import logger
+from app.utils import settings
+from app.utils.serialization import packb, unpackb
+
+# Every frame on the broker socket is a length prefix and a MessagePack [channel, message].
+_LENGTH = struct.Struct("!I")
+# Attempts, RECONNECT_DELAY apart, before a worker gives up waiting for the broker at startup.
+CONNECT_ATTEMPTS = 50
+RECONNECT_DELAY = 0.1
+# Seconds the broker waits for the workers to disconnect when it is stopped.
+BROKER_SHUTDOWN_TIMEOUT = 10
+
+
+def in_worker_process() -> bool:
+    # Sanic only sets this in the processes it spawns for workers > 1, single_process runs in the main process.
+    return bool(os.environ.get("SANIC_WORKER_NAME"))
+
+
+def in_first_worker() -> bool:
+    # For work that happens once per server: the first of the workers (Sanic-Server-0-0), or the
+    # only process with single_process.
+    name = os.environ.get("SANIC_WORKER_NAME")
+    return not name or name.startswith("Sanic-Server-0-")
+
+
+class LocalPubSub:
+    """Delivers published messages to the subscribers of this process.
+
+    Callbacks run synchronously in publish(), they must not block. Enough for a
+    single worker, SocketPubSub reaches the other workers as well."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str, callback: Callable[[Any], None]):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel: str, message: Any):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: Any):
+        for callback in self._subscribers.get(channel, ()):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Subscriber of %s failed", channel)
+
+
+class SocketPubSub(LocalPubSub):
+    """LocalPubSub that also sends every message through the broker process (run_broker())
+    to the other workers, and delivers theirs here. Messages have to survive packb(),
+    a subscriber gets lists for tuples and ISO strings for dates from another worker.
+
+    Messages published while the connection to the broker is down only reach this process."""
+
+    def __init__(self, path: str = settings.PUBSUB_SOCKET):
+        super().__init__()
+        self.path = path
+        self._writer: asyncio.StreamWriter|None = None
+        self._task: asyncio.Task|None = None
+
+    async def start(self):
+        # The broker is started next to the workers and may not be listening yet.
+        reader = await self._connect(CONNECT_ATTEMPTS)
+        if reader is None:
+            raise RuntimeError(f"No pub/sub broker listening on {self.path}")
+        self._task = asyncio.create_task(self._run(reader))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def publish(self, channel: str, message: Any):
+        self._deliver(channel, message)
+        if self._writer is None:
+            logger.warning("Not connected to the pub/sub broker, %s message only delivered in this worker", channel)
+            return
+        data = packb([channel, message])
+        self._writer.write(_LENGTH.pack(len(data)) + data)
+
+    async def _connect(self, attempts: int) -> asyncio.StreamReader|None:
+        for _ in range(attempts):
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                return reader
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(RECONNECT_DELAY)
+        return None
+
+    async def _run(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                while True:
+                    header = await reader.readexactly(_LENGTH.size)
+                    channel, message = unpackb(await reader.readexactly(_LENGTH.unpack(header)[0]))
+                    self._deliver(channel, message)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Lost the connection to the pub/sub broker, reconnecting")
+            self._writer.close()
+            self._writer = None
+            while (reader := await self._connect(1)) is None:
+                pass
+
+
+async def _serve_broker(path: str, max_buffer: int):
+    workers: Set[asyncio.StreamWriter] = set()
+    relays: Set[asyncio.Task] = set()
+
+    async def relay(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        workers.add(writer)
+        relays.add(asyncio.current_task())
+        try:
+            while True:
+                header = await reader.readexactly(_LENGTH.size)
+                frame = header + await reader.readexactly(_LENGTH.unpack(header)[0])
+                for other in workers:
+                    if other is writer:
+                        continue
+                    # A worker whose loop is stuck doesn't get to grow the broker without bound.
+                    if other.transport.get_write_buffer_size() > max_buffer:
+                        logger.warning("Pub/sub broker dropping a message for a worker that is %d bytes behind", other.transport.get_write_buffer_size())
+                        continue
+                    other.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            workers.discard(writer)
+            relays.discard(asyncio.current_task())
+            writer.close()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    # Sanic stops its processes with SIGINT.
+    loop.add_signal_handler(signal.SIGINT, stopping.set)
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(relay, path)
+    async with server:
+        await stopping.wait()
+        # The workers are stopping at the same time, keep relaying until they have disconnected.
+        if relays:
+            await asyncio.wait(relays, timeout=BROKER_SHUTDOWN_TIMEOUT)
+        for writer in tuple(workers):
+            writer.close()
+        await asyncio.gather(*relays)
+    os.remove(path)
+
+
+def run_broker(path: str = settings.PUBSUB_SOCKET, max_buffer: int = settings.PUBSUB_MAX_BUFFER):
+    """Relays every frame a worker sends to all the other workers. Runs in a process of its
+    own, started by the main process with app.manager.manage(), and never decodes a frame."""
+    asyncio.run(_serve_broker(path, max_buffer))
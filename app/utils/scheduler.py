@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, List, Set, Tuple
+from sanic.log import logger
+from app.db.models import Event
+from app.db.shards import in_shards_of
+from app.db.transactions import after_commit
+from app.utils.types import EventStateEnum
+
+# SQLite compares on whole seconds with strict inequalities, so fire a little late.
+FIRE_DELAY = timedelta(seconds=1)
+# If a fired deadline didn't move the event, try again later instead of spinning.
+RETRY_DELAY = timedelta(minutes=1)
+
+
+class EventStateScheduler:
+    """Keeps a min-heap of the next state change per event and only runs
+    Event.update_state() for the events whose deadline has passed.
+
+    One per server: with workers > 1 only the first worker start()s it, the
+    others pass their reschedule() calls on to it through publish."""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._dirty: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task|None = None
+        # Replaced to reach the scheduler of the first worker, which then calls mark_dirty().
+        self.publish: Callable[[int], None] = self.mark_dirty
+
+    async def start(self):
+        # Catch up on everything that happened while the server was down.
+        await in_shards_of(None, Event.update_state)
+        await self._load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reschedule(self, event_id: int):
+        # _load() reads on another connection, it only sees the change once the transaction committed.
+        after_commit(partial(self.publish, event_id))
+
+    def mark_dirty(self, event_id: int):
+        self._dirty.add(event_id)
+        self._wakeup.set()
+
+    def _push(self, event_id: int, deadline: datetime|None):
+        if deadline is None:
+            self._deadlines.pop(event_id, None)
+            return
+        self._deadlines[event_id] = deadline
+        heapq.heappush(self._heap, (deadline, event_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, event_id) for event_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    @staticmethod
+    async def _fetch(event_ids: List[int]|None) -> List[Event]:
+        query = Event.filter(state__in=[EventStateEnum.VOTING, EventStateEnum.OPEN, EventStateEnum.ACTIVE])
+        if event_ids is not None:
+            query = query.filter(id__in=event_ids)
+        return await query.prefetch_related("event_options")
+
+    async def _load(self, event_ids: List[int]|None = None, fired: Set[int]|None = None):
+        if event_ids is not None:
+            for event_id in event_ids:
+                self._deadlines.pop(event_id, None)
+        events = [event for events in await in_shards_of(event_ids, self._fetch) for event in events]
+        now = datetime.utcnow()
+        for event in events:
+            deadline = event.next_state_change()
+            if deadline is not None:
+                deadline += FIRE_DELAY
+                if fired and event.id in fired and deadline <= now:
+                    deadline = now + RETRY_DELAY
+            self._push(event.id, deadline)
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, event_id = heapq.heappop(self._heap)
+            # Entries are never removed in place, skip the ones that were superseded.
+            if self._deadlines.get(event_id) == deadline:
+                del self._deadlines[event_id]
+                due.append(event_id)
+        return due
+
+    async def _tick(self) -> float|None:
+        if self._dirty:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            try:
+                await self._load(dirty)
+            except Exception:
+                self._dirty.update(dirty)
+                raise
+
+        due = self._pop_due(datetime.utcnow())
+        if due:
+            try:
+                await in_shards_of(due, Event.update_state)
+                await self._load(due, fired=set(due))
+            except Exception:
+                self._dirty.update(due)
+                raise
+            return 0
+
+        if self._heap:
+            return max((self._heap[0][0] - datetime.utcnow()).total_seconds(), 0)
+        return None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                timeout = await self._tick()
+            except Exception:
+                logger.exception("Updating event states failed")
+                timeout = RETRY_DELAY.total_seconds()
+            if timeout == 0:
+                continue
+            # Not wait_for(), which swallows a cancel from stop() when the wakeup comes in at the
+            # same time, and stop() then waits for good.
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([wakeup], timeout=timeout)
+            finally:
+                wakeup.cancel()
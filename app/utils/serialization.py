@@ -0,0 +1,201 @@
+import base64
+from datetime import date, time
+from typing import Any, Callable, Dict, List
+import msgpack
+import orjson
+
+# Passed to the encoder as is. Dates and datetimes are encoded by orjson in isoformat().
+VALUE = "value"
+# A datetime as "YYYY-MM-DD HH:MM:SS", the format the client parses for created and vote_end_date.
+SECONDS = "seconds"
+# A time as "HH:MM:SS", without the timezone Tortoise attaches.
+TIME = "time"
+# The to_dict() of a fetched foreign key, None if it wasn't fetched.
+RELATED = "related"
+# A list of to_dict() of a fetched reverse relation, None if it wasn't fetched.
+RELATED_MANY = "related_many"
+
+
+def dumps(body: Any) -> bytes:
+    # Non-string keys become strings, like with the ujson Sanic used before.
+    return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_text(body: Any) -> str:
+    return dumps(body).decode()
+
+
+loads = orjson.loads
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Websocket subprotocol for chat frames as binary MessagePack instead of JSON text.
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def _msgpack_default(value: Any) -> Any:
+    # Same strings as in the JSON responses rather than the msgpack timestamp extension.
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+
+def packb(body: Any) -> bytes:
+    return msgpack.packb(body, default=_msgpack_default)
+
+
+unpackb = msgpack.unpackb
+
+
+def encode_frame(body: Any, subprotocol: str|None) -> bytes|str:
+    return packb(body) if subprotocol == MSGPACK_SUBPROTOCOL else dumps_text(body)
+
+
+def decode_frame(data: bytes|str) -> Any:
+    # Binary frames are MessagePack, text frames JSON.
+    return unpackb(data) if isinstance(data, bytes) else loads(data)
+
+
+def encode_cursor(*position: Any) -> str:
+    # Opaque to the client and safe in a query string as is.
+    return base64.urlsafe_b64encode(packb(position)).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    # ValueError for anything encode_cursor() didn't produce.
+    position = unpackb(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(position, list):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+# Fetched relations are cached by Tortoise in "_<name>". Reading them there skips the
+# relation descriptors and leaves unfetched ones at None instead of a QuerySet.
+EXPRESSIONS = {
+    VALUE: "self.{key}",
+    SECONDS: '(_value.isoformat(" ", "seconds")[:19] if (_value := self.{key}) else None)',
+    TIME: '(_value.isoformat("seconds")[:8] if (_value := self.{key}) else None)',
+    RELATED: '(_value.to_dict() if (_value := getattr(self, "_{key}", None)) is not None else None)',
+    RELATED_MANY: '([item.to_dict() for item in _value.related_objects] if (_value := getattr(self, "_{key}", None)) is not None and _value._fetched else None)',
+}
+
+
+# The same for relations with a selection of their fields, {selection} being its name in the namespace.
+SELECTED_EXPRESSIONS = {
+    RELATED: '(type(_value).to_dict.select({selection})(_value) if (_value := getattr(self, "_{key}", None)) is not None else None)',
+    RELATED_MANY: '(_select_many(_value.related_objects, {selection}) if (_value := getattr(self, "_{key}", None)) is not None and _value._fetched else None)',
+}
+
+
+def _select_many(items: List[Any], selection: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if not items:
+        return []
+    to_dict = type(items[0]).to_dict.select(selection)
+    return [to_dict(item) for item in items]
+
+
+def _compile(fields: Dict[str, str|Callable[[Any], Any]], selection: Dict[str, Any]|None) -> Callable[[Any], Dict[str, Any]]:
+    namespace: Dict[str, Any] = {"_select_many": _select_many}
+    items = []
+    for index, (key, kind) in enumerate(fields.items()):
+        if selection is not None and key not in selection:
+            continue
+        sub_selection = selection[key] if selection is not None else None
+        if callable(kind):
+            namespace[f"_computed_{index}"] = kind
+            items.append(f"{key!r}: _computed_{index}(self)")
+        elif sub_selection is not None and kind in SELECTED_EXPRESSIONS:
+            namespace[f"_selection_{index}"] = sub_selection
+            items.append(f"{key!r}: {SELECTED_EXPRESSIONS[kind].format(key=key, selection=f'_selection_{index}')}")
+        else:
+            items.append(f"{key!r}: {EXPRESSIONS[kind].format(key=key)}")
+    exec(f"def to_dict(self):\n    return {{{', '.join(items)}}}\n", namespace)
+    return namespace["to_dict"]
+
+
+def _freeze(selection: Dict[str, Any]|None) -> Any:
+    return None if selection is None else tuple((key, _freeze(sub_selection)) for key, sub_selection in selection.items())
+
+
+def serializer(**fields: str|Callable[[Any], Any]) -> Callable[[Any], Dict[str, Any]]:
+    """Builds a to_dict() returning the given keys in order, each read from the attribute
+    of the same name and converted according to its kind, or computed by a callable
+    taking the instance.
+
+    The function is compiled once, so a call is a single dict literal without any
+    lookups of the field list or helper calls. to_dict.select(selection) compiles
+    (and caches) a variant returning only the keys of a parse_fields() selection,
+    so callables and relations that weren't asked for are never evaluated."""
+    to_dict = _compile(fields, None)
+    variants: Dict[Any, Callable[[Any], Dict[str, Any]]] = {}
+
+    def select(selection: Dict[str, Any]|None) -> Callable[[Any], Dict[str, Any]]:
+        if selection is None:
+            return to_dict
+        key = _freeze(selection)
+        variant = variants.get(key)
+        if variant is None:
+            variant = variants[key] = _compile(fields, selection)
+        return variant
+
+    to_dict.select = select
+    return to_dict
+
+
+def parse_fields(value: str|None) -> Dict[str, Any]|None:
+    """Parses a ?fields= parameter like "id,title,event_options.date" into
+    {"id": None, "title": None, "event_options": {"date": None}}. None stands for all
+    fields, of the whole object or of a relation listed without sub-fields. Unknown
+    names are ignored."""
+    if not value:
+        return None
+    selection: Dict[str, Any] = {}
+    for path in value.split(","):
+        names = [name.strip() for name in path.split(".")]
+        if not all(names):
+            continue
+        level = selection
+        for name in names[:-1]:
+            # A relation also listed on its own stays whole.
+            if name in level and level[name] is None:
+                break
+            level = level.setdefault(name, {})
+        else:
+            level[names[-1]] = None
+    return selection or None
+
+
+def wants(selection: Dict[str, Any]|None, key: str) -> bool:
+    return selection is None or key in selection
+
+
+def selection_of(selection: Dict[str, Any]|None, key: str) -> Dict[str, Any]|None:
+    return selection.get(key) if selection is not None else None
+
+
+def prefetch_paths(selection: Dict[str, Any]|None, relations: Dict[str, Dict[str, Any]]) -> List[str]:
+    """The "a__b" prefetch paths of a tree of relations that the selection asks for."""
+    paths = []
+    for key, children in relations.items():
+        if wants(selection, key):
+            paths += [f"{key}__{path}" for path in prefetch_paths(selection_of(selection, key), children)] or [key]
+    return paths
+
+
+def project(body: Any, selection: Dict[str, Any]|None) -> Any:
+    """Applies a selection to already built dicts and lists of dicts."""
+    if selection is None:
+        return body
+    if isinstance(body, list):
+        return [project(item, selection) for item in body]
+    if isinstance(body, dict):
+        return {key: project(value, selection[key]) for key, value in body.items() if key in selection}
+    return body
+
+
+def serialize(instances: Any, selection: Dict[str, Any]|None) -> Any:
+    """to_dict() of a model instance or a list of them, limited to the selection."""
+    if isinstance(instances, list):
+        return _select_many(instances, selection) if selection is not None else [instance.to_dict() for instance in instances]
+    return type(instances).to_dict.select(selection)(instances)
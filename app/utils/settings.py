@@ -7,3 +7,91 @@ DATABASE = f"{RESOURCES}/database"
 TEMP = f"{RESOURCES}/temp"
 
 VERSION = "1.0.0"
+
+PRINCIPAL_CACHE_SIZE = 1024
+
+PRINCIPAL_CACHE_TTL = 60
+
+DATALOADER_MAX_BATCH_SIZE = 500
+
+# Applied to every SQLite connection when it is opened.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Read-only connections used for reads outside a transaction, 0 sends everything through the writer.
+SQLITE_READERS = 4
+
+# asyncpg pool size when database_url points at PostgreSQL.
+POSTGRES_POOL_MIN_SIZE = 1
+
+POSTGRES_POOL_MAX_SIZE = 10
+
+# Run the hot write routes on a single writer task that group-commits them, False runs them in their own transactions.
+WRITE_QUEUE_ENABLED = False
+
+WRITE_QUEUE_SIZE = 1024
+
+WRITE_QUEUE_MAX_BATCH_SIZE = 64
+
+# Keep the events, votes and messages of every group in a SQLite file of its own, so one busy group
+# doesn't hold the write lock for all the others. Only for new SQLite databases, see app/db/shards.py.
+SHARDING_ENABLED = False
+
+SHARDS = f"{DATABASE}/groups"
+
+# Read-only connections per group database.
+SHARD_READERS = 1
+
+# Uploaded avatars are decoded and resized in a pool of worker processes, uploads beyond
+# AVATAR_MAX_PENDING (processing or waiting) are turned away with a 503.
+AVATAR_WORKERS = 2
+
+AVATAR_MAX_PENDING = 8
+
+AVATAR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Images with a larger width or height are rejected before they are decoded.
+AVATAR_MAX_DIMENSION = 4096
+
+# Edge lengths of the stored thumbnails in pixels, get_avatar picks one with ?size=.
+AVATAR_SIZES = (32, 64, 256)
+
+AVATAR_QUALITY = 80
+
+# Bytes of avatar thumbnails kept in memory per worker, the most recently served ones.
+AVATAR_CACHE_SIZE = 16 * 1024 * 1024
+
+# Frames waiting to be sent to one chat websocket. A client that falls further behind is
+# disconnected ("disconnect", it reloads the history when it reconnects) or loses its oldest frames ("drop").
+CHAT_QUEUE_SIZE = 64
+
+CHAT_SLOW_CLIENT_POLICY = "disconnect"
+
+# Worker processes launcher.py starts unless workers= is set in the environment. With more than one,
+# chat messages and cache invalidations reach the other workers through a broker on PUBSUB_SOCKET.
+WORKERS = 1
+
+PUBSUB_SOCKET = f"{TEMP}/pubsub.sock"
+
+# Bytes the broker holds for a worker that doesn't read its messages before it drops them.
+PUBSUB_MAX_BUFFER = 16 * 1024 * 1024
+
+# Chat messages are broadcast right away and written in batches, every MESSAGE_FLUSH_INTERVAL seconds
+# or once MESSAGE_FLUSH_SIZE are waiting. Beyond MESSAGE_BUFFER_SIZE senders wait for the write.
+MESSAGE_FLUSH_INTERVAL = 0.05
+
+MESSAGE_FLUSH_SIZE = 256
+
+MESSAGE_BUFFER_SIZE = 4096
+
+# A message that can't be written is put back and tried again with the next batches, this many times in all.
+MESSAGE_WRITE_ATTEMPTS = 5
+
+# Message ids each worker reserves from the database at a time.
+MESSAGE_ID_BLOCK = 64
@@ -1,8 +1,10 @@
+import asyncio
 import secrets
 import hashlib
-from typing import Dict, Any, Union, List
+from typing import Dict, Any, List
 from app.db import models
 from app.utils.exeptions import MissingBodyArgument
+from app.utils.identity_map import current_identity_map
 
 def generate_random_hex(length: int = 16):
     # Generate a random sequence of bytes
@@ -15,31 +17,42 @@ def generate_random_hex(length: int = 16):
     return hex_code[:length]
 
 
-async def resolve_model(variable: str, value: int) -> Union[int, Any]:
-    model = None
-    model_class = None
-    for name, obj in models.__dict__.items():
-        if hasattr(obj, '__parse_name__') and getattr(obj, '__parse_name__') == variable:
-            model_class = obj
-            break
-    if model_class:
-        model = await model_class.get_or_none(id=value)
-        return model
-    else:
-        return value
-
-async def process_match(match_data: Dict[str, Any]) -> Dict[str, Any]:
+class LazyModel:
+    __slots__ = ("model_class", "id", "_task")
+
+    def __init__(self, model_class: type, id: int):
+        self.model_class = model_class
+        self.id = id
+        self._task = None
+
+    def fetch(self) -> asyncio.Future:
+        if self._task is None:
+            identity_map = current_identity_map.get()
+            if identity_map is not None:
+                self._task = asyncio.ensure_future(identity_map.fetch(self.model_class, self.id))
+            else:
+                self._task = asyncio.ensure_future(self.model_class.load(self.id))
+        return self._task
+
+
+async def resolve_lazy_models(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    lazy_models = {key: value for key, value in kwargs.items() if isinstance(value, LazyModel)}
+    if lazy_models:
+        resolved = await asyncio.gather(*(lazy_model.fetch() for lazy_model in lazy_models.values()))
+        kwargs.update(zip(lazy_models.keys(), resolved))
+    return kwargs
+
+
+async def process_match(match_data: Dict[str, Any], lazy: bool = False) -> Dict[str, Any]:
     processed_data = {}
     for key, value in match_data.items():
-        if isinstance(value, int):
-            variable = key[:-3]  # Removing '_id' from the key to get the variable name
-            resolved_value = await resolve_model(variable, value) if key.endswith('_id') else value
-            if isinstance(resolved_value, int):
-                processed_data[key] = resolved_value
-            else:
-                processed_data[variable] = resolved_value
+        model_class = models.MODELS_BY_PARSE_NAME.get(key[:-3]) if isinstance(value, int) and key.endswith('_id') else None
+        if model_class:
+            processed_data[key[:-3]] = LazyModel(model_class, value)
         else:
             processed_data[key] = value
+    if not lazy:
+        await resolve_lazy_models(processed_data)
     return processed_data
 
 def filter_dict_by_keys(input_dict:Dict[str,Any], key_list:List[str], check_if_one_key_matches:bool = False):
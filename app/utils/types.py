@@ -17,4 +17,12 @@ class UserGroupPermissionEnum(IntEnum):
     MANAGE_USERS = 2
     MANAGE_INVITES = 3
     MANAGE_EVENTS = 4
-    MANAGE_VOTES = 5
\ No newline at end of file
+    MANAGE_VOTES = 5
+
+    @property
+    def bit(self) -> int:
+        return 1 << self.value
+
+    @staticmethod
+    def from_mask(mask: int) -> list["UserGroupPermissionEnum"]:
+        return [permission for permission in UserGroupPermissionEnum if mask & permission.bit]
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Requests per second for the avatars of a MEMBERS strong group page, against a server on localhost:
+# isfile() + file() for every request as before, the in-memory LRU, and If-None-Match revalidation.
+# Run from the repository root: python -m benchmarks.avatar_serving
+import asyncio
+import os
+import tempfile
+import time
+from io import BytesIO
+from types import SimpleNamespace
+import aiohttp
+from PIL import Image
+from sanic import Sanic, file
+from sanic.response import json
+from app.utils import settings
+from app.utils.avatars import AvatarProcessor, avatar_cache, avatar_response
+
+MEMBERS = 50
+REQUESTS = 5000
+CONCURRENCY = 50
+PORT = 8799
+
+
+def build_app(directory, users):
+    app = Sanic("AvatarBenchmark")
+    app.config.AUTO_EXTEND = False
+    app.ctx.Config = {"Resources": {"users": directory}}
+
+    @app.get("/legacy/<user_id:int>")
+    async def legacy(request, user_id):
+        # get_avatar before the avatar cache.
+        avatar_path = f"{directory}/{user_id}/avatar_{settings.AVATAR_SIZES[0]}.webp"
+        if os.path.isfile(avatar_path):
+            return await file(avatar_path)
+        return json({"error": "Avatar file not found"}, status=404)
+
+    @app.get("/cached/<user_id:int>")
+    async def cached(request, user_id):
+        return await avatar_response(request, users[user_id])
+
+    return app
+
+
+async def run(session, name, path, etags=None):
+    done = 0
+    transferred = 0
+
+    async def client():
+        nonlocal done, transferred
+        while done < REQUESTS:
+            user_id = done % MEMBERS + 1
+            done += 1
+            headers = {"If-None-Match": etags[user_id]} if etags else {}
+            async with session.get(f"http://127.0.0.1:{PORT}{path.format(user_id=user_id)}", headers=headers) as response:
+                assert response.status in (200, 304), response.status
+                transferred += len(await response.read())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {done / elapsed:8.0f} requests/s   {transferred / done / 1e3:6.2f} kB/request")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        processor = AvatarProcessor()
+        processor.start()
+        users = {}
+        for user_id in range(1, MEMBERS + 1):
+            image = Image.radial_gradient("L").resize((512, 512)).convert("RGB")
+            data = BytesIO()
+            image.save(data, "PNG")
+            version = await processor.process(data.getvalue(), f"{directory}/{user_id}")
+            users[user_id] = SimpleNamespace(id=user_id, avatar_version=version)
+        await processor.stop()
+
+        app = build_app(directory, users)
+        server = await app.create_server(host="127.0.0.1", port=PORT, return_asyncio_server=True, access_log=False)
+        await server.startup()
+        etags = {user_id: f'"{user.avatar_version}-{settings.AVATAR_SIZES[0]}"' for user_id, user in users.items()}
+        size = f"?size={settings.AVATAR_SIZES[0]}"
+        print(f"{REQUESTS} avatar requests over {MEMBERS} members, {CONCURRENCY} connections")
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+            await run(session, "isfile() + file()", "/legacy/{user_id}")
+            await run(session, "LRU", "/cached/{user_id}" + size)
+            await run(session, "LRU, If-None-Match -> 304", "/cached/{user_id}" + size, etags)
+        print(f"LRU hits {avatar_cache.hits}, misses {avatar_cache.misses}, {avatar_cache.size / 1e3:.1f} kB held")
+        print("versioned URLs: repeat visits are served from the browser cache, 0 requests")
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
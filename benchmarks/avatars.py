@@ -0,0 +1,98 @@
+# Avatar uploads: the old inline lossless full-resolution WebP vs the thumbnail pipeline in a process pool.
+# Reports the time per upload, the stored bytes and how long the event loop stalls while UPLOADS arrive at once.
+# Run from the repository root: python -m benchmarks.avatars
+import asyncio
+import os
+import tempfile
+import time
+from io import BytesIO
+from PIL import Image
+from app.utils import settings
+from app.utils.avatars import AvatarProcessor, process_avatar
+
+WIDTH, HEIGHT = 2400, 1600
+UPLOADS = 8
+TICK = 0.005
+
+
+def photo():
+    # Smooth gradients with sensor noise, saved like a phone camera would.
+    image = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((WIDTH, HEIGHT)),
+        Image.radial_gradient("L").resize((WIDTH, HEIGHT)),
+        Image.effect_noise((WIDTH, HEIGHT), 40),
+    ])
+    upload = BytesIO()
+    image.save(upload, "JPEG", quality=90)
+    return upload.getvalue()
+
+
+def inline_avatar(data, directory):
+    # upload_avatar before the pipeline, minus the imghdr check.
+    os.makedirs(directory, exist_ok=True)
+    with Image.open(BytesIO(data)) as img:
+        img.save(f"{directory}/avatar.webp", 'WEBP', quality=95, lossless=True, alpha=True)
+
+
+async def stalls(work):
+    # Longest gap between ticks of a task that wants to run every TICK seconds.
+    done = False
+    longest = 0.0
+
+    async def ticker():
+        nonlocal longest
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(TICK)
+            now = time.perf_counter()
+            longest = max(longest, now - last - TICK)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await task
+    return elapsed, longest
+
+
+def stored_bytes(directory):
+    return sum(os.path.getsize(f"{directory}/{name}") for name in os.listdir(directory))
+
+
+async def main():
+    data = photo()
+    print(f"{UPLOADS} uploads of a {WIDTH}x{HEIGHT} JPEG, {len(data) / 1e3:.0f} kB")
+    with tempfile.TemporaryDirectory() as directory:
+        async def inline():
+            for i in range(UPLOADS):
+                inline_avatar(data, f"{directory}/inline/{i}")
+                # Other requests get a turn between two uploads.
+                await asyncio.sleep(TICK)
+
+        elapsed, longest = await stalls(inline)
+        print(f"{'inline lossless':<32} {elapsed / UPLOADS * 1e3:7.0f} ms/upload   longest loop stall {longest * 1e3:7.1f} ms"
+              f"   stored {stored_bytes(f'{directory}/inline/0') / 1e3:8.1f} kB")
+
+        start = time.perf_counter()
+        process_avatar(data, f"{directory}/direct", settings.AVATAR_SIZES, settings.AVATAR_MAX_DIMENSION, settings.AVATAR_QUALITY)
+        print(f"{'thumbnails, one upload':<32} {(time.perf_counter() - start) * 1e3:7.0f} ms/upload")
+
+        processor = AvatarProcessor(max_pending=UPLOADS)
+        processor.start()
+        await processor.process(data, f"{directory}/warmup")
+
+        async def pooled():
+            await asyncio.gather(*(processor.process(data, f"{directory}/pool/{i}") for i in range(UPLOADS)))
+
+        elapsed, longest = await stalls(pooled)
+        await processor.stop()
+        sizes = ", ".join(f"{size}px {os.path.getsize(f'{directory}/pool/0/avatar_{size}.webp') / 1e3:.1f} kB" for size in settings.AVATAR_SIZES)
+        print(f"{f'thumbnails, {processor.workers} workers':<32} {elapsed / UPLOADS * 1e3:7.0f} ms/upload   longest loop stall {longest * 1e3:7.1f} ms"
+              f"   stored {stored_bytes(f'{directory}/pool/0') / 1e3:8.1f} kB ({sizes})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# One event chat with CLIENTS simulated websockets, a few of them slow or stalled:
+# the old loop awaiting every send() in turn vs ChatHub with a queue and writer task per connection.
+# Run from the repository root: python -m benchmarks.chat_fanout
+import asyncio
+import statistics
+import time
+from app.utils.chat import ChatHub
+from app.utils.serialization import encode_frame
+
+CLIENTS = 500
+MESSAGES = 20
+# Every SLOW_EVERY-th client needs SLOW_SEND seconds per frame, every STALLED_EVERY-th never reads.
+SLOW_EVERY = 50
+SLOW_SEND = 0.05
+STALLED_EVERY = 250
+STALLED_SEND = 1.0
+QUEUE_SIZE = 8
+# Time between two messages of the sender.
+INTERVAL = 0.01
+
+
+class FakeSocket:
+    subprotocol = None
+
+    def __init__(self, index):
+        self.delay = STALLED_SEND if index % STALLED_EVERY == 0 else SLOW_SEND if index % SLOW_EVERY == 0 else 0
+        self.fast = self.delay == 0
+        self.latencies = []
+        self.closed = False
+
+    async def send(self, frame):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.latencies.append(time.perf_counter() - float(frame))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = True
+
+
+async def sequential(sockets, body):
+    # chat_message_recv_send before ChatHub.
+    frame = encode_frame(body, None)
+    for socket in sockets:
+        await socket.send(frame)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run(name, broadcast, sockets, settle):
+    stalls = []
+    for _ in range(MESSAGES):
+        start = time.perf_counter()
+        await broadcast(start)
+        stalls.append(time.perf_counter() - start)
+        await asyncio.sleep(INTERVAL)
+    await asyncio.sleep(settle)
+    fast = [latency for socket in sockets if socket.fast for latency in socket.latencies]
+    delivered = sum(len(socket.latencies) for socket in sockets)
+    print(
+        f"{name:<18} sender blocked p50 {statistics.median(stalls) * 1e3:8.2f} ms  max {max(stalls) * 1e3:8.2f} ms"
+        f"   fast clients p50 {statistics.median(fast) * 1e3:8.2f} ms  p99 {percentile(fast, 0.99) * 1e3:8.2f} ms"
+        f"   delivered {delivered}/{CLIENTS * MESSAGES}, disconnected {sum(socket.closed for socket in sockets)}"
+    )
+
+
+async def main():
+    print(f"{CLIENTS} clients, {CLIENTS // SLOW_EVERY} slow ({SLOW_SEND * 1e3:.0f} ms/frame), {CLIENTS // STALLED_EVERY} stalled, {MESSAGES} messages")
+    sockets = [FakeSocket(index) for index in range(CLIENTS)]
+    await run("sequential send()", lambda body: sequential(sockets, body), sockets, 0)
+
+    for policy in ("disconnect", "drop"):
+        sockets = [FakeSocket(index) for index in range(CLIENTS)]
+        hub = ChatHub(QUEUE_SIZE, policy)
+        connections = [hub.join(1, socket) for socket in sockets]
+
+        async def broadcast(body):
+            hub.broadcast(1, body)
+
+        await run(f"ChatHub, {policy}", broadcast, sockets, SLOW_SEND * MESSAGES)
+        for connection in connections:
+            hub.leave(1, connection)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
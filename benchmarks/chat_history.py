@@ -0,0 +1,100 @@
+# Chat history pages of an event with MESSAGES messages, newest, in the middle and oldest:
+# Message.page() seeking to a cursor on the (event_id, sent_at, id) index vs LIMIT/OFFSET,
+# which reads and throws away every message before the page.
+# Run from the repository root: python -m benchmarks.chat_history
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from tortoise import Tortoise, timezone
+from app.db.models import Event, Group, Message, User, UserAndGroup
+from app.utils import settings
+
+MESSAGES = 1_000_000
+# Messages of the other events in the group, interleaved with the one paged through.
+OTHER_MESSAGES = 200_000
+PAGE_SIZE = 30
+REPEAT = 50
+# Written in batches of BATCH, two messages every millisecond so sent_at has ties.
+BATCH = 50_000
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def fill(event, other_event, user_and_group):
+    conn = Message._meta.db
+    to_db_value = Message._meta.fields_map["sent_at"].to_db_value
+    start = timezone.now() - timedelta(days=1)
+    total = MESSAGES + OTHER_MESSAGES
+    for first in range(0, total, BATCH):
+        rows = []
+        for index in range(first, min(first + BATCH, total)):
+            event_id = other_event.id if index % (total // OTHER_MESSAGES) == 0 else event.id
+            rows.append([f"message {index}", to_db_value(start + timedelta(milliseconds=index // 2), Message), event_id, user_and_group.id, event.group_id])
+        await conn.execute_many(
+            'INSERT INTO "messages" ("content", "sent_at", "event_id", "user_and_group_id", "group_id") VALUES (?, ?, ?, ?, ?)', rows
+        )
+    await conn.execute_script("ANALYZE;")
+
+
+async def cursor_page(event_id, before):
+    messages, _ = await Message.page(event_id, PAGE_SIZE, before)
+    return messages
+
+
+async def measure(fetch):
+    latencies = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        messages = await fetch()
+        latencies.append(time.perf_counter() - start)
+    assert len(messages) == PAGE_SIZE
+    return latencies
+
+
+def report(name, latencies):
+    print(f"{name:<34} p50 {statistics.median(latencies) * 1e3:8.2f} ms   p99 {percentile(latencies, 0.99) * 1e3:8.2f} ms")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(config={
+            "connections": {"default": {"engine": "app.db.sqlite", "credentials": {
+                "file_path": os.path.join(directory, "history.db"), "readers": settings.SQLITE_READERS, **settings.SQLITE_PRAGMAS,
+            }}},
+            "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+        })
+        await Tortoise.generate_schemas()
+        group = await Group.create(name="raid night")
+        user = await User.create(name="user", password="x")
+        user_and_group = await UserAndGroup.create(user_id=user.id, group_id=group.id)
+        event = await Event.create(group_id=group.id, title="raid", color="ff0000")
+        other_event = await Event.create(group_id=group.id, title="raid again", color="00ff00")
+
+        start = time.perf_counter()
+        await fill(event, other_event, user_and_group)
+        count = await Message.filter(event_id=event.id).count()
+        print(f"{count} messages in the event, {PAGE_SIZE} per page, written in {time.perf_counter() - start:.1f} s")
+
+        # The message each page starts after, as a client holding the cursor of the previous page would send it.
+        ordered = Message.filter(event_id=event.id).order_by("-sent_at", "-id")
+        for name, offset in (("newest", 0), ("middle", count // 2), ("oldest", count - PAGE_SIZE)):
+            previous = await ordered.offset(offset - 1).first() if offset else None
+            before = (previous.sent_at, previous.id) if previous else None
+            keyset = await measure(lambda: cursor_page(event.id, before))
+            offset_page = await measure(lambda: ordered.offset(offset).limit(PAGE_SIZE).prefetch_related("user_and_group"))
+            # Same messages either way.
+            assert [message.id for message in await cursor_page(event.id, before)] == [message.id for message in await ordered.offset(offset).limit(PAGE_SIZE)]
+            report(f"{name} page, cursor", keyset)
+            report(f"{name} page, OFFSET {offset}", offset_page)
+
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
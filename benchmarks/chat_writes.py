@@ -0,0 +1,87 @@
+# A busy event chat: SENDERS connections each sending MESSAGES, Message.create() + fetch_related()
+# in a transaction per message as before vs MessageBuffer. Latency is until the message can be broadcast.
+# Run from the repository root: python -m benchmarks.chat_writes
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.db.message_buffer import MessageBuffer
+from app.db.models import Event, Group, Message, User, UserAndGroup
+from app.utils import settings
+
+SENDERS = 100
+MESSAGES = 20
+# Time between two messages of one sender.
+INTERVAL = 0.01
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def direct(event, user_and_group, content):
+    # chat_message_recv_send before MessageBuffer, with the write queue disabled.
+    async with in_transaction():
+        message = await Message.create(content=content, event_id=event.id, group_id=event.group_id, user_and_group_id=user_and_group.id)
+    await message.fetch_related("user_and_group")
+    return message
+
+
+async def run(name, synchronous, buffered):
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(config={
+            "connections": {"default": {"engine": "app.db.sqlite", "credentials": {
+                "file_path": os.path.join(directory, "chat.db"), "readers": settings.SQLITE_READERS, **settings.SQLITE_PRAGMAS, "synchronous": synchronous,
+            }}},
+            "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+        })
+        await Tortoise.generate_schemas()
+        group = await Group.create(name="raid night")
+        await User.bulk_create([User(name=f"user {i}", password="x") for i in range(SENDERS)])
+        await UserAndGroup.bulk_create([UserAndGroup(user_id=user.id, group_id=group.id) for user in await User.all()])
+        user_and_groups = await UserAndGroup.all()
+        event = await Event.create(group_id=group.id, title="raid", color="ff0000")
+
+        buffer = MessageBuffer()
+        await buffer.start()
+        send = buffer.add if buffered else direct
+        latencies = []
+
+        async def sender(user_and_group):
+            for i in range(MESSAGES):
+                start = time.perf_counter()
+                message = await send(event, user_and_group, f"message {i}")
+                message.to_dict()
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(INTERVAL)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender(user_and_group) for user_and_group in user_and_groups))
+        elapsed = time.perf_counter() - start
+        await buffer.stop()
+
+        # Everything broadcast was written by the time stop() returned.
+        assert await Message.filter(event_id=event.id).count() == SENDERS * MESSAGES
+        await Tortoise.close_connections()
+
+    latencies.sort()
+    print(
+        f"{name:<14} synchronous={synchronous:<7} messages/s {len(latencies) / elapsed:7.0f}   p50 {statistics.median(latencies) * 1e3:7.2f} ms"
+        f"   p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms"
+    )
+    if buffered:
+        print(f"{'':<14} {buffer.stats()}")
+
+
+async def main():
+    print(f"{SENDERS} senders, {MESSAGES} messages each, {INTERVAL * 1e3:.0f} ms apart")
+    for synchronous in ("NORMAL", "FULL"):
+        await run("create", synchronous, False)
+        await run("MessageBuffer", synchronous, True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
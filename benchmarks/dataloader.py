@@ -0,0 +1,39 @@
+# Concurrent primary-key lookups, one query each vs batched per event-loop tick.
+# Run from the repository root: python -m benchmarks.dataloader
+import asyncio
+import time
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.db.models import Event, Group
+from app.utils.dataloader import get_loader
+
+ROUNDS = 50
+CONCURRENCY = 200
+
+
+async def measure(name, lookup, ids):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        results = await asyncio.gather(*(lookup(event_id) for event_id in ids))
+        assert all(result is not None for result in results)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / ROUNDS * 1e3:8.2f} ms per {len(ids)} lookups")
+
+
+async def main():
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    group = await Group.create(name="bench")
+    events = await asyncio.gather(*(Event.create(group=group, title=f"event {i}", color="ff0000") for i in range(CONCURRENCY)))
+    ids = [event.id for event in events]
+
+    await measure("Event.get_or_none(id=...)", lambda event_id: Event.get_or_none(id=event_id), ids)
+    await measure("Event.load(...)", Event.load, ids)
+    async with in_transaction():
+        await measure("Event.load(...) in a transaction", Event.load, ids)
+    print(get_loader(Event).stats())
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+# GET /groups/<id>/events: nested prefetch + to_dict() vs Event.get_tree_for_group().
+# 1k events x 5 options x 50 members, every member answered every option.
+# Run from the repository root: python -m benchmarks.event_tree
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from sanic.response import json
+from tortoise import Tortoise
+from tortoise.query_utils import Prefetch
+from app.db.models import Event, EventOption, Group, User, UserAndGroup, UserEventOptionResponse
+from app.utils.serialization import dumps
+from app.utils.types import EventOptionResponseEnum, EventStateEnum
+
+EVENTS = 1000
+OPTIONS = 5
+MEMBERS = 50
+ROUNDS = 3
+
+
+async def prefetch_tree(group_id):
+    events = await Event.filter(group_id=group_id).order_by("id").prefetch_related(
+        Prefetch("event_options", queryset=EventOption.all().prefetch_related(
+            Prefetch("user_event_option_responses", queryset=UserEventOptionResponse.all().prefetch_related(
+                "user_and_group"
+            ))
+        ))
+    )
+    return json([event.to_dict() for event in events], dumps=dumps)
+
+
+async def flat_tree(group_id):
+    return json(await Event.get_tree_for_group(group_id), dumps=dumps)
+
+
+async def measure(name, func, group_id):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = await func(group_id)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / ROUNDS * 1e3:8.1f} ms/request, {len(response.body) / 1e6:.1f} MB")
+    return response.body
+
+
+async def seed():
+    group = await Group.create(name="bench")
+    await User.bulk_create([User(name=f"user {i}", password="x") for i in range(MEMBERS)])
+    users = await User.all()
+    await UserAndGroup.bulk_create([UserAndGroup(user_id=user.id, group_id=group.id) for user in users])
+    user_and_groups = await UserAndGroup.all()
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    await Event.bulk_create([
+        Event(group_id=group.id, title=f"event {i}", color="ff0000", state=random.choice(list(EventStateEnum)),
+              vote_end_date=created + timedelta(days=i, hours=3) if i % 2 else None, created=created + timedelta(hours=i))
+        for i in range(EVENTS)
+    ])
+    events = await Event.all()
+    await EventOption.bulk_create([
+        EventOption(event_id=event.id, group_id=group.id, date=date(2024, 1, 1) + timedelta(days=event.id + i),
+                    start_time="18:00:00", end_time="20:00:00" if i % 2 else None)
+        for event in events for i in range(OPTIONS)
+    ], batch_size=1000)
+    event_options = await EventOption.all()
+    await UserEventOptionResponse.bulk_create([
+        UserEventOptionResponse(event_option_id=event_option.id, user_and_group_id=user_and_group.id, group_id=group.id,
+                                response=random.choice(list(EventOptionResponseEnum)), reason="late" if user_and_group.id % 7 == 0 else None)
+        for event_option in event_options for user_and_group in user_and_groups
+    ], batch_size=1000)
+    return group
+
+
+async def main():
+    random.seed(0)
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    group = await seed()
+
+    prefetch_body = await measure("nested prefetch + to_dict()", prefetch_tree, group.id)
+    flat_body = await measure("Event.get_tree_for_group()", flat_tree, group.id)
+    assert prefetch_body == flat_body, "responses differ"
+
+    start = time.perf_counter()
+    page = await Event.get_tree_for_group(group.id, [EventStateEnum.VOTING, EventStateEnum.OPEN], date(2024, 6, 1), date(2024, 6, 30), None, 20)
+    print(f"{'filtered page of ' + str(len(page)):<40} {(time.perf_counter() - start) * 1e3:8.1f} ms/request")
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
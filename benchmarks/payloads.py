@@ -0,0 +1,66 @@
+# Payload size and encode time of representative group dumps, JSON (orjson) vs MessagePack.
+# Sizes are also given gzipped, as a proxy in front of the app may compress JSON anyway.
+# Run from the repository root: python -m benchmarks.payloads
+import asyncio
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from tortoise import Tortoise
+from benchmarks.event_tree import EVENTS, MEMBERS, OPTIONS, seed
+from app.db.models import Event, Group, Message, UserAndGroup
+from app.utils.serialization import dumps, packb, unpackb
+
+ROUNDS = 20
+MESSAGES = 50
+
+
+def timed(func, body):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encoded = func(body)
+    return encoded, (time.perf_counter() - start) / ROUNDS * 1e3
+
+
+def measure(name, body):
+    as_json, json_time = timed(dumps, body)
+    as_msgpack, msgpack_time = timed(packb, body)
+    # Same structure once decoded, dates and datetimes as the same strings.
+    assert unpackb(as_msgpack) == json.loads(as_json), f"{name}: payloads differ"
+    json_gzip, msgpack_gzip = (len(gzip.compress(encoded, 6)) for encoded in (as_json, as_msgpack))
+    print(
+        f"{name:<24} json {len(as_json) / 1e3:9.1f} kB ({json_gzip / 1e3:7.1f} kB gz) {json_time:7.2f} ms"
+        f"   msgpack {len(as_msgpack) / 1e3:9.1f} kB ({msgpack_gzip / 1e3:7.1f} kB gz) {msgpack_time:7.2f} ms"
+        f"   size {len(as_msgpack) / len(as_json):4.0%}"
+    )
+
+
+async def main():
+    random.seed(0)
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    group = await seed()
+    print(f"{EVENTS} events x {OPTIONS} options x {MEMBERS} responses, {MESSAGES} chat messages")
+
+    event = await Event.filter(group_id=group.id).first()
+    user_and_groups = await UserAndGroup.filter(group_id=group.id)
+    sent_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    await Message.bulk_create([
+        Message(content=f"message {i} " * 4, event_id=event.id, group_id=group.id,
+                user_and_group_id=user_and_groups[i % MEMBERS].id, sent_at=sent_at + timedelta(seconds=i))
+        for i in range(MESSAGES)
+    ])
+    await group.fetch_related("users")
+    messages = await Message.filter(event_id=event.id).order_by("-sent_at").prefetch_related("user_and_group").limit(MESSAGES)
+
+    measure("events tree", await Event.get_tree_for_group(group.id))
+    measure("events page of 20", await Event.get_tree_for_group(group.id, limit=20))
+    measure("group users", [user.to_dict() for user in group.users])
+    measure("chat history page", [message.to_dict() for message in messages])
+    measure("chat frame", messages[0].to_dict())
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
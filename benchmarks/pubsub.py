@@ -0,0 +1,123 @@
+# Chat messages published in one worker process and delivered to subscribers in WORKERS others
+# through the broker, next to LocalPubSub delivering within the process as with a single worker,
+# once as fast as the publisher can and once at a steady rate.
+# Run from the repository root: python -m benchmarks.pubsub
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from app.utils.pubsub import LocalPubSub, SocketPubSub, run_broker
+
+WORKERS = 4
+MESSAGES = 5000
+# Published as fast as possible in bursts of BURST, then paced at BURST every INTERVAL seconds.
+BURST = 10
+INTERVAL = 0.005
+
+
+def message(index):
+    # Shaped like Message.to_dict() with the sender's membership.
+    return [1, {
+        "id": index,
+        "content": "See you at eight, I'll bring the ball " * 2,
+        "sent_at": time.monotonic(),
+        "event_id": 1,
+        "user_and_group": {"id": 7, "user_id": 3, "group_id": 2},
+    }]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def receive(pubsub, latencies):
+    done = asyncio.Event()
+
+    def on_message(message):
+        # CLOCK_MONOTONIC is the same in every process on Linux.
+        latencies.append(time.monotonic() - message[1]["sent_at"])
+        if message[1]["id"] == MESSAGES - 1:
+            done.set()
+
+    pubsub.subscribe("chat", on_message)
+    return done
+
+
+def worker(path, ready, results):
+    async def main():
+        pubsub = SocketPubSub(path)
+        latencies = []
+        done = await receive(pubsub, latencies)
+        await pubsub.start()
+        ready.release()
+        await done.wait()
+        await pubsub.stop()
+        results.put(latencies)
+
+    asyncio.run(main())
+
+
+async def publish(pubsub, interval):
+    for index in range(MESSAGES):
+        pubsub.publish("chat", message(index))
+        if index % BURST == BURST - 1:
+            await asyncio.sleep(interval)
+
+
+def report(name, elapsed, latencies, receivers):
+    print(
+        f"{name:<38} {len(latencies) / elapsed:9.0f} deliveries/s   {len(latencies)}/{MESSAGES * receivers} delivered"
+        f"   latency p50 {statistics.median(latencies) * 1e3:7.2f} ms  p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms"
+    )
+
+
+async def local(interval):
+    pubsub = LocalPubSub()
+    latencies = []
+    await receive(pubsub, latencies)
+    start = time.perf_counter()
+    await publish(pubsub, interval)
+    return time.perf_counter() - start, latencies
+
+
+async def socket(interval):
+    with tempfile.TemporaryDirectory() as directory:
+        path = f"{directory}/pubsub.sock"
+        broker = multiprocessing.Process(target=run_broker, args=(path,))
+        broker.start()
+        ready = multiprocessing.Semaphore(0)
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(path, ready, results)) for _ in range(WORKERS)]
+        for process in workers:
+            process.start()
+        for _ in workers:
+            await asyncio.get_running_loop().run_in_executor(None, ready.acquire)
+
+        pubsub = SocketPubSub(path)
+        await pubsub.start()
+        start = time.perf_counter()
+        await publish(pubsub, interval)
+        latencies = []
+        for _ in workers:
+            latencies += await asyncio.get_running_loop().run_in_executor(None, results.get)
+        elapsed = time.perf_counter() - start
+        await pubsub.stop()
+        for process in workers:
+            process.join()
+        broker.terminate()
+        broker.join()
+        return elapsed, latencies
+
+
+async def main():
+    print(f"{MESSAGES} chat messages, {os.cpu_count()} CPU(s)")
+    for pace, interval in (("flood", 0), (f"{BURST / INTERVAL:.0f}/s", INTERVAL)):
+        report(f"LocalPubSub, same process, {pace}", *await local(interval), 1)
+        report(f"SocketPubSub, {WORKERS} workers, {pace}", *await socket(interval), WORKERS)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+# Middleware overhead of resolving path parameters, per request.
+# Run from the repository root: python -m benchmarks.route_params
+import asyncio
+import time
+from tortoise import Tortoise
+from app.db import models
+from app.db.models import Group, User, UserAndGroup
+from app.utils.tools import process_match
+
+ROUNDS = 2000
+
+
+async def legacy_process_match(match_data):
+    # The linear scan over models.__dict__ with sequential fetches this replaced.
+    processed_data = {}
+    for key, value in match_data.items():
+        if isinstance(value, int) and key.endswith("_id"):
+            variable = key[:-3]
+            model_class = None
+            for name, obj in models.__dict__.items():
+                if hasattr(obj, "__parse_name__") and getattr(obj, "__parse_name__") == variable:
+                    model_class = obj
+                    break
+            if model_class:
+                processed_data[variable] = await model_class.get_or_none(id=value)
+                continue
+        processed_data[key] = value
+    return processed_data
+
+
+async def measure(name, func, match_data):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await func(dict(match_data))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / ROUNDS * 1e6:8.1f} us/request")
+
+
+async def main():
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    user = await User.create(name="bench", password=User.hash_password("bench"))
+    group = await Group.create(name="bench")
+    await UserAndGroup.create(user=user, group=group)
+
+    match_data = {"group_id": group.id, "user_id": user.id}
+    await measure("legacy, /groups/<id>/users/<id>", legacy_process_match, match_data)
+    await measure("eager, /groups/<id>/users/<id>", process_match, match_data)
+    await measure("lazy (rejected before fetch)", lambda data: process_match(data, lazy=True), match_data)
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
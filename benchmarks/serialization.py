@@ -0,0 +1,105 @@
+# Encoding the GET /groups/<id>/events tree from prefetched models:
+# the hand-written to_dict() with strftime and ujson (what Sanic picks by default) vs the compiled serializers and orjson.
+# Run from the repository root: python -m benchmarks.serialization
+import asyncio
+import json
+import random
+import time
+import ujson
+from tortoise import Tortoise
+from benchmarks.event_tree import EVENTS, MEMBERS, OPTIONS, seed
+from app.db.models import Event
+from app.utils.serialization import dumps
+
+ROUNDS = 5
+
+
+# The to_dict() methods as they were before app/utils/serialization.py.
+def legacy_user_and_group(user_and_group):
+    return {"id":user_and_group.id, "user_id":user_and_group.user_id, "group_id":user_and_group.group_id}
+
+
+def legacy_response(response):
+    user_and_group_dict = None
+    if response.user_and_group:
+        user_and_group_dict = legacy_user_and_group(response.user_and_group)
+    return {"id":response.id, "response":response.response, "reason":response.reason, "event_option_id": response.event_option_id, "user_and_group_id":response.user_and_group_id, "user_and_group":user_and_group_dict}
+
+
+def legacy_event_option(event_option):
+    user_event_option_responses_dict = [legacy_response(response) for response in getattr(event_option, 'user_event_option_responses', [])] if event_option.user_event_option_responses._fetched else None
+    return {
+        "id": event_option.id,
+        "date": event_option.date.isoformat(),
+        "start_time": event_option.start_time.strftime("%H:%M:%S"),
+        "end_time": event_option.end_time.strftime("%H:%M:%S") if event_option.end_time else None,
+        "event_id": event_option.event_id,
+        "user_event_option_responses": user_event_option_responses_dict
+    }
+
+
+def legacy_event(event):
+    event_options_dict = [legacy_event_option(event_option) for event_option in getattr(event, 'event_options', [])] if event.event_options._fetched else None
+    return {
+        "id": event.id,
+        "title": event.title,
+        "color": event.color,
+        "vote_end_date": event.vote_end_date.strftime("%Y-%m-%d %H:%M:%S") if event.vote_end_date else None,
+        "created": event.created.strftime("%Y-%m-%d %H:%M:%S"),
+        "description": event.description,
+        "state": event.state,
+        "group_id": event.group_id,
+        "choosen_event_option_id": event.choosen_event_option_id,
+        "event_options": event_options_dict
+    }
+
+
+def measure(name, encoder):
+    timings = {"to_dict": 0.0, "encode": 0.0}
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        tree = encoder.to_dict()
+        timings["to_dict"] += time.perf_counter() - start
+        start = time.perf_counter()
+        body = encoder.encode(tree)
+        timings["encode"] += time.perf_counter() - start
+    to_dict, encode = (timings[key] / ROUNDS * 1e3 for key in ("to_dict", "encode"))
+    print(f"{name:<34} to_dict {to_dict:7.1f} ms   encode {encode:6.1f} ms   total {to_dict + encode:7.1f} ms   {len(body) / 1e6:.1f} MB")
+    return body
+
+
+class Legacy:
+    def __init__(self, events):
+        self.events = events
+
+    def to_dict(self):
+        return [legacy_event(event) for event in self.events]
+
+    def encode(self, tree):
+        return ujson.dumps(tree).encode()
+
+
+class Compiled(Legacy):
+    def to_dict(self):
+        return [event.to_dict() for event in self.events]
+
+    def encode(self, tree):
+        return dumps(tree)
+
+
+async def main():
+    random.seed(0)
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    group = await seed()
+    events = await Event.filter(group_id=group.id).order_by("id").prefetch_related("event_options__user_event_option_responses__user_and_group")
+    print(f"{EVENTS} events x {OPTIONS} options x {MEMBERS} responses")
+
+    before = measure("to_dict() + ujson", Legacy(events))
+    after = measure("compiled serializers + orjson", Compiled(events))
+    assert json.loads(before) == json.loads(after), "responses differ"
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
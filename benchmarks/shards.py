@@ -0,0 +1,89 @@
+# Write latency of a quiet group while another group floods its chat, one database vs a shard per group.
+# Run from the repository root: python -m benchmarks.shards
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.db.models import Event, Group, Message, User, UserAndGroup
+from app.db.shards import in_shard, shard_router
+from app.utils import settings
+
+BUSY_WRITERS = 50
+QUIET_WRITES = 200
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def send(event, user_and_group):
+    async with in_transaction():
+        await Message.create(content="hello", event_id=event.id, user_and_group_id=user_and_group.id, group_id=event.group_id)
+
+
+async def run(sharded):
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(config={
+            "connections": {"default": {"engine": "app.db.sqlite", "credentials": {
+                "file_path": os.path.join(directory, "sqlite.db"), "readers": settings.SQLITE_READERS, **settings.SQLITE_PRAGMAS,
+            }}},
+            "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+        })
+        await Tortoise.generate_schemas()
+        settings.SHARDING_ENABLED = sharded
+        shard_router.directory = os.path.join(directory, "groups")
+        shard_router.start(Tortoise.get_connection("default"))
+
+        groups = [await Group.create(name=name) for name in ("busy", "quiet")]
+        user = await User.create(name="bench", password="x")
+        members = [await UserAndGroup.create(user_id=user.id, group_id=group.id) for group in groups]
+
+        async def in_group(group, func):
+            return await in_shard(group.id, func) if sharded else await func()
+
+        events = [await in_group(group, lambda group=group: Event.create(group_id=group.id, title="bench", color="ff0000")) for group in groups]
+
+        done = False
+        busy_writes = 0
+
+        async def busy():
+            nonlocal busy_writes
+            while not done:
+                await in_group(groups[0], lambda: send(events[0], members[0]))
+                busy_writes += 1
+
+        writers = [asyncio.ensure_future(busy()) for _ in range(BUSY_WRITERS)]
+        await asyncio.sleep(0.2)
+        busy_writes = 0
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(QUIET_WRITES):
+            write_start = time.perf_counter()
+            await in_group(groups[1], lambda: send(events[1], members[1]))
+            latencies.append(time.perf_counter() - write_start)
+        elapsed = time.perf_counter() - start
+        done = True
+        await asyncio.gather(*writers)
+
+        assert await in_group(groups[1], lambda: Message.filter(group_id=groups[1].id).count()) == QUIET_WRITES
+        await shard_router.close()
+        await Tortoise.close_connections()
+        settings.SHARDING_ENABLED = False
+
+    latencies.sort()
+    print(
+        f"{'shard per group' if sharded else 'one database':<16} quiet group p50 {statistics.median(latencies) * 1e3:7.1f} ms"
+        f"   p99 {percentile(latencies, 0.99) * 1e3:7.1f} ms   busy group writes/s {busy_writes / elapsed:6.0f}"
+    )
+
+
+async def main():
+    await run(False)
+    await run(True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
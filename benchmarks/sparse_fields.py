@@ -0,0 +1,70 @@
+# The largest list endpoints with and without ?fields=, queries + serialization + encoding.
+# Run from the repository root: python -m benchmarks.sparse_fields
+import asyncio
+import random
+import time
+from tortoise import Tortoise
+from benchmarks.event_tree import EVENTS, MEMBERS, OPTIONS, seed
+from app.db.models import Event, User, UserAndGroup, UserVoteOptionResponse, Vote, VoteOption
+from app.utils.serialization import dumps, parse_fields, prefetch_paths, serialize
+
+ROUNDS = 3
+VOTES = 200
+VOTE_OPTIONS = 4
+USERS = 2000
+
+
+async def events(group_id, selection):
+    return await Event.get_tree_for_group(group_id, selection=selection)
+
+
+async def votes(group_id, selection):
+    votes = await Vote.filter(group_id=group_id).prefetch_related(
+        *prefetch_paths(selection, {"vote_options": {"user_vote_option_responses": {"user_and_group": {}}}})
+    )
+    return serialize(votes, selection)
+
+
+async def users(group_id, selection):
+    return serialize(await User.all(), selection)
+
+
+async def measure(name, func, group_id, fields=None):
+    selection = parse_fields(fields)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        body = dumps(await func(group_id, selection))
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{name:<16} {('?fields=' + fields) if fields else 'all fields':<36} {elapsed * 1e3:8.1f} ms/request   {len(body) / 1e3:9.1f} kB")
+
+
+async def main():
+    random.seed(0)
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+    await Tortoise.generate_schemas()
+    group = await seed()
+    await User.bulk_create([User(name=f"user {i}", password="x") for i in range(MEMBERS, USERS)])
+    user_and_groups = await UserAndGroup.filter(group_id=group.id)
+    await Vote.bulk_create([Vote(group_id=group.id, title=f"vote {i}", multi_select=bool(i % 2)) for i in range(VOTES)])
+    await VoteOption.bulk_create([
+        VoteOption(vote_id=vote.id, group_id=group.id, title=f"option {i}") for vote in await Vote.all() for i in range(VOTE_OPTIONS)
+    ], batch_size=1000)
+    await UserVoteOptionResponse.bulk_create([
+        UserVoteOptionResponse(vote_option_id=vote_option.id, user_and_group_id=user_and_group.id, group_id=group.id)
+        for vote_option in await VoteOption.all() for user_and_group in user_and_groups if random.random() < 0.5
+    ], batch_size=1000)
+    print(f"{EVENTS} events x {OPTIONS} options x {MEMBERS} responses, {VOTES} votes x {VOTE_OPTIONS} options, {USERS} users")
+
+    await measure("group events", events, group.id)
+    await measure("group events", events, group.id, "id,title")
+    await measure("group events", events, group.id, "id,title,event_options.date")
+    await measure("group votes", votes, group.id)
+    await measure("group votes", votes, group.id, "id,title")
+    await measure("group votes", votes, group.id, "id,title,vote_options.title")
+    await measure("users", users, group.id)
+    await measure("users", users, group.id, "id,name")
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+# Read latency under concurrent @atomic() write traffic, default SQLite client vs the tuned profile.
+# Run from the repository root: python -m benchmarks.sqlite_load
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.db.models import Event, Group, Message, User, UserAndGroup
+from app.utils import settings
+
+DURATION = 5
+WRITERS = 4
+READERS = 16
+# Reads per second per reader, fixed so both runs see the same offered load.
+READ_RATE = 15
+# Time a handler spends inside its transaction besides the inserts themselves.
+WORK_IN_TRANSACTION = 0.002
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def writer(event, user_and_group, stop, counter):
+    while not stop.is_set():
+        async with in_transaction():
+            for _ in range(5):
+                await Message.create(content="load", event_id=event.id, group_id=event.group_id, user_and_group_id=user_and_group.id)
+            await asyncio.sleep(WORK_IN_TRANSACTION)
+        counter[0] += 1
+
+
+async def reader(group, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await Event.filter(group_id=group.id).limit(20)
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        await asyncio.sleep(max(1 / READ_RATE - elapsed, 0))
+
+
+async def run(name, connection):
+    with tempfile.TemporaryDirectory() as directory:
+        connection["credentials"]["file_path"] = os.path.join(directory, "load.db")
+        await Tortoise.init(config={
+            "connections": {"default": connection},
+            "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+        })
+        await Tortoise.generate_schemas()
+        user = await User.create(name="load", password="x")
+        group = await Group.create(name="load")
+        user_and_group = await UserAndGroup.create(user=user, group=group)
+        await Event.bulk_create([Event(group_id=group.id, title=f"event {i}", color="ff0000") for i in range(200)])
+        event = await Event.first()
+
+        stop = asyncio.Event()
+        latencies, commits = [], [0]
+        tasks = [asyncio.create_task(writer(event, user_and_group, stop, commits)) for _ in range(WRITERS)]
+        tasks += [asyncio.create_task(reader(group, stop, latencies)) for _ in range(READERS)]
+        await asyncio.sleep(DURATION)
+        stop.set()
+        await asyncio.gather(*tasks)
+        await Tortoise.close_connections()
+
+    latencies.sort()
+    print(
+        f"{name:<10} reads/s {len(latencies) / DURATION:8.0f}   p50 {statistics.median(latencies) * 1e3:6.2f} ms"
+        f"   p95 {percentile(latencies, 0.95) * 1e3:6.2f} ms   p99 {percentile(latencies, 0.99) * 1e3:6.2f} ms"
+        f"   write transactions/s {commits[0] / DURATION:6.0f}"
+    )
+
+
+async def main():
+    await run("default", {"engine": "tortoise.backends.sqlite", "credentials": {}})
+    await run("profile", {"engine": "app.db.sqlite", "credentials": {"readers": settings.SQLITE_READERS, **settings.SQLITE_PRAGMAS}})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+# A burst of vote toggles, one transaction per write vs the group-committing write queue.
+# Run from the repository root: python -m benchmarks.write_queue
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.db.models import Group, User, UserAndGroup, UserVoteOptionResponse, Vote, VoteOption
+from app.db.write_queue import WriteQueue
+from app.utils import settings
+
+MEMBERS = 200
+OPTIONS = 4
+ROUNDS = 5
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def toggle(vote_option_id, user_and_group_id, group_id):
+    response = await UserVoteOptionResponse.get_or_none(vote_option_id=vote_option_id, user_and_group_id=user_and_group_id)
+    if response:
+        await response.delete()
+        return None
+    return await UserVoteOptionResponse.create(vote_option_id=vote_option_id, user_and_group_id=user_and_group_id, group_id=group_id)
+
+
+async def direct(func):
+    async with in_transaction():
+        return await func()
+
+
+async def burst(submit, options, user_and_groups, latencies):
+    async def one(option, user_and_group):
+        start = time.perf_counter()
+        await submit(lambda: toggle(option.id, user_and_group.id, option.group_id))
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(option, user_and_group) for user_and_group in user_and_groups for option in options))
+
+
+async def run(name, use_queue, synchronous):
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(config={
+            "connections": {"default": {"engine": "app.db.sqlite", "credentials": {
+                "file_path": os.path.join(directory, "write.db"), "readers": settings.SQLITE_READERS, **settings.SQLITE_PRAGMAS, "synchronous": synchronous,
+            }}},
+            "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+        })
+        await Tortoise.generate_schemas()
+        group = await Group.create(name="bench")
+        await User.bulk_create([User(name=f"user {i}", password="x") for i in range(MEMBERS)])
+        await UserAndGroup.bulk_create([UserAndGroup(user_id=user.id, group_id=group.id) for user in await User.all()])
+        user_and_groups = await UserAndGroup.all()
+        vote = await Vote.create(group_id=group.id, title="bench", multi_select=True)
+        await VoteOption.bulk_create([VoteOption(vote_id=vote.id, group_id=group.id, title=f"option {i}") for i in range(OPTIONS)])
+        options = await VoteOption.all()
+
+        write_queue = WriteQueue()
+        await write_queue.start()
+        submit = write_queue.submit if use_queue else direct
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            await burst(submit, options, user_and_groups, latencies)
+        elapsed = time.perf_counter() - start
+        await write_queue.stop()
+
+        # Every member toggled every option an odd number of times.
+        assert await UserVoteOptionResponse.all().count() == MEMBERS * OPTIONS
+        await Tortoise.close_connections()
+
+    latencies.sort()
+    print(
+        f"{name:<12} synchronous={synchronous:<7} writes/s {len(latencies) / elapsed:7.0f}   p50 {statistics.median(latencies) * 1e3:7.1f} ms"
+        f"   p99 {percentile(latencies, 0.99) * 1e3:7.1f} ms"
+    )
+    if use_queue:
+        print(f"{'':<12} {write_queue.stats()}")
+
+
+async def main():
+    # With WAL, NORMAL doesn't sync on commit, FULL syncs the WAL on every commit.
+    for synchronous in ("NORMAL", "FULL"):
+        await run("direct", False, synchronous)
+        await run("write queue", True, synchronous)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -203,11 +203,13 @@ class Event {
         }
     }
 
-    async get_messages_for_event(limit:number = 20, timestamp?:string): Promise<Message[]> {
+    // One page of the chat history, newest first. before is the cursor of the next, older page,
+    // null once the oldest message has been fetched.
+    async get_messages_for_event(limit:number = 20, before?:string): Promise<{messages: Message[], before: string|null}> {
         try {
             let url = `/api/events/${this.id}/messages?limit=${limit}`;
-            if (timestamp) {
-                url += `&timestamp=${timestamp}`;
+            if (before) {
+                url += `&before=${before}`;
             }
 
             const response = await fetch(url, {
@@ -219,17 +221,20 @@ class Event {
             });
             if (response.ok) {
                 const messagesData = await response.json();
-                return messagesData.map((messageData: any) => Message.fromJson(messageData));
+                return {
+                    messages: messagesData.map((messageData: any) => Message.fromJson(messageData)),
+                    before: response.headers.get('X-Next-Before'),
+                };
             } else if (response.status === 401) {
                 console.log("User is unauthorized. Logging out...");
                 window.location.href = "/login";
-                return [];
+                return {messages: [], before: null};
             } else {
-                return [];
+                return {messages: [], before: null};
             }
         } catch (error) {
             console.error('Error fetching event options for event:', error);
-            return [];
+            return {messages: [], before: null};
         }
     }
     
@@ -5,18 +5,21 @@ class User {
     name: string;
     owner: boolean;
     has_avatar: boolean;
+    avatar_version: string | null;
     avatar: string;
 
-    constructor(id: number, name: string, owner: boolean, has_avatar: boolean) {
+    constructor(id: number, name: string, owner: boolean, has_avatar: boolean, avatar_version: string | null = null) {
         this.id = id;
         this.name = name;
         this.owner = owner;
         this.has_avatar = has_avatar;
-        this.avatar = `/api/users/${id}/avatar`;
+        this.avatar_version = avatar_version;
+        // Versioned URLs are cached by the browser until the avatar changes.
+        this.avatar = avatar_version ? `/api/users/${id}/avatar/${avatar_version}` : `/api/users/${id}/avatar`;
     }
 
     static fromJson(json: any): User {
-        return new User(json.id, json.name, json.owner, json.has_avatar);
+        return new User(json.id, json.name, json.owner, json.has_avatar, json.avatar_version);
     }
 
     static async get_user(id: number): Promise<User | null> {
@@ -31,19 +31,22 @@ const EventChatModal: React.FC<EventModalProps> = ({ me, mePermissions, visible,
     const [chatEnd, setChatEnd] = useState<boolean>(false);
     const fetchingMessagesRef = useRef<boolean>(false);
 
-    const fetchMessages = async (timestamp?: string) => {
+    const beforeCursorRef = useRef<string | undefined>(undefined);
+
+    const fetchMessages = async (before?: string) => {
         if(!chatEnd){
             fetchingMessagesRef.current = true;
-            const messagesList = await event.get_messages_for_event(20, timestamp);
+            const page = await event.get_messages_for_event(20, before);
             setMessages((prevMessages) => {
-            // Check if the first message in messagesList is already in prevMessages
-            if (messagesList.length > 0 && prevMessages.some(msg => msg.id === messagesList[0].id)) {
+            // Check if the first message in the page is already in prevMessages
+            if (page.messages.length > 0 && prevMessages.some(msg => msg.id === page.messages[0].id)) {
                 return prevMessages;
             } else {
-                return [...prevMessages, ...messagesList];
+                return [...prevMessages, ...page.messages];
             }
         });
-            if(messagesList.length !== 20){
+            beforeCursorRef.current = page.before ?? undefined;
+            if(page.before === null){
                 setChatEnd(true);
             }
             fetchingMessagesRef.current = false;
@@ -57,9 +60,8 @@ const EventChatModal: React.FC<EventModalProps> = ({ me, mePermissions, visible,
             if (container.scrollTop * -1 + container.clientHeight >= container.scrollHeight * 0.95) {
                 // Fetch more messages if not already fetching
                 if (!fetchingMessagesRef.current) {
-                    // Calculate the timestamp for the last message in the current list
-                    const lastMessageTimestamp = messages.length > 0 ? messages[messages.length - 1].sent_at : undefined;
-                    fetchMessages(lastMessageTimestamp).catch((error) => {
+                    // Continue before the oldest message fetched so far
+                    fetchMessages(beforeCursorRef.current).catch((error) => {
                         console.error("Error fetching messages:", error);
                     });
                 }
@@ -84,6 +86,7 @@ const EventChatModal: React.FC<EventModalProps> = ({ me, mePermissions, visible,
     useEffect(() => {
         setMessages([])
         setChatEnd(false)
+        beforeCursorRef.current = undefined
 
         if (visible) {
             // Connect to WebSocket when modal is visible
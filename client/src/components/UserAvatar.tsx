@@ -22,7 +22,7 @@ const UserAvatar: React.FC<UserAvatarProps> = ({ user, size=30 }) => {
     return (
         <>
             {user.avatar && !avatarError && user.has_avatar ? (
-                <Avatar src={`${window.location.origin}${user.avatar}`} alt="Avatar" onError={handleAvatarError} size={size}/>
+                <Avatar src={`${window.location.origin}${user.avatar}?size=${Math.ceil(size * (window.devicePixelRatio || 1))}`} alt="Avatar" onError={handleAvatarError} size={size}/>
             ) : (
                 <Avatar style={{ backgroundColor: getColorFromId(user.id), fontSize, color:"#000"}} size={size}>
                     {user.name.charAt(0).toUpperCase()}
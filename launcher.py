@@ -1,10 +1,13 @@
+import os
 from app.backend import app
-
+from app.utils import settings
 
 
 if __name__ == "__main__":
+    workers = int(os.getenv("workers", settings.WORKERS))
     app.run(
-        single_process=True,
+        workers=workers,
+        single_process=workers == 1,
         access_log=False,
         )
     # app.run(
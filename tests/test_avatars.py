@@ -0,0 +1,30 @@
+import asyncio
+import threading
+from app.utils.avatars import AvatarCache, avatar_path
+
+
+def test_misses_are_read_off_the_event_loop(tmp_path, monkeypatch):
+    path = avatar_path(str(tmp_path), 64)
+    with open(path, "wb") as avatar:
+        avatar.write(b"webp")
+    reading_threads = []
+    real_open = open
+
+    def recording_open(file, *args, **kwargs):
+        if file == path:
+            reading_threads.append(threading.get_ident())
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", recording_open)
+
+    async def check():
+        cache = AvatarCache()
+        assert await cache.get(str(tmp_path), "v1", 64) == b"webp"
+        assert await cache.get(str(tmp_path), "v1", 64) == b"webp"
+        assert await cache.get(str(tmp_path / "missing"), "v1", 64) is None
+        assert (cache.hits, cache.misses, cache.size) == (1, 2, 4)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(check())
+    assert len(reading_threads) == 1
+    assert reading_threads[0] != loop_thread
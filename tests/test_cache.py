@@ -0,0 +1,55 @@
+import asyncio
+from functools import partial
+import pytest
+from tortoise import Tortoise
+from app.db.models import User
+from app.db.transactions import after_commit, deferred_after_commit
+from app.utils.cache import PrincipalCache
+
+
+@pytest.fixture
+def run(tmp_path):
+    config = {
+        "connections": {"default": f"sqlite://{tmp_path / 'cache.db'}"},
+        "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+    }
+    loop = asyncio.new_event_loop()
+
+    async def setup():
+        await Tortoise.init(config=config)
+        await Tortoise.generate_schemas()
+
+    try:
+        loop.run_until_complete(setup())
+        yield loop.run_until_complete
+    finally:
+        loop.run_until_complete(Tortoise.close_connections())
+        loop.close()
+
+
+def test_every_request_gets_its_own_user(run):
+    async def check():
+        user = await User.create(name="alice", password="x")
+        cache = PrincipalCache()
+        first = await cache.get_user(user.id)
+        # A handler changing the user and failing to save it.
+        first.name = "bob"
+        second = await cache.get_user(user.id)
+        assert second is not first
+        assert second.name == "alice"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    run(check())
+
+
+def test_invalidate_after_commit(run):
+    async def check():
+        user = await User.create(name="alice", password="x")
+        cache = PrincipalCache()
+        await cache.get_user(user.id)
+        with deferred_after_commit():
+            after_commit(partial(cache.invalidate, user.id))
+            assert cache.stats()["size"] == 1
+        assert cache.stats()["size"] == 0
+
+    run(check())
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from tortoise import Tortoise
+from app.db.models import User
+from app.utils.dataloader import PrimaryKeyLoader
+
+
+@pytest.fixture
+def run(tmp_path):
+    config = {
+        "connections": {"default": f"sqlite://{tmp_path / 'loader.db'}"},
+        "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+    }
+    loop = asyncio.new_event_loop()
+
+    async def setup():
+        await Tortoise.init(config=config)
+        await Tortoise.generate_schemas()
+
+    try:
+        loop.run_until_complete(setup())
+        yield loop.run_until_complete
+    finally:
+        loop.run_until_complete(Tortoise.close_connections())
+        loop.close()
+
+
+def test_concurrent_callers_get_their_own_instance(run):
+    async def check():
+        user = await User.create(name="alice", password="x")
+        loader = PrimaryKeyLoader(User)
+        changed = asyncio.Event()
+
+        async def renaming_request():
+            mine = await loader.load(user.id)
+            mine.name = "bob"
+            changed.set()
+            await mine.save()
+            return mine
+
+        async def reading_request():
+            mine = await loader.load(user.id)
+            await changed.wait()
+            return mine
+
+        renamed, read = await asyncio.gather(renaming_request(), reading_request())
+        # Both lookups went into one query, but the rename stays with the request that made it.
+        assert (loader.batches, loader.keys) == (1, 1)
+        assert renamed is not read
+        assert (renamed.name, read.name) == ("bob", "alice")
+        assert (await loader.load(user.id)).name == "bob"
+
+    run(check())
+
+
+def test_missing_row(run):
+    async def check():
+        assert await PrimaryKeyLoader(User).load(1) is None
+
+    run(check())
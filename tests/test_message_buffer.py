@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import pytest
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from app.db.message_buffer import MessageBuffer
+from app.db.models import Event, Group, Message, User, UserAndGroup
+
+
+@pytest.fixture
+def run(tmp_path):
+    config = {
+        "connections": {"default": f"sqlite://{tmp_path / 'messages.db'}"},
+        "apps": {"models": {"models": ["app.db.models"], "default_connection": "default"}},
+    }
+    loop = asyncio.new_event_loop()
+
+    async def setup():
+        await Tortoise.init(config=config)
+        await Tortoise.generate_schemas()
+
+    try:
+        loop.run_until_complete(setup())
+        yield loop.run_until_complete
+    finally:
+        loop.run_until_complete(Tortoise.close_connections())
+        loop.close()
+
+
+@pytest.fixture
+def outage(monkeypatch):
+    # Every insert fails while it is set.
+    state = {"down": True}
+    bulk_create = Message.bulk_create
+
+    async def failing_bulk_create(*args, **kwargs):
+        if state["down"]:
+            raise OperationalError("database is locked")
+        return await bulk_create(*args, **kwargs)
+
+    monkeypatch.setattr(Message, "bulk_create", failing_bulk_create)
+    return state
+
+
+async def chat():
+    group = await Group.create(name="group")
+    user = await User.create(name="alice", password="x")
+    user_and_group = await UserAndGroup.create(user=user, group=group)
+    event = await Event.create(group=group, title="event", color="ff0000")
+    return event, user_and_group
+
+
+def test_failed_messages_are_written_later(run, outage):
+    async def check():
+        event, user_and_group = await chat()
+        buffer = MessageBuffer(interval=0.01, write_attempts=5)
+        await buffer.start()
+        message = await buffer.add(event, user_and_group, "hello")
+        while not buffer.retried:
+            await asyncio.sleep(0.01)
+        assert await Message.filter(id=message.id).count() == 0
+        outage["down"] = False
+        await buffer.stop()
+        assert await Message.filter(event_id=event.id).values_list("content", flat=True) == ["hello"]
+        assert buffer.stats()["failed"] == 0
+
+    run(check())
+
+
+def test_lost_messages_are_logged_with_their_content(run, outage, caplog):
+    async def check():
+        event, user_and_group = await chat()
+        buffer = MessageBuffer(interval=0.01, write_attempts=3)
+        await buffer.start()
+        message = await buffer.add(event, user_and_group, "hello")
+        await buffer.stop()
+        assert (buffer.retried, buffer.failed, buffer.size) == (2, 1, 0)
+        lost = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Lost chat message")]
+        assert len(lost) == 1
+        assert lost[0].startswith(f"Lost chat message {message.id} of event {event.id}")
+        assert lost[0].endswith(": 'hello'")
+
+    with caplog.at_level(logging.ERROR):
+        run(check())
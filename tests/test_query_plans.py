@@ -0,0 +1,91 @@
+# Query-plan regression tests for the hot queries: the hand-written SQL behind /users/me and
+# the chat history pages. The schema is built by running the SQLite migrations, then
+# EXPLAIN QUERY PLAN must not report a full table scan and must use the index each query relies on.
+import asyncio
+from datetime import datetime
+import pytest
+from aerich import Command
+from tortoise import Tortoise, connections
+from app.db.models import Message
+from app.routes.me import incomplete_events_query, incomplete_votes_query, other_events_query, other_votes_query
+
+USER_ID = 1
+GROUP_ID = 1
+EVENT_ID = 1
+POSITION = (datetime(2026, 10, 18, 12), 1000)
+
+EVENTS_BY_GROUP = "idx_events_group_i_f85260"
+EVENT_OPTIONS_BY_EVENT = "idx_event_optio_event_i_2e874b"
+VOTES_BY_GROUP = "idx_votes_group_i_fc7a71"
+VOTE_OPTIONS_BY_VOTE = "idx_vote_option_vote_id_2efdc9"
+MESSAGES_BY_EVENT = "idx_messages_event_i_2d9f5b"
+
+# Name: (query, indexes it has to use). The ORM queries can only be built once Tortoise is initialized.
+HOT_QUERIES = {
+    "get_me_events incomplete": (lambda: incomplete_events_query(USER_ID), [EVENTS_BY_GROUP, EVENT_OPTIONS_BY_EVENT]),
+    "get_me_events other": (lambda: other_events_query(USER_ID), [EVENTS_BY_GROUP]),
+    "get_me_group_events incomplete": (lambda: incomplete_events_query(USER_ID, GROUP_ID), [EVENTS_BY_GROUP, EVENT_OPTIONS_BY_EVENT]),
+    "get_me_group_events other": (lambda: other_events_query(USER_ID, GROUP_ID), [EVENTS_BY_GROUP]),
+    "get_me_votes incomplete": (lambda: incomplete_votes_query(USER_ID), [VOTES_BY_GROUP, VOTE_OPTIONS_BY_VOTE]),
+    "get_me_votes other": (lambda: other_votes_query(USER_ID), [VOTES_BY_GROUP, VOTE_OPTIONS_BY_VOTE]),
+    "get_me_group_votes incomplete": (lambda: incomplete_votes_query(USER_ID, GROUP_ID), [VOTES_BY_GROUP, VOTE_OPTIONS_BY_VOTE]),
+    "get_me_group_votes other": (lambda: other_votes_query(USER_ID, GROUP_ID), [VOTES_BY_GROUP, VOTE_OPTIONS_BY_VOTE]),
+    "get_event_messages": (lambda: Message.page_query(EVENT_ID, 30).sql(), [MESSAGES_BY_EVENT]),
+    "get_event_messages before": (lambda: Message.page_query(EVENT_ID, 30, before=POSITION).sql(), [MESSAGES_BY_EVENT]),
+    "get_event_messages after": (lambda: Message.page_query(EVENT_ID, 30, after=POSITION).sql(), [MESSAGES_BY_EVENT]),
+}
+
+
+def full_scans(plan):
+    # "SCAN t" is a full table scan and an AUTOMATIC index is built by scanning the table,
+    # "SCAN t USING [COVERING] INDEX" walks an index and "SCAN CONSTANT ROW" reads nothing.
+    return [
+        detail for detail in plan
+        if (detail.startswith("SCAN ") and " USING " not in detail and detail != "SCAN CONSTANT ROW") or "AUTOMATIC" in detail
+    ]
+
+
+@pytest.fixture(scope="module")
+def explain(tmp_path_factory):
+    config = {
+        "connections": {"default": f"sqlite://{tmp_path_factory.mktemp('plans') / 'plans.db'}"},
+        "apps": {"models": {"models": ["app.db.models", "aerich.models"], "default_connection": "default"}},
+    }
+    loop = asyncio.new_event_loop()
+
+    async def migrate():
+        command = Command(tortoise_config=config, app="models", location="./app/db/migrations")
+        await command.init()
+        await command.upgrade()
+
+    async def plan(query):
+        _, rows = await connections.get("default").execute_query(f"EXPLAIN QUERY PLAN {query}")
+        return [row[3] for row in rows]
+
+    loop.run_until_complete(migrate())
+    yield lambda query: loop.run_until_complete(plan(query))
+    loop.run_until_complete(Tortoise.close_connections())
+    loop.close()
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_no_full_scan(explain, name):
+    query, _ = HOT_QUERIES[name]
+    plan = explain(query())
+    assert not full_scans(plan), "\n".join(plan)
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_uses_index(explain, name):
+    query, indexes = HOT_QUERIES[name]
+    plan = explain(query())
+    for index in indexes:
+        assert any(f" INDEX {index} " in detail for detail in plan), f"{index} not used:\n" + "\n".join(plan)
+
+
+@pytest.mark.parametrize("name", [name for name in HOT_QUERIES if name.startswith("get_event_messages")])
+def test_history_pages_read_in_index_order(explain, name):
+    # (event_id, sent_at, id) hands out the page in order, a sort would read every message of the event first.
+    query, _ = HOT_QUERIES[name]
+    plan = explain(query())
+    assert not any("TEMP B-TREE" in detail for detail in plan), "\n".join(plan)
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from app.db.transactions import deferred_after_commit
+from app.utils.pubsub import in_first_worker
+from app.utils.scheduler import EventStateScheduler
+
+
+@pytest.mark.parametrize("name, first", [
+    (None, True),
+    ("Sanic-Server-0-0", True),
+    ("Sanic-Server-1-0", False),
+    ("Sanic-Server-10-0", False),
+    ("Sanic-PubSubBroker-0", False),
+])
+def test_runs_in_first_worker_only(monkeypatch, name, first):
+    if name is None:
+        monkeypatch.delenv("SANIC_WORKER_NAME", raising=False)
+    else:
+        monkeypatch.setenv("SANIC_WORKER_NAME", name)
+    assert in_first_worker() is first
+
+
+def test_reschedule_is_published_after_commit():
+    scheduler = EventStateScheduler()
+    published = []
+    scheduler.publish = published.append
+    with deferred_after_commit():
+        scheduler.reschedule(1)
+        assert published == []
+    assert published == [1]
+    scheduler.reschedule(2)
+    assert published == [1, 2]
+
+
+@pytest.mark.parametrize("ticks", range(3))
+def test_stop_while_woken_up(ticks):
+    # The deadline is far off and nothing is dirty, so the loop waits with a timeout and never
+    # touches the database. The wakeup and stop()'s cancel come in the same few loop iterations.
+    async def check():
+        scheduler = EventStateScheduler()
+        scheduler._push(1, datetime.utcnow() + timedelta(hours=1))
+        scheduler._task = asyncio.create_task(scheduler._run())
+        await asyncio.sleep(0)
+        scheduler._wakeup.set()
+        for _ in range(ticks):
+            await asyncio.sleep(0)
+        stopping = asyncio.ensure_future(scheduler.stop())
+        done, _ = await asyncio.wait([stopping], timeout=1)
+        assert stopping in done
+
+    asyncio.run(check())